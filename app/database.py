@@ -1,13 +1,22 @@
-from typing import Generator
+from typing import Generator, Optional
 from sqlmodel import create_engine, Session
+from sqlalchemy import event
 from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from os import remove, getenv
 from app.models import *
+from app.utilities.lifecycle import add_event_statuses
+from app.utilities.search import create_search_index
+from app.utilities.tenancy import backfill_tenants
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MODE = getenv("MODE", "DEVELOPMENT")
+# Serverless deployments set FAST_START=1 and create the schema in a separate
+# step with `python -m app.database` instead of on every cold start
+FAST_START = getenv("FAST_START", "0") == "1"
 
 if MODE == "TEST":
     sqlite_file_name = "database.db"
@@ -30,9 +39,62 @@ elif MODE == "PRODUCTION":
     DATA_BASE_URL: str = getenv("POSTGRES_URL")
 engine = create_engine(DATA_BASE_URL, echo=False)
 
+# Optional read replica, e.g. REPLICA_URL=sqlite:///replica.db in TEST mode
+REPLICA_URL = getenv("REPLICA_URL")
+READ_YOUR_WRITES_SECONDS = int(getenv("READ_YOUR_WRITES_SECONDS", "5"))
+replica_engine = create_engine(REPLICA_URL, echo=False) if REPLICA_URL else None
+
+
+@dataclass
+class RequestRouting:
+    replica: bool
+    wrote: bool = False
+
+
+_request_routing: ContextVar[Optional[RequestRouting]] = ContextVar(
+    "request_routing", default=None
+)
+
+
+@contextmanager
+def route_request(replica: bool) -> Generator[RequestRouting, None, None]:
+    routing = RequestRouting(replica=replica and replica_engine is not None)
+    token = _request_routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _request_routing.reset(token)
+
+
+class RoutingSession(Session):
+    # Reads of read-only requests go to the replica; flushes, and everything
+    # after the first flush of a session, go to the primary.
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        routing = _request_routing.get()
+        if (
+            routing is not None
+            and routing.replica
+            and not self._flushing
+            and not self.info.get("primary")
+        ):
+            return replica_engine
+        return engine
+
+
+def use_primary(db: Session):
+    db.info["primary"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def after_flush(session, flush_context):
+    use_primary(session)
+    routing = _request_routing.get()
+    if routing is not None:
+        routing.wrote = True
+
 
 def get_db_session():
-    db = Session(engine)
+    db = RoutingSession(engine)
     try:
         yield db
     finally:
@@ -41,7 +103,7 @@ def get_db_session():
 
 @contextmanager
 def get_db() -> Generator[Session, None, None]:
-    db = Session(engine)
+    db = RoutingSession(engine)
     try:
         yield db
     finally:
@@ -50,48 +112,13 @@ def get_db() -> Generator[Session, None, None]:
 
 def init_db():
     SQLModel.metadata.create_all(bind=engine)
-    return
-    with get_db() as db:
-        user1 = User(name="user1", email="email1@gmail.com", image_url="url1")
-        user2 = User(name="user2", email="email2@gmail.com", image_url="url2")
-        user3 = User(
-            name="emad", email="emadanwer.official@gmail.com", image_url="url3"
-        )
-        user4 = User(name="user4", email="email4@gmail.com", image_url="url4")
-        user_5 = User(name="user5", email="0mda.7f@gmail.com", image_url="url5")
-        db.add_all([user1, user2, user3, user4, user_5])
-        db.commit()
-
-        org1 = Organization(
-            id="9a0e4beb-0233-48cb-a3e5-b39852c3abf5", name="org1", owner=user3.id
-        )
-        org2 = Organization(name="org2", owner=user2.id)
-        org3 = Organization(name="org3", owner=user4.id)
-        db.add_all([org1, org2, org3])
-        db.commit()
-
-        user_org1 = UserOrganizationRole(
-            user_id=user1.id, organization_id=org1.id, user_role=UserRole.creator
-        )
-        user_org2 = UserOrganizationRole(
-            user_id=user2.id, organization_id=org2.id, user_role=UserRole.creator
-        )
-        user3_org1 = UserOrganizationRole(
-            user_id=user3.id, organization_id=org1.id, user_role=UserRole.creator
-        )
-        user3_org2 = UserOrganizationRole(
-            user_id=user3.id, organization_id=org2.id, user_role=UserRole.creator
-        )
-        db.add_all([user_org1, user_org2, user3_org1, user3_org2])
-        db.commit()
-        invitation1 = Invitation(
-            user_id=user3.id,
-            inviter_id=user4.id,
-            organization_id=org3.id,
-            role=UserRole.staff,
-            status="pending",
-        )
-        db.add(invitation1)
-        db.commit()
-        # user3.current_organization_id = org1.id
-        # db.commit()
+    add_event_statuses(engine)
+    create_search_index(engine)
+    backfill_tenants(engine)
+    if MODE == "TEST" and replica_engine is not None:
+        SQLModel.metadata.create_all(bind=replica_engine)
+        create_search_index(replica_engine)
+
+
+if __name__ == "__main__":
+    init_db()
@@ -1,32 +1,56 @@
 from starlette.requests import Request
 from fastapi import FastAPI, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
-from app.database import engine, init_db
-from app.middleware import AuthMiddleware
+from app.database import FAST_START, engine, init_db
+from app.middleware import (
+    AuthMiddleware,
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+    RateLimitMiddleware,
+    ReadReplicaMiddleware,
+)
 from app.models import *
 from app.routers.organizations import router as organizations_router
 from app.routers.invitations import router as invitations_router
 from app.routers.events import router as events_router
 from app.routers.tickets import router as ticket_router
 from app.routers.reservation import router as reservation_router
+from app.routers.metrics import router as metrics_router
+from app.routers.webhooks import router as webhooks_router
+from app.utilities.cache import start_listener, stop_listener
+from app.utilities.metrics import mark_process_dead
+from app.utilities.pdf import shutdown_pool
+import os
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Set up
-    init_db()
+    if not FAST_START:
+        init_db()
+    start_listener(engine)
     yield
     # Tear down
+    stop_listener()
+    shutdown_pool()
+    mark_process_dead(os.getpid())
     # SQLModel.metadata.drop_all(bind=engine)
 
 
-api = FastAPI(lifespan=lifespan)
+api = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 api.add_middleware(AuthMiddleware)
+api.add_middleware(ReadReplicaMiddleware)
+api.add_middleware(QueryStatsMiddleware)
+api.add_middleware(RateLimitMiddleware)
+api.add_middleware(MetricsMiddleware)
 api.include_router(organizations_router, prefix="/organizations")
 api.include_router(invitations_router, prefix="/invitations")
 api.include_router(events_router, prefix="/events")
 api.include_router(ticket_router, prefix="/tickets")
 api.include_router(reservation_router, prefix="/reservation")
+api.include_router(webhooks_router, prefix="/webhooks")
+api.include_router(metrics_router)
 
 
 @api.get("/")
@@ -9,18 +9,51 @@ from fastapi_nextauth_jwt.exceptions import (
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
-from sqlmodel import select
-from app.database import get_db, get_db_session
+from app.database import (
+    READ_YOUR_WRITES_SECONDS,
+    RoutingSession,
+    engine,
+    get_db,
+    replica_engine,
+    route_request,
+    use_primary,
+)
 from app.models import User, Organization
 from os import getenv
 from sqlalchemy.orm import joinedload
 from dotenv import load_dotenv
+from app.utilities.cache import cached_user
 from app.utilities.mail import EmailSender
+from app.utilities.profiling import track_queries, server_timing
+from app.utilities.metrics import (
+    REQUEST_LATENCY,
+    REQUESTS,
+    REQUESTS_IN_FLIGHT,
+    router_label,
+)
+from app.utilities.ratelimit import (
+    RATE_LIMIT_BOOKING,
+    RATE_LIMIT_EVENT_BOOKING,
+    RATE_LIMIT_PUBLIC,
+    RateLimitStore,
+    check,
+    create_store,
+    rate_limit_headers,
+)
 import asyncio
+import json
+import logging
+import re
+import time
 
 load_dotenv()
 
 SECRET_KEY = getenv("SECRET_KEY")
+QUERY_WARN_THRESHOLD = int(getenv("QUERY_WARN_THRESHOLD", "20"))
+
+logger = logging.getLogger(__name__)
+
+TICKET_PDF_PATH = re.compile(r"^/tickets/[^/]+/pdf$")
 
 
 class AuthMiddleware(BaseHTTPMiddleware):
@@ -31,14 +64,21 @@ class AuthMiddleware(BaseHTTPMiddleware):
         "/openapi.json",
         "/redoc",
         "/events/event",
+        "/events/search",
+        "/tickets/verify",
         "/reservation/*",
+        "/metrics",
     ]
+    # PDF tickets are opened from emails with a signed token instead
+    allowed_patterns = [TICKET_PDF_PATH]
 
     async def dispatch(
         self, request: Request, call_next: RequestResponseEndpoint
     ) -> Response:
         if request.url.path in self.allowed_paths:
             return await call_next(request)
+        if any(pattern.match(request.url.path) for pattern in self.allowed_patterns):
+            return await call_next(request)
         for path in self.allowed_paths:
             if path.endswith("*") and (
                 request.url.path.startswith(path[:-1])
@@ -62,10 +102,16 @@ class AuthMiddleware(BaseHTTPMiddleware):
         exp = decoded_token.get("exp")
         exp_datetime = datetime.utcfromtimestamp(exp)
         url = decoded_token.get("picture")
-        db = next(get_db_session())
+        # expire_on_commit is off so the user stays loaded after the commit
+        # below gives the connection back to the pool
+        db = RoutingSession(engine, expire_on_commit=False)
 
-        statement = select(User).where(User.email == mail)
-        user = db.exec(statement).first()
+        # usually served from this worker's cache without a query
+        user = cached_user(db, mail)
+        if not user and replica_engine is not None:
+            # the replica may not have caught up with a user created moments ago
+            use_primary(db)
+            user = cached_user(db, mail)
 
         if not user:
             user = User(email=mail, name=name, image_url=url)
@@ -92,9 +138,141 @@ class AuthMiddleware(BaseHTTPMiddleware):
         #     None,
         # )
 
+        # handlers use their own session; holding this connection for the whole
+        # request would take two per request and exhaust the pool under load
+        db.commit()
+
         request.state.user = user
         # request.state.current_organization = organization
         request.state.db = db
+        try:
+            response = await call_next(request)
+        finally:
+            db.close()
+        return response
+
+
+class QueryStatsMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        started_at = time.perf_counter()
+        with track_queries() as stats:
+            response = await call_next(request)
+        total_ms = (time.perf_counter() - started_at) * 1000
+        response.headers["Server-Timing"] = server_timing(stats, total_ms)
+
+        log = logger.warning if stats.count > QUERY_WARN_THRESHOLD else logger.info
+        log(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.url.path,
+                    "status": response.status_code,
+                    "db_queries": stats.count,
+                    "db_ms": round(stats.duration_ms, 2),
+                    "total_ms": round(total_ms, 2),
+                }
+            )
+        )
+        return response
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        router = router_label(request.url.path)
+        status = 500
+        started_at = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(router, request.method).observe(
+                time.perf_counter() - started_at
+            )
+            REQUESTS.labels(router, status).inc()
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    # Only the routes open without a session are limited. Behind a proxy run
+    # uvicorn with --proxy-headers so request.client is the real client.
+    public_paths = ("/events/event", "/events/search", "/tickets/verify")
+    booking_path = re.compile(r"^/reservation/([^/]+)(?:/waitlist)?/?$")
+
+    def __init__(self, app, store: Optional[RateLimitStore] = None):
+        super().__init__(app)
+        self.store = store or create_store()
+
+    def limits(self, request: Request) -> list:
+        path = request.url.path
+        if not (
+            path in self.public_paths
+            or path.startswith("/reservation/")
+            or TICKET_PDF_PATH.match(path)
+        ):
+            return []
+        client = request.client.host if request.client else "unknown"
+        limits = []
+        booking = request.method == "POST" and self.booking_path.match(path)
+        if booking:
+            if RATE_LIMIT_BOOKING:
+                limits.append((f"booking:{client}", RATE_LIMIT_BOOKING))
+        if RATE_LIMIT_PUBLIC:
+            limits.append((f"ip:{client}", RATE_LIMIT_PUBLIC))
+        if booking and RATE_LIMIT_EVENT_BOOKING:
+            limits.append((f"event:{booking.group(1)}", RATE_LIMIT_EVENT_BOOKING))
+        return limits
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        limits = self.limits(request)
+        if not limits:
+            return await call_next(request)
+        decision = await check(self.store, limits)
+        if decision is None:
+            return await call_next(request)
+        if not decision.allowed:
+            return Response(
+                status_code=429,
+                content="Too many requests",
+                headers=rate_limit_headers(decision),
+            )
         response = await call_next(request)
-        db.close()
+        response.headers.update(rate_limit_headers(decision))
+        return response
+
+
+class ReadReplicaMiddleware(BaseHTTPMiddleware):
+    # A client that just wrote reads from the primary for
+    # READ_YOUR_WRITES_SECONDS so it never sees replication lag on its own data.
+    PIN_COOKIE = "db-primary-until"
+    READ_METHODS = ("GET", "HEAD")
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        if replica_engine is None:
+            return await call_next(request)
+
+        try:
+            pinned_until = float(request.cookies.get(self.PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        replica = request.method in self.READ_METHODS and pinned_until < time.time()
+
+        with route_request(replica) as routing:
+            response = await call_next(request)
+        if routing.wrote:
+            response.set_cookie(
+                self.PIN_COOKIE,
+                str(time.time() + READ_YOUR_WRITES_SECONDS),
+                max_age=READ_YOUR_WRITES_SECONDS,
+                httponly=True,
+            )
         return response
@@ -1,6 +1,7 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import event
+from typing import Optional
+from sqlalchemy import Index, UniqueConstraint, event, text
 from sqlalchemy.orm import relationship
 from sqlmodel import Field, Relationship, Enum, SQLModel
 from enum import Enum as PyEnum
@@ -62,6 +63,11 @@ class User(TenantModel, table=True):
     #     ),
     # )
 
+    __table_args__ = (
+        # bulk invitations match addresses whatever their case
+        Index("ix_user_email_lower", text("lower(email)")),
+    )
+
 
 class InvitationStatus(str, PyEnum):
     pending = "pending"
@@ -111,8 +117,8 @@ class Invitation(TenantModel, table=True):
 
 class EventStatus(str, PyEnum):
     SCHEDULED = "SCHEDULED"
-    # ONGOING = "ONGOING"
-    # FINISHED = "FINISHED"
+    ONGOING = "ONGOING"
+    FINISHED = "FINISHED"
     PENDING = "PENDING"
 
 
@@ -123,14 +129,27 @@ class Event(TenantModel, table=True):
     status: EventStatus = Enum(
         EventStatus, nullable=False, default=EventStatus.SCHEDULED
     )
-    start_date: datetime = Field(nullable=False)
-    end_date: datetime = Field(nullable=False)
+    start_date: datetime = Field(nullable=False, index=True)
+    end_date: datetime = Field(nullable=False, index=True)
     location: str = Field(nullable=True)
     max_tickets: int = Field(nullable=False, default=0, description="0 means unlimited")
+    # non-declined tickets, only changed through app.utilities.capacity
+    tickets_booked: int = Field(
+        nullable=False, default=0, sa_column_kwargs={"server_default": "0"}
+    )
     organization_id: uuid.UUID = Field(foreign_key="organization.id")
     tickets: list["Ticket"] = Relationship(back_populates="event")
     organization: Organization = Relationship(back_populates="events")
     attendees_logs: list["AttendeesLog"] = Relationship(back_populates="event")
+    # set once tickets and attendees logs were moved to the archive tables
+    archived_at: Optional[datetime] = Field(default=None, nullable=True)
+
+    __table_args__ = (
+        # public listings and the lifecycle job, see app/utilities/lifecycle.py
+        Index("ix_event_status_start", "status", "start_date"),
+        # version of an organization's events, see app/utilities/conditional.py
+        Index("ix_event_organization_updated", "organization_id", "updated_at"),
+    )
 
 
 class TicketStatus(str, PyEnum):
@@ -149,6 +168,12 @@ class Ticket(TenantModel, table=True):
     owner_name: str = Field(nullable=False)
     attendees_logs: list["AttendeesLog"] = Relationship(back_populates="ticket")
 
+    __table_args__ = (
+        Index("ix_ticket_tenant_event", "tenant_id", "event_id"),
+        # keyset pagination over the tickets of an event
+        Index("ix_ticket_event_id", "event_id", "id"),
+    )
+
 
 class AttendeeStatus(str, PyEnum):
     joined = "joined"
@@ -161,3 +186,106 @@ class AttendeesLog(TenantModel, table=True):
     status: AttendeeStatus = Enum(AttendeeStatus, nullable=False)
     event: Event = Relationship(back_populates="attendees_logs")
     ticket: Ticket = Relationship(back_populates="attendees_logs")
+
+    __table_args__ = (
+        Index("ix_attendeeslog_tenant_event", "tenant_id", "event_id"),
+        # latest entry of a ticket, for duplicate check-in detection
+        Index("ix_attendeeslog_ticket", "ticket_id", "created_at"),
+    )
+
+
+class WaitlistStatus(str, PyEnum):
+    waiting = "waiting"
+    promoted = "promoted"
+
+
+class WaitlistEntry(TenantModel, table=True):
+    event_id: uuid.UUID = Field(foreign_key="event.id")
+    email: str = Field(nullable=False)
+    name: str = Field(nullable=False)
+    status: WaitlistStatus = Enum(
+        WaitlistStatus, nullable=False, default=WaitlistStatus.waiting
+    )
+
+    # the head of an event's queue is the first entry of this index
+    __table_args__ = (
+        Index("ix_waitlistentry_queue", "event_id", "status", "created_at", "id"),
+    )
+
+
+# Progress of the reminders of one event at one offset before its start, see
+# app/utilities/reminders.py. Tickets are sent to in id order; last_ticket_id
+# is committed before each batch goes out, so a restart resumes after it.
+class ReminderCheckpoint(AbstractModel, table=True):
+    event_id: uuid.UUID = Field(foreign_key="event.id")
+    offset_minutes: int = Field(nullable=False)
+    last_ticket_id: Optional[uuid.UUID] = Field(default=None, nullable=True)
+    sent: int = Field(nullable=False, default=0)
+    completed_at: Optional[datetime] = Field(default=None, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "event_id", "offset_minutes", name="uq_remindercheckpoint_event_offset"
+        ),
+    )
+
+
+class WebhookEvent(str, PyEnum):
+    ticket_booked = "ticket.booked"
+    invitation_accepted = "invitation.accepted"
+    event_updated = "event.updated"
+
+
+class Webhook(TenantModel, table=True):
+    organization_id: uuid.UUID = Field(foreign_key="organization.id", index=True)
+    url: str = Field(nullable=False)
+    secret: str = Field(nullable=False)
+    # comma separated WebhookEvent values
+    events: str = Field(nullable=False)
+    # turned off by the dispatcher after WEBHOOK_MAX_ATTEMPTS failed requests
+    # in a row, and back on with PATCH /webhooks/{id}
+    active: bool = Field(nullable=False, default=True)
+    failures: int = Field(nullable=False, default=0)
+
+
+class DeliveryStatus(str, PyEnum):
+    pending = "pending"
+    delivered = "delivered"
+    failed = "failed"
+
+
+# The outbox of app/utilities/webhooks.py: rows are added in the transaction
+# of the change they describe and sent by the dispatcher.
+class WebhookDelivery(TenantModel, table=True):
+    webhook_id: uuid.UUID = Field(foreign_key="webhook.id")
+    organization_id: uuid.UUID = Field(foreign_key="organization.id")
+    event_type: str = Field(nullable=False)
+    # JSON
+    payload: str = Field(nullable=False)
+    status: DeliveryStatus = Field(default=DeliveryStatus.pending, nullable=False)
+    attempts: int = Field(nullable=False, default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.now, nullable=False)
+    delivered_at: Optional[datetime] = Field(default=None, nullable=True)
+    last_error: Optional[str] = Field(default=None, nullable=True)
+
+    __table_args__ = (
+        Index("ix_webhookdelivery_due", "status", "next_attempt_at"),
+        Index("ix_webhookdelivery_webhook", "webhook_id", "created_at"),
+    )
+
+
+# Cold storage for tickets and attendees logs of long finished events, see
+# app/utilities/archive.py. No foreign keys so rows can outlive their tickets.
+class TicketArchive(TenantModel, table=True):
+    __tablename__ = "ticket_archive"
+    event_id: uuid.UUID = Field(nullable=False, index=True)
+    status: TicketStatus = Enum(TicketStatus, nullable=False)
+    owner_email: str = Field(nullable=False)
+    owner_name: str = Field(nullable=False)
+
+
+class AttendeesLogArchive(TenantModel, table=True):
+    __tablename__ = "attendeeslog_archive"
+    event_id: uuid.UUID = Field(nullable=False, index=True)
+    ticket_id: uuid.UUID = Field(nullable=False)
+    status: AttendeeStatus = Enum(AttendeeStatus, nullable=False)
@@ -1,14 +1,19 @@
 import select
+from datetime import datetime
 from typing import Optional
 from uuid import UUID
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Response
+from sqlalchemy import func, update
 from app.models import (
     EventStatus,
     Organization,
     User,
     Event,
+    Ticket,
+    TicketStatus,
     UserOrganizationRole,
     UserRole,
+    WebhookEvent,
 )
 from app.database import get_db_session
 from starlette.requests import Request
@@ -20,32 +25,124 @@ from app.schemas import (
     EventResponse,
     EditEventRequest,
     EventResponseWithOrganization,
+    EventSearchResponse,
+    EventSearchResult,
+    EventWithIncludes,
+    OrganizationResponse,
+    TicketResponse,
+    CheckinRequest,
+    CheckinResponse,
+    TicketModerationRequest,
+    TicketModerationResponse,
 )
+from app.utilities.checkin import (
+    InvalidManifestVersion,
+    build_delta,
+    cached_manifest,
+    check_in,
+    manifest_version,
+    ticket_is_valid,
+)
+from app.utilities.archive import archived_tickets_by_event
+from app.utilities.cache import (
+    cached_event,
+    cached_organization,
+    organization_role,
+)
+from app.utilities.capacity import release_seats, reserve_seats, seats_available
+from app.utilities.conditional import Version, not_modified
+from app.utilities.includes import (
+    EVENT_INCLUDES,
+    InvalidInclude,
+    loader_options,
+    parse_include,
+)
+from app.utilities.mail import EmailSender
+from app.utilities.responses import json_response, model_response, orm_dict
+from app.utilities.search import InvalidCursor, search_events
+from app.utilities.tenancy import set_tenant
+from app.utilities.tokens import (
+    InvalidTicketToken,
+    check_ticket_window,
+    verify_ticket_token,
+)
+from app.utilities.waitlist import promote_and_notify
+from app.utilities.webhooks import enqueue, event_payload
 
 router = APIRouter()
 
+MODERATION_CHUNK_SIZE = 1000
 
-@router.get("/", tags=["events"], response_model=list[EventResponse])
+
+@router.get("/", tags=["events"], response_model=list[EventWithIncludes])
 async def organization_events(
-    request: Request, org_id: str, db: Session = Depends(get_db_session)
+    request: Request,
+    org_id: UUID,
+    include: str | None = None,
+    db: Session = Depends(get_db_session),
 ) -> list[EventResponse]:
     user: User = request.state.user
+    try:
+        includes = parse_include(include, EVENT_INCLUDES)
+    except InvalidInclude as error:
+        raise HTTPException(status_code=400, detail=str(error))
 
     # check if user in organization
-    user_org_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole).where(
-            UserOrganizationRole.user_id == user.id,
-            UserOrganizationRole.organization_id == org_id,
-        )
-    ).first()
+    user_org_role: UserOrganizationRole = organization_role(db, user.id, org_id)
     if user_org_role is None:
         # unauthorized
         raise HTTPException(status_code=404, detail="Organization not found")
+    if "tickets" in includes and user_org_role.user_role not in [
+        UserRole.creator,
+        UserRole.admin,
+    ]:
+        raise HTTPException(
+            status_code=401, detail="User is not the owner of the organization"
+        )
+    set_tenant(db, org_id)
+    if includes:
+        return events_with_includes(db, org_id, includes)
+    updated_at, count = db.exec(
+        select(func.max(Event.updated_at), func.count()).where(
+            Event.organization_id == org_id
+        )
+    ).one()
+    version = Version(updated_at, count=count)
+    response = not_modified(request, version)
+    if response is not None:
+        return response
     events: list[Event] = db.exec(
         select(Event).where(Event.organization_id == org_id)
     ).all()
 
-    return events
+    return model_response(EventResponse, events, headers=version.headers())
+
+
+def events_with_includes(db: Session, org_id: UUID, includes: set[str]) -> Response:
+    # not versioned, the included rows change without the events
+    events: list[Event] = db.exec(
+        select(Event)
+        .where(Event.organization_id == org_id)
+        .options(*loader_options(EVENT_INCLUDES, includes))
+    ).all()
+    archived = {}
+    if "tickets" in includes:
+        archived = archived_tickets_by_event(
+            db, [event.id for event in events if event.archived_at is not None]
+        )
+
+    content = []
+    for event in events:
+        item = orm_dict(EventResponse, event)
+        if "organization" in includes:
+            item["organization"] = orm_dict(OrganizationResponse, event.organization)
+        if "tickets" in includes:
+            tickets = (
+                archived[event.id] if event.archived_at is not None else event.tickets
+            )
+            item["tickets"] = orm_dict(TicketResponse, tickets)
+        content.append(item)
+    return json_response(content)
 
 
 @router.post("/", tags=["events"], response_model=Event)
@@ -55,12 +152,7 @@ async def create_event(
     user: User = request.state.user
 
     # check if user in organization
-    user_org_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole).where(
-            UserOrganizationRole.user_id == user.id,
-            UserOrganizationRole.organization_id == event.orgId,
-        )
-    ).first()
+    user_org_role: UserOrganizationRole = organization_role(db, user.id, event.orgId)
     # TODO check if user is owner of organization
     if user_org_role is None:
         # unauthorized
@@ -105,12 +197,7 @@ async def delete_event(
     db: Session = Depends(get_db_session),
 ) -> Response:
     user: User = request.state.user
-    user_org_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole).where(
-            UserOrganizationRole.user_id == user.id,
-            UserOrganizationRole.organization_id == org_id,
-        )
-    ).first()
+    user_org_role: UserOrganizationRole = organization_role(db, user.id, org_id)
 
     if user_org_role is None:
         raise HTTPException(status_code=404, detail="Organization not found")
@@ -118,6 +205,7 @@ async def delete_event(
         raise HTTPException(
             status_code=401, detail="User is not the owner of the organization"
         )
+    set_tenant(db, org_id)
     event: Event | None = db.exec(
         select(Event).where(Event.id == event_id).where(Event.organization_id == org_id)
     ).first()
@@ -137,15 +225,13 @@ async def update_event(
     request: Request,
     event_id: UUID,
     event_request: EditEventRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db_session),
 ) -> Event | None:
     user: User = request.state.user
-    user_org_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole).where(
-            UserOrganizationRole.user_id == user.id,
-            UserOrganizationRole.organization_id == event_request.orgId,
-        )
-    ).first()
+    user_org_role: UserOrganizationRole = organization_role(
+        db, user.id, event_request.orgId
+    )
 
     if user_org_role is None:
         raise HTTPException(status_code=404, detail="Organization not found")
@@ -157,6 +243,7 @@ async def update_event(
         raise HTTPException(
             status_code=400, detail="Start date cannot be greater than end date"
         )
+    set_tenant(db, event_request.orgId)
     event: Event | None = db.exec(
         select(Event)
         .where(Event.id == event_id)
@@ -164,6 +251,9 @@ async def update_event(
     ).first()
     if event is None:
         raise HTTPException(status_code=404, detail="Event not found")
+    capacity_grew = event.max_tickets != 0 and (
+        event_request.max_tickets == 0 or event_request.max_tickets > event.max_tickets
+    )
     event.name = event_request.name
     event.cover_image_url = event_request.cover_image_url
     event.description = event_request.description
@@ -174,32 +264,257 @@ async def update_event(
     event.status = event_request.status
     try:
         db.add(event)
+        # flushed first so the payload carries the new updated_at
+        db.flush()
+        enqueue(
+            db,
+            event.organization_id,
+            WebhookEvent.event_updated,
+            [event_payload(event)],
+        )
         db.commit()
         db.refresh(event)
     except:
         db.rollback()
         raise HTTPException(status_code=500, detail="Error updating event")
+    if capacity_grew and event.status == EventStatus.SCHEDULED:
+        promote_and_notify(db, event, background_tasks)
+        db.refresh(event)
     return event
 
 
+@router.patch(
+    "/{event_id}/tickets",
+    tags=["events", "tickets"],
+    response_model=TicketModerationResponse,
+)
+async def moderate_tickets(
+    request: Request,
+    event_id: UUID,
+    moderation: TicketModerationRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db_session),
+) -> TicketModerationResponse:
+    user: User = request.state.user
+    if moderation.ticket_ids is None and moderation.current_status is None:
+        raise HTTPException(
+            status_code=400, detail="Either ticket_ids or current_status is required"
+        )
+    event: Event | None = db.exec(select(Event).where(Event.id == event_id)).first()
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    user_org_role: UserOrganizationRole = organization_role(
+        db, user.id, event.organization_id
+    )
+    if user_org_role is None:
+        raise HTTPException(status_code=404, detail="Organization not found")
+    if user_org_role.user_role not in [UserRole.creator, UserRole.admin]:
+        raise HTTPException(
+            status_code=401, detail="User is not the owner of the organization"
+        )
+    set_tenant(db, event.organization_id)
+
+    # one UPDATE per chunk of ids (bind parameter limits), one for a filter
+    statement = (
+        update(Ticket)
+        .where(Ticket.event_id == event_id)
+        .where(Ticket.status != moderation.status)
+        .values(status=moderation.status, updated_at=datetime.now())
+        .returning(Ticket.owner_email, Ticket.owner_name)
+        .execution_options(synchronize_session=False)
+    )
+    if moderation.current_status is not None:
+        statement = statement.where(Ticket.status == moderation.current_status)
+    if moderation.ticket_ids is None:
+        statements = [statement]
+    else:
+        statements = [
+            statement.where(
+                Ticket.id.in_(
+                    moderation.ticket_ids[start : start + MODERATION_CHUNK_SIZE]
+                )
+            )
+            for start in range(0, len(moderation.ticket_ids), MODERATION_CHUNK_SIZE)
+        ]
+
+    recipients = []
+    try:
+        if moderation.status != TicketStatus.declined:
+            # reinstated tickets take seats again, claimed like bookings so the
+            # event is never oversold; the event row stays locked until commit
+            reinstated = []
+            for chunk in statements:
+                reinstated += db.execute(
+                    chunk.where(Ticket.status == TicketStatus.declined)
+                ).all()
+            if reinstated and not reserve_seats(db, event_id, len(reinstated)):
+                db.rollback()
+                raise HTTPException(
+                    status_code=409, detail="Not enough seats to reinstate tickets"
+                )
+            recipients += [
+                (owner_email, {"name": owner_name})
+                for owner_email, owner_name in reinstated
+            ]
+            statements = [
+                chunk.where(Ticket.status != TicketStatus.declined)
+                for chunk in statements
+            ]
+        for chunk in statements:
+            recipients += [
+                (owner_email, {"name": owner_name})
+                for owner_email, owner_name in db.execute(chunk).all()
+            ]
+        if recipients and moderation.status == TicketStatus.declined:
+            # each of them was not declined before and held a seat
+            release_seats(db, event_id, len(recipients))
+        db.commit()
+    except HTTPException:
+        raise
+    except:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error updating tickets")
+
+    if recipients and moderation.status == TicketStatus.declined:
+        # declined tickets free their seats
+        promote_and_notify(db, event, background_tasks)
+    if recipients:
+        EmailSender().send_batch_background(
+            background_tasks,
+            recipients,
+            f"Ticket update for {event.name}",
+            "ticket_status.html",
+            event_name=event.name,
+            status=moderation.status.value,
+            location=event.location or "Online",
+            date=event.start_date.strftime("%Y-%m-%d"),
+        )
+    return TicketModerationResponse(updated=len(recipients))
+
+
+@router.post(
+    "/{event_id}/checkin", tags=["events", "tickets"], response_model=CheckinResponse
+)
+async def checkin_ticket(
+    request: Request,
+    event_id: UUID,
+    checkin: CheckinRequest,
+    db: Session = Depends(get_db_session),
+) -> CheckinResponse:
+    user: User = request.state.user
+    try:
+        claims = verify_ticket_token(checkin.token)
+    except InvalidTicketToken as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if claims.event_id != event_id:
+        raise HTTPException(status_code=400, detail="Ticket is for another event")
+    event = cached_event(db, event_id)
+    if event is None or organization_role(db, user.id, event.organization_id) is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    try:
+        check_ticket_window(event.end_date)
+    except InvalidTicketToken as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    set_tenant(db, event.organization_id)
+
+    try:
+        checked_in = check_in(db, claims.ticket_id, event_id)
+        db.commit()
+    except:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error checking in ticket")
+    if not checked_in:
+        # only failed check-ins pay for finding out why
+        if not ticket_is_valid(db, claims.ticket_id, event_id):
+            raise HTTPException(status_code=400, detail="Ticket is not valid")
+        raise HTTPException(status_code=400, detail="Ticket already checked in")
+    return CheckinResponse(ticket_id=claims.ticket_id)
+
+
+@router.get("/{event_id}/checkin-manifest", tags=["events", "tickets"])
+async def checkin_manifest(
+    request: Request,
+    event_id: UUID,
+    since: str | None = None,
+    db: Session = Depends(get_db_session),
+) -> Response:
+    user: User = request.state.user
+    event = cached_event(db, event_id)
+    if event is None or organization_role(db, user.id, event.organization_id) is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    set_tenant(db, event.organization_id)
+
+    version = manifest_version(db, event_id)
+    etag = f'"{version}"'
+    headers = {"X-Manifest-Version": version, "ETag": etag}
+    if since is None:
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        content = cached_manifest(db, event_id, version)
+    elif since == version:
+        content = b""
+    else:
+        try:
+            content = build_delta(db, event_id, since)
+        except InvalidManifestVersion as error:
+            raise HTTPException(status_code=400, detail=str(error))
+    return Response(
+        content=content, media_type="application/octet-stream", headers=headers
+    )
+
+
 @router.get("/event", tags=["events"], response_model=EventResponseWithOrganization)
 async def event_by_id(
-    request: Request, event_id: str, db: Session = Depends(get_db_session)
+    request: Request, event_id: UUID, db: Session = Depends(get_db_session)
 ) -> EventResponseWithOrganization:
-    event: Event = db.exec(select(Event).where(Event.id == event_id)).first()
+    event = cached_event(db, event_id)
     if event is None:
         raise HTTPException(status_code=404, detail="Event not found")
-    return EventResponseWithOrganization(
-        id=event.id,
-        name=event.name,
-        status=event.status,
-        start_date=event.start_date,
-        end_date=event.end_date,
-        location=event.location,
-        description=event.description,
-        cover_image_url=event.cover_image_url,
-        max_tickets=event.max_tickets,
-        created_at=event.created_at,
-        updated_at=event.updated_at,
-        organization_name=event.organization.name,
+    organization = cached_organization(db, event.organization_id)
+    # the response carries the organization's name
+    version = Version(event.updated_at, organization.updated_at)
+    response = not_modified(request, version, private=False)
+    if response is not None:
+        return response
+    return model_response(
+        EventResponseWithOrganization,
+        EventResponseWithOrganization(
+            **event.model_dump(), organization_name=organization.name
+        ),
+        headers=version.headers(private=False),
+    )
+
+
+@router.get("/search", tags=["events"], response_model=EventSearchResponse)
+async def event_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    upcoming: bool = True,
+    db: Session = Depends(get_db_session),
+) -> EventSearchResponse:
+    try:
+        rows, next_cursor = search_events(
+            db, q, limit=limit, cursor=cursor, upcoming=upcoming
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    response = EventSearchResponse(
+        items=[
+            EventSearchResult(
+                id=event.id,
+                name=event.name,
+                status=event.status,
+                start_date=event.start_date,
+                end_date=event.end_date,
+                location=event.location,
+                description=event.description,
+                cover_image_url=event.cover_image_url,
+                tickets_available=seats_available(event),
+                rank=rank,
+            )
+            for event, rank in rows
+        ],
+        next_cursor=next_cursor,
     )
+    return model_response(EventSearchResponse, response)
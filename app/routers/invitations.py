@@ -8,23 +8,28 @@ from app.models import (
     UserRole,
     Invitation,
     InvitationStatus,
+    WebhookEvent,
 )
 from app.database import get_db_session
 from starlette.requests import Request
 from app.schemas import (
+    BulkInvitationRequest,
+    BulkInvitationResponse,
     OrganizationInvitationRequest,
     OrganizationInvitationResponse,
-    Inviter,
-    InvitedUser,
     UserInvitation,
-    UserInvitationOrganization,
     InvitationStatusRequest,
 )
 from uuid import UUID
 from sqlmodel import Session, select
 from fastapi import APIRouter
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
+from app.utilities.cache import organization_role
 from app.utilities.mail import EmailSender
+from app.utilities.responses import model_response
+from app.utilities.tenancy import set_tenant
+from app.utilities.webhooks import enqueue, invitation_payload
 
 router = APIRouter()
 
@@ -46,28 +51,7 @@ async def user_invitations(
         .where(Invitation.user_id == user.id)
         .where(Invitation.status == InvitationStatus.pending)
     ).all()
-    invitations_response: list[UserInvitation] = []
-    for invitation in invitations:
-        inviter = invitation.inviter
-        organization = invitation.organization
-        invitation_response = UserInvitation(
-            id=invitation.id,
-            status=invitation.status,
-            created_at=invitation.created_at,
-            updated_at=invitation.updated_at,
-            inviter=Inviter(
-                id=inviter.id,
-                name=inviter.name,
-                email=inviter.email,
-            ),
-            organization=UserInvitationOrganization(
-                id=organization.id,
-                name=organization.name,
-            ),
-        )
-        invitations_response.append(invitation_response)
-
-    return invitations_response
+    return model_response(UserInvitation, invitations)
 
 
 @router.post(
@@ -89,15 +73,14 @@ async def invite_member(
     if organization is None:
         raise HTTPException(status_code=401, detail="Organization not found")
 
-    current_user_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole)
-        .where(UserOrganizationRole.user_id == user.id)
-        .where(UserOrganizationRole.organization_id == organization_id)
-    ).first()
+    current_user_role: UserOrganizationRole = organization_role(
+        db, user.id, organization_id
+    )
     if current_user_role.user_role == UserRole.staff:
         raise HTTPException(
             status_code=401, detail="User is not allowed to invite to the organization"
         )
+    set_tenant(db, organization_id)
 
     invited_user: User = db.exec(
         select(User).where(User.email == invitation.email)
@@ -163,15 +146,120 @@ async def invite_member(
     return Response(status_code=201)
 
 
+@router.post(
+    "/organizations/{organization_id}/bulk",
+    tags=["organizations", "invitations"],
+    response_model=BulkInvitationResponse,
+    status_code=201,
+)
+async def invite_members(
+    request: Request,
+    organization_id: UUID,
+    background: BackgroundTasks,
+    invitation: BulkInvitationRequest = Body(...),
+    db: Session = Depends(get_db_session),
+) -> BulkInvitationResponse:
+    user: User = request.state.user
+    organization: Optional[Organization] = next(
+        (org for org in user.organizations if org.id == organization_id), None
+    )
+    if organization is None:
+        raise HTTPException(status_code=401, detail="Organization not found")
+
+    current_user_role: UserOrganizationRole = organization_role(
+        db, user.id, organization_id
+    )
+    if current_user_role.user_role == UserRole.staff:
+        raise HTTPException(
+            status_code=401, detail="User is not allowed to invite to the organization"
+        )
+    set_tenant(db, organization_id)
+
+    # matched whatever the case, reported as they were requested
+    emails = {email.lower(): email for email in invitation.emails}
+    invited_users: dict[UUID, User] = {
+        invited_user.id: invited_user
+        for invited_user in db.exec(
+            select(User).where(func.lower(User.email).in_(emails))
+        ).all()
+    }
+    members = set(
+        db.exec(
+            select(UserOrganizationRole.user_id)
+            .where(UserOrganizationRole.organization_id == organization_id)
+            .where(UserOrganizationRole.user_id.in_(invited_users))
+        ).all()
+    )
+    already_invited = set(
+        db.exec(
+            select(Invitation.user_id)
+            .where(Invitation.organization_id == organization_id)
+            .where(Invitation.user_id.in_(invited_users))
+            .where(Invitation.status == InvitationStatus.pending)
+        ).all()
+    )
+    to_invite = invited_users.keys() - members - already_invited
+
+    user_invitations = [
+        Invitation(
+            user_id=user_id,
+            organization_id=organization_id,
+            inviter_id=user.id,
+            role=UserRole.staff,
+            status=InvitationStatus.pending,
+        )
+        for user_id in to_invite
+    ]
+    recipients = [
+        (
+            invited_users[user_invitation.user_id].email,
+            {
+                "invitation_id": user_invitation.id,
+                "username": invited_users[user_invitation.user_id].name,
+            },
+        )
+        for user_invitation in user_invitations
+    ]
+    # built before the commit expires the loaded users
+    response = BulkInvitationResponse(
+        invited=[email for email, _ in recipients],
+        already_members=[invited_users[user_id].email for user_id in members],
+        already_invited=[invited_users[user_id].email for user_id in already_invited],
+        not_found=[
+            emails[email]
+            for email in emails.keys()
+            - {invited_user.email.lower() for invited_user in invited_users.values()}
+        ],
+    )
+    try:
+        db.add_all(user_invitations)
+        db.commit()
+    except:
+        db.rollback()
+        raise
+
+    if recipients:
+        EmailSender().send_batch_background(
+            background,
+            recipients,
+            f"You have been invited to join {organization.name} organization!",
+            "invitation.html",
+            organization_name=organization.name,
+            invitername=user.name,
+            client_url=os.getenv("CLIENT_URL"),
+        )
+    return response
+
+
 @router.get(
     "/organizations/{organization_id}",
     tags=["organizations", "invitations"],
+    response_model=list[OrganizationInvitationResponse],
 )
 async def get_organization_invitations(
     request: Request,
     organization_id: UUID,
     db: Session = Depends(get_db_session),
-    response_model=list[OrganizationInvitationResponse],
 ) -> list[OrganizationInvitationResponse]:
     # TODO: think about invitation business logic
     #  - data will be returned
@@ -182,15 +270,14 @@ async def get_organization_invitations(
     if organization is None:
         raise HTTPException(status_code=401, detail="Organization not found")
     # get user role in organization
-    user_organization_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole)
-        .where(UserOrganizationRole.user_id == user.id)
-        .where(UserOrganizationRole.organization_id == organization_id)
-    ).first()
+    user_organization_role: UserOrganizationRole = organization_role(
+        db, user.id, organization_id
+    )
     if user_organization_role.user_role == UserRole.staff:
         raise HTTPException(
             status_code=401, detail="User is not allowed to see invitations"
         )
+    set_tenant(db, organization_id)
 
     invitations: list[Invitation] = db.exec(
         select(
@@ -200,31 +287,7 @@ async def get_organization_invitations(
         .options(joinedload(Invitation.inviter))
         .options(joinedload(Invitation.user))
     ).all()
-    invitations_response: list[OrganizationInvitationResponse] = []
-    for invitation in invitations:
-        inviter: User = invitation.inviter
-        invited_user: User = invitation.user
-        invitation_response = OrganizationInvitationResponse(
-            id=invitation.id,
-            role=invitation.role,
-            status=invitation.status,
-            organization_id=invitation.organization_id,
-            created_at=invitation.created_at,
-            updated_at=invitation.updated_at,
-            inviter=Inviter(
-                id=inviter.id,
-                name=inviter.name,
-                email=inviter.email,
-            ),
-            user=InvitedUser(
-                id=invited_user.id,
-                name=invited_user.name,
-                email=invited_user.email,
-            ),
-        )
-        invitations_response.append(invitation_response)
-
-    return invitations_response
+    return model_response(OrganizationInvitationResponse, invitations)
 
 
 @router.delete(
@@ -244,15 +307,14 @@ async def delete_organization_invitation(
     if organization is None:
         raise HTTPException(status_code=401, detail="Organization not found")
     # get user role in organization
-    user_organization_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole)
-        .where(UserOrganizationRole.user_id == user.id)
-        .where(UserOrganizationRole.organization_id == organization_id)
-    ).first()
+    user_organization_role: UserOrganizationRole = organization_role(
+        db, user.id, organization_id
+    )
     if user_organization_role.user_role == UserRole.staff:
         raise HTTPException(
             status_code=401, detail="User is not allowed to delete invitations"
         )
+    set_tenant(db, organization_id)
     invitation: Invitation = db.exec(
         select(Invitation).where(Invitation.id == invitation_id)
     ).first()
@@ -295,6 +357,12 @@ async def invitation_status(
                 user_role=invitation.role,
             )
             db.add(user_organization_role)
+            enqueue(
+                db,
+                invitation.organization_id,
+                WebhookEvent.invitation_accepted,
+                [invitation_payload(invitation, user.email)],
+            )
             db.commit()
         elif status_request.status == InvitationStatus.rejected:
             pass
@@ -0,0 +1,17 @@
+from os import getenv
+from fastapi import APIRouter, HTTPException, Response
+from starlette.requests import Request
+from app.utilities.metrics import CONTENT_TYPE_LATEST, render_metrics
+
+router = APIRouter()
+
+METRICS_TOKEN = getenv("METRICS_TOKEN")
+
+
+@router.get("/metrics", tags=["metrics"], include_in_schema=False)
+async def metrics(request: Request) -> Response:
+    if METRICS_TOKEN and (
+        request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
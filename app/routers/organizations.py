@@ -9,14 +9,29 @@ from app.models import (
 from app.database import get_db_session
 from starlette.requests import Request
 from app.schemas import (
+    EventResponse,
     OrganizationsResponse,
+    OrganizationInvitationResponse,
     OrganizationRequestBody,
     OrganizationMember,
+    OrganizationResponse,
+    OrganizationWithIncludes,
     UserChangeRoleRequest,
 )
 from uuid import UUID
 from sqlmodel import Session, select
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
+from app.utilities.cache import cached_organization, organization_role
+from app.utilities.conditional import Version, not_modified
+from app.utilities.includes import (
+    ORGANIZATION_INCLUDES,
+    InvalidInclude,
+    loader_options,
+    parse_include,
+)
+from app.utilities.responses import json_response, model_response, orm_dict
+from app.utilities.tenancy import set_tenant
 
 router = APIRouter()
 
@@ -26,27 +41,77 @@ async def user_organizations(
     request: Request,
 ) -> OrganizationsResponse:
     user: User = request.state.user
-    return user.organizations
+    return model_response(Organization, user.organizations)
 
 
 @router.get(
     "/{organization_id}",
     tags=["organizations"],
-    response_model=Organization,
+    response_model=OrganizationWithIncludes,
 )
 async def organizations(
-    request: Request, organization_id: UUID, db: Session = Depends(get_db_session)
+    request: Request,
+    organization_id: UUID,
+    include: str | None = None,
+    db: Session = Depends(get_db_session),
 ) -> Organization | None:
     user: User = request.state.user
+    try:
+        includes = parse_include(include, ORGANIZATION_INCLUDES)
+    except InvalidInclude as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    user_org_role = organization_role(db, user.id, organization_id)
+    if user_org_role is None:
+        # unauthorized
+        raise HTTPException(status_code=401, detail="Organization not found")
+    if includes:
+        return organization_with_includes(db, user_org_role, includes)
+    organization = cached_organization(db, organization_id)
+    version = Version(organization.updated_at)
+    response = not_modified(request, version)
+    if response is not None:
+        return response
+    return model_response(OrganizationResponse, organization, headers=version.headers())
 
-    organization: Optional[Organization] = next(
-        (org for org in user.organizations if org.id == organization_id), None
-    )
 
+def organization_with_includes(
+    db: Session, user_org_role: UserOrganizationRole, includes: set[str]
+) -> Response:
+    # not versioned, the included rows change without the organization
+    if "invitations" in includes and user_org_role.user_role == UserRole.staff:
+        raise HTTPException(
+            status_code=401, detail="User is not allowed to see invitations"
+        )
+    set_tenant(db, user_org_role.organization_id)
+    organization: Optional[Organization] = db.exec(
+        select(Organization)
+        .where(Organization.id == user_org_role.organization_id)
+        .options(*loader_options(ORGANIZATION_INCLUDES, includes))
+    ).first()
     if organization is None:
-        # unauthorized
         raise HTTPException(status_code=401, detail="Organization not found")
-    return organization
+
+    content = orm_dict(OrganizationResponse, organization)
+    if "events" in includes:
+        content["events"] = orm_dict(EventResponse, organization.events)
+    if "members" in includes:
+        roles = {role.user_id: role.user_role for role in organization.members_roles}
+        content["members"] = [
+            {
+                "id": member.id,
+                "name": member.name,
+                "email": member.email,
+                "image_url": member.image_url,
+                "role": roles[member.id],
+            }
+            for member in organization.members
+        ]
+    if "invitations" in includes:
+        content["invitations"] = orm_dict(
+            OrganizationInvitationResponse, organization.invitations
+        )
+    return json_response(content)
 
 
 @router.get("/{organization_id}/members", tags=["organizations", "members"])
@@ -55,12 +120,26 @@ async def organization_members(
 ) -> list[OrganizationMember]:
     user: User = request.state.user
 
-    organization: Optional[Organization] = next(
-        (org for org in user.organizations if org.id == organization_id), None
-    )
-    if organization is None:
+    if organization_role(db, user.id, organization_id) is None:
         # unauthorized
         raise HTTPException(status_code=401, detail="Organization not found")
+    set_tenant(db, organization_id)
+
+    # a member's profile, role or membership changes the version
+    users_updated_at, roles_updated_at, count = db.exec(
+        select(
+            func.max(User.updated_at),
+            func.max(UserOrganizationRole.updated_at),
+            func.count(),
+        )
+        .select_from(User)
+        .join(UserOrganizationRole)
+        .where(UserOrganizationRole.organization_id == organization_id)
+    ).one()
+    version = Version(users_updated_at, roles_updated_at, count=count)
+    response = not_modified(request, version)
+    if response is not None:
+        return response
 
     # get all members of the organization with roles
     members = db.exec(
@@ -80,7 +159,9 @@ async def organization_members(
                 role=role.user_role,
             )
         )
-    return members_with_roles
+    return model_response(
+        OrganizationMember, members_with_roles, headers=version.headers()
+    )
 
 
 @router.post("/", tags=["organizations"], response_model=Organization)
@@ -149,6 +230,7 @@ async def change_user_role(
 
     if user.id == user_id:
         raise HTTPException(status_code=401, detail="User cannot change their own role")
+    set_tenant(db, organization_id)
 
     target_user_organization_role = db.exec(
         select(UserOrganizationRole)
@@ -159,11 +241,7 @@ async def change_user_role(
         raise HTTPException(
             status_code=401, detail="User not found in the organization"
         )
-    current_user_organization_role = db.exec(
-        select(UserOrganizationRole)
-        .where(UserOrganizationRole.user_id == user.id)
-        .where(UserOrganizationRole.organization_id == organization_id)
-    ).first()
+    current_user_organization_role = organization_role(db, user.id, organization_id)
     if current_user_organization_role.user_role == UserRole.staff:
         raise HTTPException(
             status_code=401, detail="User is not authorized to change roles"
@@ -208,6 +286,7 @@ async def remove_user_from_organization(
     # TODO: check if user is the owner of the organization
     if organization is None:
         raise HTTPException(status_code=401, detail="Organization not found")
+    set_tenant(db, organization_id)
 
     target_user_organization_role = db.exec(
         select(UserOrganizationRole)
@@ -219,11 +298,7 @@ async def remove_user_from_organization(
         raise HTTPException(
             status_code=401, detail="User not found in the organization"
         )
-    current_user_organization_role = db.exec(
-        select(UserOrganizationRole)
-        .where(UserOrganizationRole.user_id == user.id)
-        .where(UserOrganizationRole.organization_id == organization_id)
-    ).first()
+    current_user_organization_role = organization_role(db, user.id, organization_id)
 
     if current_user_organization_role.user_role == UserRole.staff:
         raise HTTPException(
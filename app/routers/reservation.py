@@ -7,14 +7,30 @@ from app.models import (
     Event,
     Ticket,
     TicketStatus,
+    WaitlistEntry,
+    WaitlistStatus,
+    WebhookEvent,
 )
-from app.schemas import ReservationEventResponse, TicketRequest
+from app.schemas import ReservationEventResponse, TicketRequest, WaitlistResponse
 from app.database import get_db_session
 from starlette.requests import Request
+from sqlalchemy import update
 from sqlmodel import Session, select
 from fastapi import APIRouter
+from app.utilities.cache import cached_event
+from app.utilities.capacity import release_seats, reserve_seats, seats_available
 from app.utilities.mail import EmailSender
-import segno
+from app.utilities.metrics import BOOKINGS
+from app.utilities.qr import save_ticket_qr
+from app.utilities.tenancy import set_tenant
+from app.utilities.tokens import (
+    cancel_url,
+    pdf_url,
+    ticket_token,
+    verify_cancel_token,
+)
+from app.utilities.waitlist import promote_and_notify, waitlist_position
+from app.utilities.webhooks import enqueue, ticket_payload
 
 router = APIRouter()
 
@@ -25,16 +41,25 @@ async def get_event(
     event_id: UUID,
     db: Session = Depends(get_db_session),
 ) -> Event | None:
-    event: Event = db.exec(
-        select(Event)
-        .where(Event.id == event_id)
-        .where(Event.status == EventStatus.SCHEDULED)
-        .where(Event.start_date > datetime.now())
-    ).first()
-    if event is None:
+    event = cached_event(db, event_id)
+    # the lifecycle job may not have marked it ONGOING yet
+    if (
+        event is None
+        or event.status != EventStatus.SCHEDULED
+        or event.start_date <= datetime.now()
+    ):
         raise HTTPException(status_code=404, detail="Event not found")
 
-    return event
+    return ReservationEventResponse(
+        id=event.id,
+        name=event.name,
+        start_date=event.start_date,
+        end_date=event.end_date,
+        location=event.location,
+        description=event.description,
+        cover_image_url=event.cover_image_url,
+        tickets_available=seats_available(event),
+    )
 
 
 @router.post("/{event_id}", tags=["events"], response_model=Ticket)
@@ -49,16 +74,15 @@ async def book_ticket(
         select(Event)
         .where(Event.id == event_id)
         .where(Event.status == EventStatus.SCHEDULED)
-        .where(Event.start_date > datetime.now())
     ).first()
     if event is None:
+        BOOKINGS.labels("event_not_found").inc()
         raise HTTPException(status_code=404, detail="Event not found")
-
-    tickets_count: int = (
-        db.exec(select(Ticket).where(Ticket.event_id == event_id)).all().__len__()
-    )
-    if tickets_count >= event.max_tickets and event.max_tickets != 0:
-        raise HTTPException(status_code=400, detail="No more tickets available")
+    # the lifecycle job may not have marked it ONGOING yet
+    if event.start_date <= datetime.now():
+        BOOKINGS.labels("event_started").inc()
+        raise HTTPException(status_code=400, detail="Event already started")
+    set_tenant(db, event.organization_id)
 
     alrady_booked = db.exec(
         select(Ticket)
@@ -66,8 +90,15 @@ async def book_ticket(
         .where(Ticket.owner_email == ticket_request.email)
     ).first()
     if alrady_booked:
+        BOOKINGS.labels("already_booked").inc()
         raise HTTPException(status_code=400, detail="Already booked")
 
+    # takes a seat and locks the event row until the ticket is committed
+    if not reserve_seats(db, event_id):
+        db.rollback()
+        BOOKINGS.labels("sold_out").inc()
+        raise HTTPException(status_code=400, detail="No more tickets available")
+
     try:
         ticket = Ticket(
             event_id=event_id,
@@ -76,12 +107,16 @@ async def book_ticket(
             status=TicketStatus.accepted,
         )
         db.add(ticket)
+        enqueue(
+            db,
+            event.organization_id,
+            WebhookEvent.ticket_booked,
+            [ticket_payload(ticket)],
+        )
         db.commit()
         db.refresh(ticket)
 
-        qr: segno.QRCode = segno.make(f"{ticket.id}")
-        qr.save(f"qrcodes/{ticket.id}.png", scale=7.5)
-        path = f"qrcodes/{ticket.id}.png"
+        path = save_ticket_qr(ticket.id, ticket_token(ticket.id, event.id))
 
         email_sinder = EmailSender()
         email_sinder.send_email_background(
@@ -94,10 +129,113 @@ async def book_ticket(
             event_name=event.name,
             location=event.location == None and "Online" or event.location,
             date=event.start_date.strftime("%Y-%m-%d"),
+            cancel_url=cancel_url(ticket.id),
+            pdf_url=pdf_url(ticket.id),
         )
 
     except:
         db.rollback()
+        BOOKINGS.labels("failed").inc()
         raise
 
+    BOOKINGS.labels("success").inc()
     return ticket
+
+
+@router.post(
+    "/{event_id}/waitlist",
+    tags=["events"],
+    response_model=WaitlistResponse,
+    status_code=201,
+)
+async def join_waitlist(
+    request: Request,
+    event_id: UUID,
+    ticket_request: TicketRequest,
+    db: Session = Depends(get_db_session),
+) -> WaitlistResponse:
+    event: Event = db.exec(
+        select(Event)
+        .where(Event.id == event_id)
+        .where(Event.status == EventStatus.SCHEDULED)
+    ).first()
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.start_date <= datetime.now():
+        raise HTTPException(status_code=400, detail="Event already started")
+    set_tenant(db, event.organization_id)
+
+    if seats_available(event) != 0:
+        raise HTTPException(status_code=400, detail="Tickets are still available")
+    alrady_booked = db.exec(
+        select(Ticket)
+        .where(Ticket.event_id == event_id)
+        .where(Ticket.owner_email == ticket_request.email)
+    ).first()
+    if alrady_booked:
+        raise HTTPException(status_code=400, detail="Already booked")
+    entry: WaitlistEntry | None = db.exec(
+        select(WaitlistEntry)
+        .where(WaitlistEntry.event_id == event_id)
+        .where(WaitlistEntry.email == ticket_request.email)
+        .where(WaitlistEntry.status == WaitlistStatus.waiting)
+    ).first()
+    if entry:
+        raise HTTPException(status_code=400, detail="Already on the waitlist")
+
+    entry = WaitlistEntry(
+        event_id=event_id,
+        email=ticket_request.email,
+        name=ticket_request.name,
+        status=WaitlistStatus.waiting,
+    )
+    try:
+        db.add(entry)
+        db.commit()
+        db.refresh(entry)
+    except:
+        db.rollback()
+        raise
+    return WaitlistResponse(id=entry.id, position=waitlist_position(db, entry))
+
+
+@router.post("/tickets/{ticket_id}/cancel", tags=["tickets"], status_code=204)
+async def cancel_ticket(
+    request: Request,
+    ticket_id: UUID,
+    token: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db_session),
+) -> Response:
+    if not verify_cancel_token(ticket_id, token):
+        raise HTTPException(status_code=403, detail="Invalid token")
+    ticket: Ticket | None = db.exec(
+        select(Ticket).where(Ticket.id == ticket_id)
+    ).first()
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    event: Event = ticket.event
+    if event.start_date <= datetime.now():
+        raise HTTPException(status_code=400, detail="Event already started")
+    set_tenant(db, event.organization_id)
+
+    # the status change and the freed seat are committed together
+    try:
+        result = db.execute(
+            update(Ticket)
+            .where(Ticket.id == ticket_id)
+            .where(Ticket.status != TicketStatus.declined)
+            .values(status=TicketStatus.declined, updated_at=datetime.now()),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount == 0:
+            raise HTTPException(status_code=400, detail="Ticket already cancelled")
+        release_seats(db, event.id)
+        db.commit()
+    except:
+        db.rollback()
+        raise
+
+    if event.status == EventStatus.SCHEDULED:
+        promote_and_notify(db, event, background_tasks)
+    return Response(status_code=204)
@@ -1,14 +1,34 @@
 import select
 from typing import List
 from uuid import UUID
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import Event, UserOrganizationRole, UserRole, Ticket
+from fastapi import APIRouter, HTTPException, Depends, Response
+from app.models import (
+    Event,
+    Organization,
+    UserOrganizationRole,
+    UserRole,
+    Ticket,
+    TicketArchive,
+    TicketStatus,
+)
 from app.database import get_db_session
+from app.schemas import TicketTokenResponse
+from app.utilities.archive import archived_tickets
+from app.utilities.cache import cached_event, organization_role
+from app.utilities.metrics import TICKET_PDFS
+from app.utilities.pdf import cached_ticket, render_cached, ticket_document
+from app.utilities.responses import model_response
+from app.utilities.tenancy import set_tenant
+from app.utilities.tokens import (
+    InvalidTicketToken,
+    check_ticket_window,
+    verify_pdf_token,
+    verify_ticket_token,
+)
 from starlette.requests import Request
 from sqlmodel import Session, select
 from fastapi import APIRouter
 
-
 router = APIRouter()
 
 
@@ -20,19 +40,77 @@ async def get_tickets(
     event: Event = db.exec(select(Event).where(Event.id == event_id)).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-    user_org_role: UserOrganizationRole = db.exec(
-        select(UserOrganizationRole).where(
-            UserOrganizationRole.user_id == user.id,
-            UserOrganizationRole.organization_id == event.organization_id,
-        )
-    ).first()
+    user_org_role: UserOrganizationRole = organization_role(
+        db, user.id, event.organization_id
+    )
     if not user_org_role:
         raise HTTPException(status_code=404, detail="Organization not found")
     if user_org_role.user_role not in [UserRole.creator, UserRole.admin]:
         raise HTTPException(
             status_code=401, detail="User is not the owner of the organization"
         )
+    set_tenant(db, event.organization_id)
+    if event.archived_at is not None:
+        return model_response(TicketArchive, archived_tickets(db, event_id))
     tickets: List[Ticket] = db.exec(
         select(Ticket).where(Ticket.event_id == event_id)
     ).all()
-    return tickets
+    return model_response(Ticket, tickets)
+
+
+@router.get("/verify", tags=["tickets"], response_model=TicketTokenResponse)
+async def verify_ticket(
+    token: str, db: Session = Depends(get_db_session)
+) -> TicketTokenResponse:
+    # signature and the event's dates, usually from the worker cache
+    try:
+        claims = verify_ticket_token(token)
+    except InvalidTicketToken as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    event = cached_event(db, claims.event_id)
+    if event is None:
+        raise HTTPException(status_code=400, detail="Ticket is not valid")
+    try:
+        check_ticket_window(event.end_date)
+    except InvalidTicketToken as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return TicketTokenResponse(
+        ticket_id=claims.ticket_id,
+        event_id=claims.event_id,
+        not_after=event.end_date,
+    )
+
+
+@router.get("/{ticket_id}/pdf", tags=["tickets"], response_class=Response)
+async def ticket_pdf(
+    ticket_id: UUID, token: str, db: Session = Depends(get_db_session)
+) -> Response:
+    # Linked from the confirmation email; the token stands in for a session.
+    # Cached until the event is edited.
+    if not verify_pdf_token(ticket_id, token):
+        raise HTTPException(status_code=403, detail="Invalid token")
+    row = db.exec(
+        select(Ticket, Event, Organization.name)
+        .join(Event, Event.id == Ticket.event_id)
+        .join(Organization, Organization.id == Event.organization_id)
+        .where(Ticket.id == ticket_id)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket, event, organization_name = row
+    if ticket.status != TicketStatus.accepted:
+        raise HTTPException(status_code=400, detail="Ticket is not accepted")
+
+    content = cached_ticket(ticket.id, event.updated_at)
+    if content is None:
+        TICKET_PDFS.labels("rendered").inc()
+        content = await render_cached(
+            ticket_document(ticket, event, organization_name), event.updated_at
+        )
+    else:
+        TICKET_PDFS.labels("cached").inc()
+    return Response(
+        content,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="ticket-{ticket.id}.pdf"'},
+    )
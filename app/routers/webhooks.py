@@ -0,0 +1,176 @@
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from starlette.requests import Request
+from app.database import get_db_session
+from app.models import (
+    User,
+    UserOrganizationRole,
+    UserRole,
+    Webhook,
+    WebhookDelivery,
+)
+from app.schemas import (
+    WebhookCreatedResponse,
+    WebhookDeliveryResponse,
+    WebhookRequest,
+    WebhookResponse,
+    WebhookUpdateRequest,
+)
+from app.utilities.cache import organization_role
+from app.utilities.tenancy import set_tenant
+from app.utilities.webhooks import UnsafeWebhookURL, new_secret, resolve
+
+router = APIRouter()
+
+
+def require_admin(db: Session, user: User, organization_id: UUID):
+    user_org_role: UserOrganizationRole = organization_role(
+        db, user.id, organization_id
+    )
+    if user_org_role is None:
+        raise HTTPException(status_code=404, detail="Organization not found")
+    if user_org_role.user_role not in [UserRole.creator, UserRole.admin]:
+        raise HTTPException(
+            status_code=401, detail="User is not the owner of the organization"
+        )
+    set_tenant(db, organization_id)
+
+
+def webhook_response(webhook: Webhook) -> dict:
+    return {
+        "id": webhook.id,
+        "url": webhook.url,
+        "events": webhook.events.split(","),
+        "active": webhook.active,
+        "created_at": webhook.created_at,
+    }
+
+
+def find_webhook(db: Session, user: User, webhook_id: UUID) -> Webhook:
+    # the same 404 whether the webhook is missing or in an organization the
+    # caller is not part of, so ids of other organizations cannot be probed
+    webhook = db.exec(select(Webhook).where(Webhook.id == webhook_id)).first()
+    if (
+        webhook is None
+        or organization_role(db, user.id, webhook.organization_id) is None
+    ):
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    require_admin(db, user, webhook.organization_id)
+    return webhook
+
+
+@router.get(
+    "/organizations/{organization_id}",
+    tags=["organizations", "webhooks"],
+    response_model=list[WebhookResponse],
+)
+async def organization_webhooks(
+    request: Request, organization_id: UUID, db: Session = Depends(get_db_session)
+):
+    require_admin(db, request.state.user, organization_id)
+    webhooks = db.exec(
+        select(Webhook)
+        .where(Webhook.organization_id == organization_id)
+        .order_by(Webhook.created_at)
+    ).all()
+    return [webhook_response(webhook) for webhook in webhooks]
+
+
+@router.post(
+    "/organizations/{organization_id}",
+    tags=["organizations", "webhooks"],
+    response_model=WebhookCreatedResponse,
+    status_code=201,
+)
+async def create_webhook(
+    request: Request,
+    organization_id: UUID,
+    webhook_request: WebhookRequest,
+    db: Session = Depends(get_db_session),
+):
+    require_admin(db, request.state.user, organization_id)
+    try:
+        await resolve(str(webhook_request.url))
+    except UnsafeWebhookURL as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    webhook = Webhook(
+        organization_id=organization_id,
+        url=str(webhook_request.url),
+        secret=new_secret(),
+        events=",".join(sorted({event.value for event in webhook_request.events})),
+    )
+    try:
+        db.add(webhook)
+        db.commit()
+        db.refresh(webhook)
+    except:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error creating webhook")
+    return {**webhook_response(webhook), "secret": webhook.secret}
+
+
+@router.patch("/{webhook_id}", tags=["webhooks"], response_model=WebhookResponse)
+async def update_webhook(
+    request: Request,
+    webhook_id: UUID,
+    webhook_update: WebhookUpdateRequest,
+    db: Session = Depends(get_db_session),
+):
+    webhook = find_webhook(db, request.state.user, webhook_id)
+    if webhook_update.events is not None:
+        webhook.events = ",".join(
+            sorted({event.value for event in webhook_update.events})
+        )
+    if webhook_update.active is not None:
+        webhook.active = webhook_update.active
+        # turned back on after the dispatcher gave up on it
+        if webhook.active:
+            webhook.failures = 0
+    try:
+        db.add(webhook)
+        db.commit()
+        db.refresh(webhook)
+    except:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error updating webhook")
+    return webhook_response(webhook)
+
+
+@router.delete("/{webhook_id}", tags=["webhooks"], status_code=204)
+async def delete_webhook(
+    request: Request, webhook_id: UUID, db: Session = Depends(get_db_session)
+):
+    webhook = find_webhook(db, request.state.user, webhook_id)
+    try:
+        db.execute(
+            delete(WebhookDelivery).where(WebhookDelivery.webhook_id == webhook.id),
+            execution_options={"synchronize_session": False},
+        )
+        db.delete(webhook)
+        db.commit()
+    except:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error deleting webhook")
+    return Response(status_code=204)
+
+
+@router.get(
+    "/{webhook_id}/deliveries",
+    tags=["webhooks"],
+    response_model=list[WebhookDeliveryResponse],
+)
+async def webhook_deliveries(
+    request: Request,
+    webhook_id: UUID,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db_session),
+):
+    webhook = find_webhook(db, request.state.user, webhook_id)
+    return db.exec(
+        select(WebhookDelivery)
+        .where(WebhookDelivery.webhook_id == webhook.id)
+        .order_by(WebhookDelivery.created_at.desc())
+        .limit(limit)
+    ).all()
@@ -1,8 +1,17 @@
 from typing import Literal
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import AliasChoices, AliasPath, BaseModel, EmailStr, Field, HttpUrl
 from uuid import UUID
 from datetime import datetime
-from app.models import EventStatus, User, Organization, UserRole, InvitationStatus
+from app.models import (
+    DeliveryStatus,
+    EventStatus,
+    User,
+    Organization,
+    UserRole,
+    InvitationStatus,
+    TicketStatus,
+    WebhookEvent,
+)
 
 
 class OrganizationsResponse(BaseModel):
@@ -13,6 +22,17 @@ class OrganizationInvitationRequest(BaseModel):
     email: EmailStr
 
 
+class BulkInvitationRequest(BaseModel):
+    emails: list[EmailStr] = Field(..., min_length=1, max_length=1000)
+
+
+class BulkInvitationResponse(BaseModel):
+    invited: list[EmailStr]
+    already_members: list[EmailStr]
+    already_invited: list[EmailStr]
+    not_found: list[EmailStr]
+
+
 class Inviter(BaseModel):
     id: UUID
     name: str
@@ -73,6 +93,22 @@ class ReservationEventResponse(BaseModel):
     location: str | None
     description: str | None
     cover_image_url: str | None
+    tickets_available: int | None = None
+
+
+class WaitlistResponse(BaseModel):
+    id: UUID
+    position: int
+
+
+class EventSearchResult(ReservationEventResponse):
+    status: EventStatus
+    rank: float
+
+
+class EventSearchResponse(BaseModel):
+    items: list[EventSearchResult]
+    next_cursor: str | None
 
 
 class TicketRequest(BaseModel):
@@ -98,7 +134,12 @@ class EventResponse(BaseModel):
 
 
 class EventResponseWithOrganization(EventResponse):
-    organization_name: str
+    # read from event.organization.name when built from an Event row
+    organization_name: str = Field(
+        validation_alias=AliasChoices(
+            "organization_name", AliasPath("organization", "name")
+        )
+    )
 
 
 class OrganizationMember(BaseModel):
@@ -114,7 +155,7 @@ class EventRequest(BaseModel):
     start_date: datetime
     end_date: datetime
     max_tickets: int = 0
-    orgId: str
+    orgId: UUID
     description: str = None
     location: str = None
     cover_image_url: str = None
@@ -136,3 +177,109 @@ class EditEventRequest(EventRequest):
 
     class Config:
         extra = "forbid"
+
+
+class TicketModerationRequest(BaseModel):
+    status: TicketStatus
+    # either explicit tickets or every ticket currently in `current_status`
+    ticket_ids: list[UUID] | None = None
+    current_status: TicketStatus | None = None
+
+    class Config:
+        extra = "forbid"
+
+
+class TicketModerationResponse(BaseModel):
+    updated: int
+
+
+class TicketTokenResponse(BaseModel):
+    ticket_id: UUID
+    event_id: UUID
+    # the event's current end date
+    not_after: datetime
+
+
+class CheckinRequest(BaseModel):
+    token: str
+
+    class Config:
+        extra = "forbid"
+
+
+class CheckinResponse(BaseModel):
+    ticket_id: UUID
+
+
+class WebhookRequest(BaseModel):
+    url: HttpUrl
+    events: list[WebhookEvent] = Field(..., min_length=1)
+
+    class Config:
+        extra = "forbid"
+
+
+class WebhookUpdateRequest(BaseModel):
+    active: bool | None = None
+    events: list[WebhookEvent] | None = Field(None, min_length=1)
+
+    class Config:
+        extra = "forbid"
+
+
+class WebhookResponse(BaseModel):
+    id: UUID
+    url: str
+    events: list[WebhookEvent]
+    active: bool
+    created_at: datetime
+
+
+class WebhookCreatedResponse(WebhookResponse):
+    # only shown once, receivers verify signatures with it
+    secret: str
+
+
+class WebhookDeliveryResponse(BaseModel):
+    id: UUID
+    event_type: str
+    status: DeliveryStatus
+    attempts: int
+    created_at: datetime
+    next_attempt_at: datetime
+    delivered_at: datetime | None
+    last_error: str | None
+
+
+class OrganizationResponse(BaseModel):
+    id: UUID
+    name: str
+    owner: UUID
+    contact_email: str
+    description: str | None
+    logo_url: str | None
+    website: str | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class TicketResponse(BaseModel):
+    id: UUID
+    event_id: UUID
+    status: TicketStatus
+    owner_email: str
+    owner_name: str
+    created_at: datetime
+    updated_at: datetime
+
+
+# the relationships are only present when asked for with ?include=
+class OrganizationWithIncludes(OrganizationResponse):
+    events: list[EventResponse] | None = None
+    members: list[OrganizationMember] | None = None
+    invitations: list[OrganizationInvitationResponse] | None = None
+
+
+class EventWithIncludes(EventResponse):
+    organization: OrganizationResponse | None = None
+    tickets: list[TicketResponse] | None = None
@@ -0,0 +1,91 @@
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+from os import getenv
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Production launch profile: python -m app.server
+# One worker per CPU by default; the app is async, more only adds contention.
+WEB_CONCURRENCY = int(getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+HOST = getenv("HOST", "0.0.0.0")
+PORT = int(getenv("PORT", "8000"))
+# longer than the load balancer's idle timeout (60s on most), so the balancer
+# closes idle connections first and never reuses one the server just closed
+KEEP_ALIVE_SECONDS = int(getenv("KEEP_ALIVE_SECONDS", "75"))
+# on SIGTERM, requests in flight get this long to finish
+GRACEFUL_SHUTDOWN_SECONDS = int(getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+# proxies whose X-Forwarded-For is trusted, rate limits key on the client IP
+FORWARDED_ALLOW_IPS = getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+# restart a worker after this many requests, 0 never
+MAX_REQUESTS = int(getenv("MAX_REQUESTS", "0"))
+
+
+def prepare_metrics(workers: int):
+    # Workers share samples through PROMETHEUS_MULTIPROC_DIR, which must be
+    # set before prometheus_client is imported and emptied of earlier runs.
+    directory = getenv("PROMETHEUS_MULTIPROC_DIR")
+    if workers > 1 and not directory:
+        directory = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API in production")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    workers = args.workers
+    if getenv("MODE") == "TEST" and workers > 1:
+        # every worker would delete the SQLite file on import
+        logger.warning("MODE=TEST runs a single worker")
+        workers = 1
+    prepare_metrics(workers)
+    if workers > 1 and not getenv("RATE_LIMIT_STORE"):
+        logger.warning(
+            "Rate limits are kept per worker, %s workers allow %s times the "
+            "configured limits; set RATE_LIMIT_STORE to share them",
+            workers,
+            workers,
+        )
+
+    import uvicorn
+
+    if getenv("FAST_START", "0") != "1":
+        # once here instead of concurrently in every worker's startup; set
+        # first, app.database reads it on import and a single worker runs in
+        # this process
+        os.environ["FAST_START"] = "1"
+        from app.database import init_db
+
+        init_db()
+
+    uvicorn.run(
+        "app.main:api",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_keep_alive=KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        limit_max_requests=MAX_REQUESTS or None,
+        # QueryStatsMiddleware logs every request already
+        access_log=False,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
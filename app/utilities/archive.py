@@ -0,0 +1,128 @@
+import argparse
+from datetime import datetime, timedelta
+from os import getenv
+from uuid import UUID
+from sqlalchemy import delete, insert, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from app.models import (
+    AttendeesLog,
+    AttendeesLogArchive,
+    Event,
+    Ticket,
+    TicketArchive,
+)
+from app.utilities.cache import invalidate
+
+ARCHIVE_RETENTION_DAYS = int(getenv("ARCHIVE_RETENTION_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+TICKET_COLUMNS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "tenant_id",
+    "event_id",
+    "status",
+    "owner_email",
+    "owner_name",
+]
+ATTENDEES_LOG_COLUMNS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "tenant_id",
+    "event_id",
+    "ticket_id",
+    "status",
+]
+
+
+def _move(db: Session, source, target, columns: list[str], event_ids: list[UUID]):
+    db.execute(
+        insert(target).from_select(
+            columns,
+            select(*(getattr(source, column) for column in columns)).where(
+                source.event_id.in_(event_ids)
+            ),
+        )
+    )
+    db.execute(
+        delete(source).where(source.event_id.in_(event_ids)),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def archive_events(db: Session, event_ids: list[UUID]):
+    # attendees logs first, they reference tickets
+    _move(db, AttendeesLog, AttendeesLogArchive, ATTENDEES_LOG_COLUMNS, event_ids)
+    _move(db, Ticket, TicketArchive, TICKET_COLUMNS, event_ids)
+    db.execute(
+        update(Event).where(Event.id.in_(event_ids)).values(archived_at=datetime.now()),
+        execution_options={"synchronize_session": False},
+    )
+    invalidate(db, "events", event_ids)
+
+
+def archive_finished_events(
+    engine: Engine,
+    retention_days: int = ARCHIVE_RETENTION_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+) -> int:
+    # Each batch of events is moved in its own transaction, so the job can be
+    # stopped at any point and rerun.
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    archived = 0
+    with Session(engine) as db:
+        while True:
+            event_ids = db.exec(
+                select(Event.id)
+                .where(Event.end_date < cutoff)
+                .where(Event.archived_at.is_(None))
+                .order_by(Event.end_date)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not event_ids:
+                break
+            archive_events(db, event_ids)
+            db.commit()
+            archived += len(event_ids)
+    return archived
+
+
+def archived_tickets(db: Session, event_id: UUID) -> list[TicketArchive]:
+    return db.exec(
+        select(TicketArchive).where(TicketArchive.event_id == event_id)
+    ).all()
+
+
+def archived_tickets_by_event(
+    db: Session, event_ids: list[UUID]
+) -> dict[UUID, list[TicketArchive]]:
+    # one query for many archived events
+    tickets = {event_id: [] for event_id in event_ids}
+    if event_ids:
+        for ticket in db.exec(
+            select(TicketArchive).where(TicketArchive.event_id.in_(event_ids))
+        ):
+            tickets[ticket.event_id].append(ticket)
+    return tickets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move tickets and attendees logs of finished events to archive tables"
+    )
+    parser.add_argument("--retention-days", type=int, default=ARCHIVE_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    archived = archive_finished_events(engine, args.retention_days, args.batch_size)
+    print(f"Archived {archived} events")
+
+
+if __name__ == "__main__":
+    main()
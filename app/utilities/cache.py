@@ -0,0 +1,337 @@
+import logging
+import select as selectors
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from os import getenv
+from typing import Callable, Iterable, Optional
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import event, func, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, select
+from app.models import Event, Organization, User, UserOrganizationRole
+from app.utilities.metrics import CACHE_REQUESTS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Per-worker caches of hot rows. Writes are published on an invalidation bus
+# when they commit: Postgres NOTIFY sent in the writing transaction, so other
+# workers, servers and jobs drop their copies, or in process on other
+# databases. The TTL bounds staleness from anything the bus misses.
+CACHE_SIZE = int(getenv("CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(getenv("CACHE_TTL_SECONDS", "60"))
+INVALIDATION_CHANNEL = "cache_invalidation"
+# NOTIFY payloads must stay below 8000 bytes
+PAYLOAD_SIZE = 7000
+# invalidates every key of a cache
+ALL = "*"
+
+PENDING = "cache_invalidations"
+
+
+class Cache:
+    def __init__(
+        self, name: str, size: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS
+    ):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # bumped by every invalidation; a load that raced one is not stored
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                CACHE_REQUESTS.labels(self.name, "miss").inc()
+                return None
+            self.entries.move_to_end(key)
+        CACHE_REQUESTS.labels(self.name, "hit").inc()
+        return entry[1]
+
+    def load(self, key: str, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        # misses are not cached
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = loader()
+        if value is None:
+            return None
+        with self.lock:
+            if self.generation == generation:
+                self.entries[key] = (time.monotonic() + self.ttl, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: str):
+        with self.lock:
+            self.generation += 1
+            if key == ALL:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+
+caches: dict[str, Cache] = {}
+# model -> (cache name, keys of an instance) for writes made through the ORM
+_tracked: dict[type, list[tuple[str, Callable]]] = {}
+
+
+def register(name: str, model: type, keys: Callable) -> Cache:
+    cache = caches[name] = Cache(name)
+    _tracked.setdefault(model, []).append((name, keys))
+    return cache
+
+
+def _snapshot(obj) -> dict:
+    return {
+        column.key: getattr(obj, column.key)
+        for column in inspect(type(obj)).column_attrs
+    }
+
+
+def _restore(model: type, snapshot: dict):
+    # a detached copy, as if loaded by a session that was closed since
+    obj = model(**snapshot)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def _keys_with_history(obj, attribute: str) -> list[str]:
+    # an entry cached under a changed key must go too
+    values = [getattr(obj, attribute)]
+    values += inspect(obj).attrs[attribute].history.deleted
+    return [str(value) for value in values if value is not None]
+
+
+users = register("users", User, lambda user: _keys_with_history(user, "email"))
+roles = register(
+    "roles",
+    UserOrganizationRole,
+    lambda role: [f"{role.user_id}:{role.organization_id}"],
+)
+events = register("events", Event, lambda event: [str(event.id)])
+organizations = register(
+    "organizations", Organization, lambda organization: [str(organization.id)]
+)
+
+
+def cached_user(db: Session, email: str) -> Optional[User]:
+    # attached to db, so relationships still load lazily
+    snapshot = users.load(
+        email,
+        lambda: _optional_snapshot(
+            db.exec(select(User).where(User.email == email)).first()
+        ),
+    )
+    if snapshot is None:
+        return None
+    user = _restore(User, snapshot)
+    db.add(user)
+    return user
+
+
+def organization_role(
+    db: Session, user_id: UUID, organization_id: UUID
+) -> Optional[UserOrganizationRole]:
+    # a detached copy for permission checks; load the row to change it
+    snapshot = roles.load(
+        f"{user_id}:{organization_id}",
+        lambda: _optional_snapshot(
+            db.exec(
+                select(UserOrganizationRole)
+                .where(UserOrganizationRole.user_id == user_id)
+                .where(UserOrganizationRole.organization_id == organization_id)
+            ).first()
+        ),
+    )
+    return None if snapshot is None else _restore(UserOrganizationRole, snapshot)
+
+
+def cached_event(db: Session, event_id: UUID) -> Optional[Event]:
+    # detached, only its columns can be read
+    snapshot = events.load(
+        str(event_id),
+        lambda: _optional_snapshot(
+            db.exec(select(Event).where(Event.id == event_id)).first()
+        ),
+    )
+    return None if snapshot is None else _restore(Event, snapshot)
+
+
+def cached_organization(db: Session, organization_id: UUID) -> Optional[Organization]:
+    # detached, only its columns can be read
+    snapshot = organizations.load(
+        str(organization_id),
+        lambda: _optional_snapshot(
+            db.exec(
+                select(Organization).where(Organization.id == organization_id)
+            ).first()
+        ),
+    )
+    return None if snapshot is None else _restore(Organization, snapshot)
+
+
+def organization_name(db: Session, organization_id: UUID) -> Optional[str]:
+    organization = cached_organization(db, organization_id)
+    return None if organization is None else organization.name
+
+
+def _optional_snapshot(obj) -> Optional[dict]:
+    return None if obj is None else _snapshot(obj)
+
+
+def invalidate(db: Session, name: str, keys: Iterable):
+    # for bulk UPDATE and DELETE statements, which the ORM does not track;
+    # published when db commits
+    db.info.setdefault(PENDING, set()).update((name, str(key)) for key in keys)
+
+
+def apply(invalidations: Iterable[tuple[str, str]]):
+    for name, key in invalidations:
+        cache = caches.get(name)
+        if cache is not None:
+            cache.invalidate(key)
+
+
+def clear_all():
+    for cache in caches.values():
+        cache.invalidate(ALL)
+
+
+def _payloads(invalidations: Iterable[tuple[str, str]]) -> list[str]:
+    # "name key" lines, split into payloads NOTIFY accepts
+    payloads, lines, size = [], [], 0
+    for name, key in sorted(invalidations):
+        line = f"{name} {key}"
+        if lines and size + len(line) + 1 > PAYLOAD_SIZE:
+            payloads.append("\n".join(lines))
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        payloads.append("\n".join(lines))
+    return payloads
+
+
+def _parse(payload: str) -> list[tuple[str, str]]:
+    return [tuple(line.split(" ", 1)) for line in payload.splitlines() if " " in line]
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    pending = None
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for name, keys in _tracked.get(type(obj), ()):
+            if pending is None:
+                pending = session.info.setdefault(PENDING, set())
+            pending.update((name, key) for key in keys(obj))
+
+
+@event.listens_for(Session, "before_commit")
+def _publish(session):
+    # the last flush of a commit runs after before_commit, so flush first;
+    # NOTIFY is transactional, listeners only hear it if the commit succeeds
+    session.flush()
+    pending = session.info.get(PENDING)
+    if pending and session.get_bind().dialect.name == "postgresql":
+        for payload in _payloads(pending):
+            session.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payload)))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_local(session):
+    # this worker does not wait for its own notification
+    pending = session.info.pop(PENDING, None)
+    if pending:
+        apply(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop(PENDING, None)
+
+
+class InvalidationListener:
+    # LISTENs on a dedicated connection in a background thread. Notifications
+    # missed while reconnecting cannot be replayed, so every cache is cleared
+    # on reconnect.
+    def __init__(self, engine: Engine, poll: float = 5.0):
+        self.engine = engine
+        self.poll = poll
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="cache-invalidation", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join(timeout=self.poll + 1)
+
+    def connect(self):
+        connection = self.engine.raw_connection()
+        # kept out of the pool for as long as the listener runs
+        connection.detach()
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+        return dbapi_connection
+
+    def run(self):
+        delay = 1.0
+        while not self.stopped.is_set():
+            connection = None
+            try:
+                connection = self.connect()
+                clear_all()
+                delay = 1.0
+                while not self.stopped.is_set():
+                    readable, _, _ = selectors.select([connection], [], [], self.poll)
+                    if not readable:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        apply(_parse(notify.payload))
+            except Exception:
+                logger.exception("Cache invalidation listener failed, reconnecting")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+_listener: Optional[InvalidationListener] = None
+
+
+def start_listener(engine: Engine):
+    # other databases have no LISTEN; a single process needs none
+    global _listener
+    if engine.dialect.name == "postgresql" and _listener is None:
+        _listener = InvalidationListener(engine)
+        _listener.start()
+
+
+def stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,75 @@
+import argparse
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, select
+from app.models import Event, Ticket, TicketStatus
+from app.utilities.cache import ALL, invalidate
+
+# Event.tickets_booked counts the non-declined tickets of an event. It is only
+# changed with conditional UPDATEs, which lock the event row until commit, so
+# concurrent bookings, cancellations and promotions never oversell.
+
+
+def reserve_seats(db: Session, event_id: UUID, seats: int = 1) -> bool:
+    result = db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .where(
+            or_(
+                Event.max_tickets == 0,
+                Event.tickets_booked + seats <= Event.max_tickets,
+            )
+        )
+        .values(tickets_booked=Event.tickets_booked + seats),
+        execution_options={"synchronize_session": False},
+    )
+    invalidate(db, "events", [event_id])
+    return result.rowcount == 1
+
+
+def release_seats(db: Session, event_id: UUID, seats: int = 1):
+    db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .where(Event.tickets_booked >= seats)
+        .values(tickets_booked=Event.tickets_booked - seats),
+        execution_options={"synchronize_session": False},
+    )
+    invalidate(db, "events", [event_id])
+
+
+def recount_tickets(db: Session, event_id: Optional[UUID] = None):
+    statement = update(Event).values(
+        tickets_booked=select(func.count())
+        .select_from(Ticket)
+        .where(Ticket.event_id == Event.id)
+        .where(Ticket.status != TicketStatus.declined)
+        .scalar_subquery()
+    )
+    if event_id is not None:
+        statement = statement.where(Event.id == event_id)
+    db.execute(statement, execution_options={"synchronize_session": False})
+    invalidate(db, "events", [ALL if event_id is None else event_id])
+
+
+def seats_available(event: Event) -> Optional[int]:
+    if event.max_tickets == 0:
+        return None
+    return max(event.max_tickets - event.tickets_booked, 0)
+
+
+def main():
+    argparse.ArgumentParser(
+        description="Recount Event.tickets_booked of every event from its tickets"
+    ).parse_args()
+
+    from app.database import engine
+
+    with Session(engine) as db:
+        recount_tickets(db)
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from os import getenv
+from threading import Lock
+from uuid import UUID
+from sqlalchemy import Uuid, and_, exists, func, insert, literal, or_
+from sqlmodel import Session, select
+from app.models import AttendeeStatus, AttendeesLog, Ticket, TicketStatus
+
+MANIFEST_CACHE_SIZE = int(getenv("CHECKIN_MANIFEST_CACHE_SIZE", "256"))
+MANIFEST_CHUNK_SIZE = 5000
+
+# Check-in manifests for door scanners. A manifest is the sorted 16 byte ids of
+# every valid ticket of an event. A delta lists the tickets changed since a
+# version as 17 byte records, b"+" or b"-" followed by the id; applying it twice
+# is harmless. The version is "<max(updated_at) in microseconds>.<count>", so
+# it changes whenever a ticket is added, declined or reinstated.
+ADDED = b"+"
+REMOVED = b"-"
+
+
+class InvalidManifestVersion(ValueError):
+    pass
+
+
+def last_attendee_status(ticket_id: UUID):
+    return (
+        select(AttendeesLog.status)
+        .where(AttendeesLog.ticket_id == ticket_id)
+        .order_by(AttendeesLog.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def check_in(db: Session, ticket_id: UUID, event_id: UUID) -> bool:
+    # The token already proved the ticket was issued; a single INSERT ... SELECT
+    # records the entry unless the ticket was declined since or its holder is
+    # already inside. Returns False when nothing was written.
+    now = datetime.now()
+    last_status = last_attendee_status(ticket_id)
+    result = db.execute(
+        insert(AttendeesLog).from_select(
+            [
+                "id",
+                "created_at",
+                "updated_at",
+                "tenant_id",
+                "event_id",
+                "ticket_id",
+                "status",
+            ],
+            select(
+                literal(uuid.uuid4(), Uuid()),
+                literal(now),
+                literal(now),
+                Ticket.tenant_id,
+                Ticket.event_id,
+                Ticket.id,
+                literal(AttendeeStatus.joined, AttendeesLog.__table__.c.status.type),
+            )
+            .where(Ticket.id == ticket_id)
+            .where(Ticket.event_id == event_id)
+            .where(Ticket.status != TicketStatus.declined)
+            .where(or_(last_status.is_(None), last_status != AttendeeStatus.joined)),
+        )
+    )
+    return result.rowcount == 1
+
+
+def ticket_is_valid(db: Session, ticket_id: UUID, event_id: UUID) -> bool:
+    return db.exec(
+        select(
+            exists().where(
+                and_(
+                    Ticket.id == ticket_id,
+                    Ticket.event_id == event_id,
+                    Ticket.status != TicketStatus.declined,
+                )
+            )
+        )
+    ).one()
+
+
+def _microseconds(value: datetime) -> int:
+    return int(value.timestamp()) * 1_000_000 + value.microsecond
+
+
+def manifest_version(db: Session, event_id: UUID) -> str:
+    updated_at, count = db.exec(
+        select(func.max(Ticket.updated_at), func.count()).where(
+            Ticket.event_id == event_id
+        )
+    ).one()
+    if updated_at is None:
+        return "0.0"
+    return f"{_microseconds(updated_at)}.{count}"
+
+
+def _version_time(version: str) -> datetime:
+    try:
+        microseconds, _ = version.split(".")
+        microseconds = int(microseconds)
+        return datetime.fromtimestamp(microseconds // 1_000_000).replace(
+            microsecond=microseconds % 1_000_000
+        )
+    except (ValueError, OverflowError, OSError):
+        raise InvalidManifestVersion("Invalid manifest version")
+
+
+def build_manifest(db: Session, event_id: UUID) -> bytes:
+    # streamed in chunks, ids are never loaded as ORM objects
+    rows = db.exec(
+        select(Ticket.id)
+        .where(Ticket.event_id == event_id)
+        .where(Ticket.status != TicketStatus.declined)
+        .order_by(Ticket.id)
+        .execution_options(yield_per=MANIFEST_CHUNK_SIZE)
+    )
+    return b"".join(ticket_id.bytes for ticket_id in rows)
+
+
+def build_delta(db: Session, event_id: UUID, since: str) -> bytes:
+    # >= rather than >: tickets changed within the same microsecond as the
+    # version are sent again instead of being missed
+    rows = db.exec(
+        select(Ticket.id, Ticket.status)
+        .where(Ticket.event_id == event_id)
+        .where(Ticket.updated_at >= _version_time(since))
+        .order_by(Ticket.id)
+        .execution_options(yield_per=MANIFEST_CHUNK_SIZE)
+    )
+    return b"".join(
+        (REMOVED if status == TicketStatus.declined else ADDED) + ticket_id.bytes
+        for ticket_id, status in rows
+    )
+
+
+class ManifestCache:
+    def __init__(self, size: int = MANIFEST_CACHE_SIZE):
+        self.size = size
+        self.entries: OrderedDict[UUID, tuple[str, bytes]] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, event_id: UUID, version: str) -> bytes | None:
+        with self.lock:
+            entry = self.entries.get(event_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(event_id)
+            return entry[1]
+
+    def put(self, event_id: UUID, version: str, manifest: bytes):
+        with self.lock:
+            self.entries[event_id] = (version, manifest)
+            self.entries.move_to_end(event_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+manifest_cache = ManifestCache()
+
+
+def cached_manifest(db: Session, event_id: UUID, version: str) -> bytes:
+    manifest = manifest_cache.get(event_id, version)
+    if manifest is None:
+        manifest = build_manifest(db, event_id)
+        manifest_cache.put(event_id, version, manifest)
+    return manifest
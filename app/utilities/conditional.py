@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Response
+from starlette.requests import Request
+
+# Conditional GET driven by AbstractModel.updated_at. A resource is versioned
+# by its updated_at, a collection by max(updated_at) of its rows and their
+# count, so a deleted row changes the version too. Routes read the version
+# with a cheap query first and answer 304 before loading anything else.
+
+
+def _microseconds(value: datetime) -> int:
+    return int(value.timestamp()) * 1_000_000 + value.microsecond
+
+
+class Version:
+    def __init__(self, *updated_at: Optional[datetime], count: Optional[int] = None):
+        # several timestamps when the response joins rows of several tables
+        self.updated_at = [value for value in updated_at if value is not None]
+        self.count = count
+
+    @property
+    def last_modified(self) -> Optional[datetime]:
+        return max(self.updated_at, default=None)
+
+    @property
+    def etag(self) -> str:
+        parts = [str(_microseconds(value)) for value in self.updated_at]
+        if self.count is not None:
+            parts.append(str(self.count))
+        return '"%s"' % ".".join(parts or ["0"])
+
+    def headers(self, private: bool = True) -> dict:
+        # no-cache: clients keep the response but revalidate before every use,
+        # without it browsers guess a freshness lifetime from Last-Modified
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "private, no-cache" if private else "no-cache",
+        }
+        if self.last_modified is not None:
+            # updated_at is naive local time
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.astimezone(timezone.utc), usegmt=True
+            )
+        return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # weak comparison, as for every GET
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _not_modified_since(header: str, version: Version) -> bool:
+    # Last-Modified cannot tell that a row was deleted, so collections only
+    # answer to If-None-Match
+    if version.count is not None or version.last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # the header has whole seconds
+    modified = version.last_modified.astimezone(timezone.utc).replace(microsecond=0)
+    return modified <= since
+
+
+def not_modified(
+    request: Request, version: Version, private: bool = True
+) -> Optional[Response]:
+    # the 304 to return, or None when the client's copy is outdated
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        matches = _etag_matches(if_none_match, version.etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        matches = if_modified_since is not None and _not_modified_since(
+            if_modified_since, version
+        )
+    if not matches:
+        return None
+    return Response(status_code=304, headers=version.headers(private))
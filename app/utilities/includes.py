@@ -0,0 +1,43 @@
+from typing import Iterable, Optional
+from sqlalchemy.orm import selectinload
+from app.models import Event, Invitation, Organization
+
+# Relationships a client can ask to be embedded with ?include=a,b. Each one is
+# loaded with selectinload: one "WHERE parent_id IN (...)" query for all the
+# parents of the response (per 500 parents), so the number of queries depends
+# on what was included, never on how many rows came back.
+ORGANIZATION_INCLUDES = {
+    "events": [selectinload(Organization.events)],
+    # the users and their role rows, matched up by user id
+    "members": [
+        selectinload(Organization.members),
+        selectinload(Organization.members_roles),
+    ],
+    "invitations": [
+        selectinload(Organization.invitations).selectinload(Invitation.inviter),
+        selectinload(Organization.invitations).selectinload(Invitation.user),
+    ],
+}
+EVENT_INCLUDES = {
+    "organization": [selectinload(Event.organization)],
+    # archived events have theirs in ticket_archive, see app.utilities.archive
+    "tickets": [selectinload(Event.tickets)],
+}
+
+
+class InvalidInclude(ValueError):
+    pass
+
+
+def parse_include(include: Optional[str], allowed: Iterable[str]) -> set[str]:
+    if not include:
+        return set()
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names.difference(allowed)
+    if unknown:
+        raise InvalidInclude(f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+def loader_options(includes: dict, names: set[str]) -> list:
+    return [option for name in sorted(names) for option in includes[name]]
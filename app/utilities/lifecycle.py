@@ -0,0 +1,133 @@
+import argparse
+import logging
+import time
+from datetime import datetime
+from os import getenv
+from dotenv import load_dotenv
+from sqlalchemy import text, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from app.models import Event, EventStatus
+from app.utilities.cache import invalidate
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LIFECYCLE_BATCH_SIZE = int(getenv("LIFECYCLE_BATCH_SIZE", "5000"))
+LIFECYCLE_INTERVAL_SECONDS = int(getenv("LIFECYCLE_INTERVAL_SECONDS", "60"))
+
+# Events the public can see. Scheduled events are the upcoming ones, the job
+# below moves them on once they start, so listings filter on the status index
+# instead of comparing dates.
+UPCOMING_STATUSES = (EventStatus.SCHEDULED,)
+PUBLIC_STATUSES = (EventStatus.SCHEDULED, EventStatus.ONGOING, EventStatus.FINISHED)
+
+
+def add_event_statuses(engine: Engine):
+    # Postgres stores the status as a native enum created before ONGOING and
+    # FINISHED existed. ADD VALUE cannot run inside a transaction block.
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for status in EventStatus:
+            connection.execute(
+                text(f"ALTER TYPE eventstatus ADD VALUE IF NOT EXISTS '{status.name}'")
+            )
+
+
+def transitions(now: datetime) -> list[tuple[EventStatus, EventStatus, list]]:
+    # finished first, so an event that started and ended between two runs
+    # skips ONGOING; every condition is a range on the status index
+    return [
+        (EventStatus.ONGOING, EventStatus.FINISHED, [Event.end_date <= now]),
+        (
+            EventStatus.SCHEDULED,
+            EventStatus.FINISHED,
+            [Event.start_date <= now, Event.end_date <= now],
+        ),
+        (EventStatus.SCHEDULED, EventStatus.ONGOING, [Event.start_date <= now]),
+    ]
+
+
+def advance_events(
+    engine: Engine,
+    now: datetime | None = None,
+    batch_size: int = LIFECYCLE_BATCH_SIZE,
+) -> dict[str, int]:
+    # One UPDATE per batch, each committed on its own so locks are short and
+    # the job can be stopped and rerun at any point. Rows locked by a running
+    # request are skipped and picked up by the next run.
+    now = now or datetime.now()
+    moved = {}
+    with Session(engine) as db:
+        for source, target, conditions in transitions(now):
+            count = 0
+            while True:
+                batch = (
+                    select(Event.id)
+                    .where(Event.status == source, *conditions)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                    .scalar_subquery()
+                )
+                moved_ids = (
+                    db.execute(
+                        update(Event)
+                        .where(Event.id.in_(batch))
+                        .values(status=target, updated_at=now)
+                        .returning(Event.id),
+                        execution_options={"synchronize_session": False},
+                    )
+                    .scalars()
+                    .all()
+                )
+                invalidate(db, "events", moved_ids)
+                db.commit()
+                count += len(moved_ids)
+                if len(moved_ids) < batch_size:
+                    break
+            moved[f"{source.value} -> {target.value}"] = count
+    return moved
+
+
+def run_lifecycle(
+    engine: Engine,
+    interval: int = LIFECYCLE_INTERVAL_SECONDS,
+    batch_size: int = LIFECYCLE_BATCH_SIZE,
+):
+    while True:
+        try:
+            moved = advance_events(engine, batch_size=batch_size)
+            if any(moved.values()):
+                logger.info("Event statuses advanced: %s", moved)
+        except Exception:
+            logger.exception("Event lifecycle pass failed")
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move events from SCHEDULED to ONGOING to FINISHED"
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="advance what is due and exit"
+    )
+    parser.add_argument("--interval", type=int, default=LIFECYCLE_INTERVAL_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=LIFECYCLE_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.database import engine
+
+    if args.once:
+        for transition, count in advance_events(
+            engine, batch_size=args.batch_size
+        ).items():
+            print(f"{transition}: {count}")
+        return
+    run_lifecycle(engine, args.interval, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
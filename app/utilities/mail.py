@@ -1,11 +1,192 @@
-from typing import Union, List, Dict
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import socket
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from email.encoders import encode_base64
+from email.message import Message
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr, formatdate, make_msgid
+from functools import lru_cache
+from typing import TYPE_CHECKING, Union, List, Dict, Tuple
 from fastapi import BackgroundTasks, UploadFile
 from os import getenv
+from app.utilities.metrics import EMAIL_BACKLOG, EMAILS_SENT
+
+logger = logging.getLogger(__name__)
+
+# fastapi_mail is the slowest import of the app, it is loaded when the first
+# EmailSender is created instead of at startup
+if TYPE_CHECKING:
+    from fastapi_mail import MessageSchema
+
+# errors that end the SMTP session (aiosmtplib's SMTPServerDisconnected,
+# SMTPConnectError and timeouts derive from these); whatever is left of the
+# batch cannot go out over that connection
+CONNECTION_ERRORS = (ConnectionError, TimeoutError)
+
+# encoded shared attachments kept in memory, keyed by path and modification
+MAIL_ATTACHMENT_CACHE_SIZE = int(getenv("MAIL_ATTACHMENT_CACHE_SIZE", "32"))
+
+# compiled templates, shared by every EmailSender
+_templates: Dict[Tuple[str, str], "BatchTemplate"] = {}
+
+# stands in for a personal variable in a shared render
+_MARKER = "\x1f" + secrets.token_hex(4)
+
+
+class BatchTemplate:
+    # A template rendered once per batch instead of once per recipient.
+    # Personal variables only used as {{ name }} or {% if name %} are
+    # rendered as markers and filled in afterwards; any other use (filters,
+    # comparisons, loops) changes the shared render, so recipients are
+    # grouped by those values and each group is rendered on its own.
+    def __init__(self, environment, name: str):
+        from jinja2 import nodes
+
+        self.template = environment.get_template(name)
+        autoescape = environment.autoescape
+        if callable(autoescape):
+            autoescape = autoescape(name)
+        if autoescape:
+            from markupsafe import escape
+
+            self.convert = lambda value: str(escape(value))
+        else:
+            self.convert = str
+
+        tree = environment.parse(environment.loader.get_source(environment, name)[0])
+        plain, other = set(), set()
+
+        def walk(node, parent):
+            if isinstance(node, nodes.Name):
+                if node.ctx == "load" and isinstance(parent, (nodes.Output, nodes.If)):
+                    plain.add(node.name)
+                else:
+                    other.add(node.name)
+            for child in node.iter_child_nodes():
+                walk(child, node)
+
+        walk(tree, None)
+        # variables of included or inherited templates are out of sight
+        composed = tree.find_all(
+            (nodes.Extends, nodes.Include, nodes.Import, nodes.FromImport)
+        )
+        if environment.finalize is not None or next(composed, None) is not None:
+            plain = set()
+        self.plain = plain - other
+        self.markers = re.compile(_MARKER + r"(\w+)" + _MARKER)
+
+    def shape(self, context: dict) -> tuple:
+        # recipients with the same shape share one render
+        shape = []
+        for key, value in sorted(context.items()):
+            if key in self.plain and value:
+                shape.append((key,))
+                continue
+            try:
+                hash(value)
+            except TypeError:
+                # cannot be compared, rendered on its own
+                value = object()
+            shape.append((key, type(value), value))
+        return tuple(shape)
+
+    def render(self, shared: dict, contexts: List[dict]) -> List[List[str]]:
+        # Returns each recipient's body as [text, variable, text, ...]
+        # pieces: shared text at even positions, personal values between.
+        groups = defaultdict(list)
+        for index, context in enumerate(contexts):
+            groups[self.shape(context)].append(index)
+        bodies = [None] * len(contexts)
+        for indexes in groups.values():
+            variables = dict(shared)
+            for key, value in contexts[indexes[0]].items():
+                if key in self.plain and value:
+                    value = _MARKER + key + _MARKER
+                variables[key] = value
+            parts = self.markers.split(self.template.render(**variables))
+            for index in indexes:
+                context = contexts[index]
+                bodies[index] = [
+                    part if position % 2 == 0 else self.convert(context[part])
+                    for position, part in enumerate(parts)
+                ]
+        return bodies
+
+
+def get_template(folder: str, environment_factory, name: str) -> BatchTemplate:
+    key = (folder, name)
+    if key not in _templates:
+        _templates[key] = BatchTemplate(environment_factory(), name)
+    return _templates[key]
+
+
+def attachment_part(path: str) -> MIMEBase:
+    mime_type, _ = mimetypes.guess_type(path)
+    part = MIMEBase(*(mime_type or "application/octet-stream").split("/", 1))
+    with open(path, "rb") as file:
+        part.set_payload(file.read())
+    encode_base64(part)
+    part.add_header(
+        "Content-Disposition",
+        "attachment",
+        filename=("UTF8", "", os.path.basename(path)),
+    )
+    return part
+
+
+@lru_cache(maxsize=MAIL_ATTACHMENT_CACHE_SIZE)
+def _shared_attachment(path: str, modified: int, size: int) -> MIMEBase:
+    return attachment_part(path)
+
+
+def shared_attachment(path: str) -> MIMEBase:
+    # encoded once and attached to every message; a changed file is re-read
+    stat = os.stat(path)
+    return _shared_attachment(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1)
+def message_domain() -> str:
+    # make_msgid looks the host name up for every message otherwise
+    return socket.getfqdn()
+
+
+def build_message(
+    sender: str,
+    email: str,
+    subject: str,
+    date: str,
+    body: Union[str, MIMEText],
+    attachments: List[MIMEBase],
+) -> MIMEMultipart:
+    # the message fastapi_mail builds for an html MessageSchema
+    message = MIMEMultipart("mixed")
+    message.set_charset("utf-8")
+    if isinstance(body, str):
+        body = MIMEText(body, "html", "utf-8")
+    message.attach(body)
+    message["Date"] = date
+    message["Message-ID"] = make_msgid(domain=message_domain())
+    message["To"] = email
+    message["From"] = sender
+    message["Subject"] = subject
+    for part in attachments:
+        message.attach(part)
+    return message
 
 
 class EmailSender:
     def __init__(self):
+        from fastapi_mail import FastMail, ConnectionConfig
+
         self.conf = ConnectionConfig(
             MAIL_USERNAME=getenv("MAIL_USERNAME"),
             MAIL_PASSWORD=getenv("MAIL_PASSWORD"),
@@ -18,13 +199,20 @@ class EmailSender:
             MAIL_SSL_TLS=False,
             MAIL_DEBUG=0,
             TEMPLATE_FOLDER=getenv("TEMPLATE_FOLDER"),
+            SUPPRESS_SEND=int(getenv("MAIL_SUPPRESS_SEND", "0")),
         )
         self.mail = FastMail(self.conf)
         self.templates = {}
 
     def load_template(self, template_name: str):
-        temp = self.conf.template_engine()
-        self.templates[template_name] = temp.get_template(template_name)
+        self.templates[template_name] = get_template(
+            str(self.conf.TEMPLATE_FOLDER), self.conf.template_engine, template_name
+        )
+
+    def sender(self) -> str:
+        if self.conf.MAIL_FROM_NAME is not None:
+            return formataddr((self.conf.MAIL_FROM_NAME, self.conf.MAIL_FROM))
+        return self.conf.MAIL_FROM
 
     def send_email_background(
         self,
@@ -35,16 +223,19 @@ class EmailSender:
         attachments: List[Union[Dict, str, UploadFile]] = [],
         **kwargs
     ):
+        from fastapi_mail import MessageSchema
+
         if template_name not in self.templates:
             self.load_template(template_name)
         message = MessageSchema(
             subject=subject,
             recipients=[email],
             subtype="html",
-            template_body=self.templates[template_name].render(**kwargs),
+            template_body=self.templates[template_name].template.render(**kwargs),
             attachments=attachments,
         )
-        background_tasks.add_task(self.mail.send_message, message)
+        EMAIL_BACKLOG.inc()
+        background_tasks.add_task(self.deliver, message, template_name)
 
     async def send_email(
         self,
@@ -54,13 +245,140 @@ class EmailSender:
         attachments: List[Union[Dict, str, UploadFile]] = [],
         **kwargs
     ):
+        from fastapi_mail import MessageSchema
+
         if template_name not in self.templates:
             self.load_template(template_name)
         message = MessageSchema(
             subject=subject,
             recipients=[email],
             subtype="html",
-            template_body=self.templates[template_name].render(**kwargs),
+            template_body=self.templates[template_name].template.render(**kwargs),
             attachments=attachments,
         )
-        await self.mail.send_message(message)
+        EMAIL_BACKLOG.inc()
+        await self.deliver(message, template_name)
+
+    async def deliver(self, message: "MessageSchema", template_name: str):
+        try:
+            await self.mail.send_message(message)
+        except Exception:
+            EMAILS_SENT.labels(template_name, "failure").inc()
+            raise
+        else:
+            EMAILS_SENT.labels(template_name, "success").inc()
+        finally:
+            EMAIL_BACKLOG.dec()
+
+    def render_batch(
+        self,
+        recipients: List[Tuple],
+        subject: str,
+        template_name: str,
+        attachments: List[str] = [],
+        **kwargs
+    ) -> List[Message]:
+        # recipients are (email, template variables[, attachment paths])
+        # tuples; kwargs and attachments are shared by every message. The
+        # template is rendered once per batch and shared attachments are
+        # encoded once, only the personal parts are built per recipient.
+        if template_name not in self.templates:
+            self.load_template(template_name)
+        bodies = self.templates[template_name].render(
+            kwargs, [context for _, context, *_ in recipients]
+        )
+        shared = [shared_attachment(path) for path in attachments]
+        sender = self.sender()
+        date = formatdate(time.time(), localtime=True)
+        # bodies without personal values are encoded once
+        parts: Dict[str, MIMEText] = {}
+        messages = []
+        for (email, _, *own), body in zip(recipients, bodies):
+            if len(body) == 1:
+                if body[0] not in parts:
+                    parts[body[0]] = MIMEText(body[0], "html", "utf-8")
+                body = parts[body[0]]
+            else:
+                body = "".join(body)
+            own = [attachment_part(path) for path in (own[0] if own else [])]
+            messages.append(
+                build_message(sender, email, subject, date, body, shared + own)
+            )
+        return messages
+
+    def send_batch_background(
+        self,
+        background_tasks: BackgroundTasks,
+        recipients: List[Tuple],
+        subject: str,
+        template_name: str,
+        attachments: List[str] = [],
+        **kwargs
+    ):
+        # The whole batch goes out over a single SMTP connection.
+        messages = self.render_batch(
+            recipients, subject, template_name, attachments, **kwargs
+        )
+        EMAIL_BACKLOG.inc(len(messages))
+        background_tasks.add_task(self.deliver_batch, messages, template_name)
+
+    def connect(self):
+        # an SMTP connection for deliver_over, used as an async context manager
+        from fastapi_mail.connection import Connection
+
+        if self.conf.SUPPRESS_SEND:
+            return nullcontext()
+        return Connection(self.conf)
+
+    async def deliver_batch(self, messages: List[Message], template_name: str):
+        pending = len(messages)
+        try:
+            async with self.connect() as connection:
+                # deliver_over accounts for every message from here
+                pending = 0
+                await self.deliver_over(connection, messages, template_name)
+        finally:
+            # the connection could not be opened, nothing was sent
+            if pending:
+                self.abandon(template_name, pending)
+
+    def abandon(self, template_name: str, count: int):
+        # messages counted in EMAIL_BACKLOG that will not be sent
+        EMAILS_SENT.labels(template_name, "failure").inc(count)
+        EMAIL_BACKLOG.dec(count)
+
+    async def deliver_one(
+        self, connection, message: Message, template_name: str
+    ) -> bool:
+        # False when the server refused the message; errors of the connection
+        # itself are raised
+        try:
+            if not self.conf.SUPPRESS_SEND:
+                await connection.session.send_message(message)
+        except CONNECTION_ERRORS:
+            logger.exception("SMTP connection lost sending %s", template_name)
+            EMAILS_SENT.labels(template_name, "failure").inc()
+            raise
+        except Exception:
+            logger.exception("Could not send %s to %s", template_name, message["To"])
+            EMAILS_SENT.labels(template_name, "failure").inc()
+            return False
+        else:
+            EMAILS_SENT.labels(template_name, "success").inc()
+            return True
+        finally:
+            EMAIL_BACKLOG.dec()
+
+    async def deliver_over(
+        self, connection, messages: List[Message], template_name: str
+    ) -> int:
+        # messages come from render_batch and must already be counted in
+        # EMAIL_BACKLOG; returns how many were sent
+        sent = 0
+        for index, message in enumerate(messages):
+            try:
+                sent += await self.deliver_one(connection, message, template_name)
+            except CONNECTION_ERRORS:
+                self.abandon(template_name, len(messages) - index - 1)
+                raise
+        return sent
@@ -0,0 +1,91 @@
+from os import getenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+# With several workers set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+# directory; every worker then writes its samples to mmap'd files there and
+# /metrics aggregates them.
+MULTIPROCESS = bool(getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+ROUTERS = (
+    "organizations",
+    "invitations",
+    "events",
+    "tickets",
+    "reservation",
+    "webhooks",
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by router",
+    ["router", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "http_requests_total", "Requests by router and status", ["router", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being served",
+    multiprocess_mode="livesum",
+)
+DB_CONNECTIONS_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of the pool",
+    multiprocess_mode="livesum",
+)
+BOOKINGS = Counter("ticket_bookings_total", "Booking attempts by outcome", ["outcome"])
+EMAILS_SENT = Counter(
+    "emails_sent_total", "Delivered and failed emails", ["template", "result"]
+)
+TICKET_PDFS = Counter(
+    "ticket_pdfs_total", "PDF ticket downloads by cache result", ["result"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "In-process cache lookups", ["cache", "result"]
+)
+EMAIL_BACKLOG = Gauge(
+    "email_backlog",
+    "Emails queued but not yet delivered",
+    multiprocess_mode="livesum",
+)
+
+
+def router_label(path: str) -> str:
+    segment = path.split("/", 2)[1]
+    return segment if segment in ROUTERS else "other"
+
+
+@event.listens_for(Pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_CONNECTIONS_IN_USE.inc()
+
+
+@event.listens_for(Pool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    DB_CONNECTIONS_IN_USE.dec()
+
+
+def render_metrics() -> bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid: int):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
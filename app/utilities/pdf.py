@@ -0,0 +1,260 @@
+import asyncio
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from os import getenv
+from uuid import UUID
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rendered tickets, one file per ticket under two levels of directories
+PDF_CACHE_DIR = getenv("PDF_CACHE_DIR", "pdfcache")
+PDF_WORKERS = int(getenv("PDF_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+# A5 portrait, in points
+PAGE_WIDTH, PAGE_HEIGHT = 420, 595
+MARGIN = 36
+QR_SIZE = 220
+# average glyph width of Helvetica relative to the font size, for wrapping
+GLYPH_WIDTH = 0.55
+
+HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+
+
+@dataclass(frozen=True)
+class TicketDocument:
+    ticket_id: UUID
+    owner_name: str
+    event_name: str
+    organization_name: str
+    location: str
+    start_date: datetime
+    end_date: datetime
+    token: str
+
+
+def ticket_document(ticket, event, organization_name: str) -> TicketDocument:
+    from app.utilities.tokens import ticket_token
+
+    return TicketDocument(
+        ticket_id=ticket.id,
+        owner_name=ticket.owner_name,
+        event_name=event.name,
+        organization_name=organization_name,
+        location=event.location or "Online",
+        start_date=event.start_date,
+        end_date=event.end_date,
+        token=ticket_token(ticket.id, event.id),
+    )
+
+
+def _text(value: str) -> bytes:
+    # The standard fonts with WinAnsiEncoding cover Latin-1, anything else
+    # prints as "?"
+    value = "".join(char if char.isprintable() else " " for char in value)
+    raw = value.encode("cp1252", "replace")
+    raw = raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"(" + raw + b")"
+
+
+def _wrap(value: str, size: int, width: float, lines: int) -> list[str]:
+    limit = max(1, int(width / (size * GLYPH_WIDTH)))
+    wrapped, line = [], ""
+    for word in value.split():
+        while len(word) > limit:
+            if line:
+                wrapped.append(line)
+                line = ""
+            wrapped.append(word[:limit])
+            word = word[limit:]
+        if line and len(line) + 1 + len(word) > limit:
+            wrapped.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        wrapped.append(line)
+    if len(wrapped) > lines:
+        wrapped = wrapped[:lines]
+        wrapped[-1] = wrapped[-1][: limit - 3] + "..."
+    return wrapped
+
+
+def _qr(token: str, x: float, y: float, size: float) -> bytes:
+    # Dark modules as filled rectangles, one per horizontal run, so the code
+    # stays sharp at any print size.
+    import segno
+
+    matrix = segno.make(token).matrix
+    # four modules of quiet zone on every side
+    module = size / (len(matrix) + 8)
+    top = y + size - 4 * module
+    left = x + 4 * module
+    rects = []
+    for row, modules in enumerate(matrix):
+        bottom = top - (row + 1) * module
+        start = None
+        for column, dark in enumerate(list(modules) + [0]):
+            if dark and start is None:
+                start = column
+            elif not dark and start is not None:
+                rects.append(
+                    b"%.2f %.2f %.2f %.2f re"
+                    % (left + start * module, bottom, (column - start) * module, module)
+                )
+                start = None
+    return b"0 g\n" + b"\n".join(rects) + b"\nf\n"
+
+
+def _document(content: bytes, version: bytes) -> bytes:
+    stream = zlib.compress(content)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]"
+        b" /Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> /Contents 4 0 R >>"
+        % (PAGE_WIDTH, PAGE_HEIGHT),
+        b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+        + stream
+        + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+        b" /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold"
+        b" /Encoding /WinAnsiEncoding >>",
+    ]
+    pdf = bytearray(HEADER + version)
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(pdf)
+
+
+def version_comment(ticket_id: UUID, version: datetime) -> bytes:
+    # written after the header, a cached file is current when it matches
+    return b"%%ticket %s %s\n" % (
+        ticket_id.hex.encode(),
+        version.strftime("%Y%m%d%H%M%S%f").encode(),
+    )
+
+
+def render_ticket(document: TicketDocument, version: datetime) -> bytes:
+    # runs in the worker processes, so it only needs the document
+    width = PAGE_WIDTH - 2 * MARGIN
+    y = PAGE_HEIGHT - MARGIN
+    content = [b"BT"]
+
+    def line(font: bytes, size: int, value: str, gap: float):
+        nonlocal y
+        y -= gap
+        content.append(
+            b"/%s %d Tf 1 0 0 1 %d %.2f Tm %s Tj"
+            % (font, size, MARGIN, y, _text(value))
+        )
+
+    line(b"F1", 11, document.organization_name, 11)
+    for index, part in enumerate(_wrap(document.event_name, 22, width, 3)):
+        line(b"F2", 22, part, 34 if index == 0 else 26)
+    line(b"F1", 12, document.start_date.strftime("%A, %d %B %Y, %H:%M"), 30)
+    if document.end_date.date() == document.start_date.date():
+        until = document.end_date.strftime("until %H:%M")
+    else:
+        until = document.end_date.strftime("until %A, %d %B %Y, %H:%M")
+    line(b"F1", 12, until, 16)
+    for part in _wrap(document.location, 12, width, 2):
+        line(b"F1", 12, part, 16)
+    line(b"F2", 14, document.owner_name, 30)
+    content.append(b"ET")
+
+    qr_y = MARGIN + 28
+    content.append(_qr(document.token, (PAGE_WIDTH - QR_SIZE) / 2, qr_y, QR_SIZE))
+    content += [
+        b"BT",
+        b"/F1 8 Tf 1 0 0 1 %d %d Tm %s Tj"
+        % (MARGIN, MARGIN, _text(f"Ticket {document.ticket_id}")),
+        b"ET",
+    ]
+    return _document(b"\n".join(content), version_comment(document.ticket_id, version))
+
+
+def cache_path(ticket_id: UUID) -> str:
+    return os.path.join(
+        PDF_CACHE_DIR, ticket_id.hex[:2], ticket_id.hex[2:4], f"{ticket_id}.pdf"
+    )
+
+
+def cached_ticket(ticket_id: UUID, version: datetime) -> bytes | None:
+    # None when the ticket was never rendered or the event changed since
+    try:
+        with open(cache_path(ticket_id), "rb") as file:
+            content = file.read()
+    except FileNotFoundError:
+        return None
+    if not content.startswith(HEADER + version_comment(ticket_id, version)):
+        return None
+    return content
+
+
+def store_ticket(ticket_id: UUID, content: bytes):
+    path = cache_path(ticket_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # readers never see a partly written file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+
+_pool: ProcessPoolExecutor | None = None
+# renders in flight, so concurrent downloads of one ticket render it once
+_rendering: dict[tuple[UUID, datetime], asyncio.Future] = {}
+
+
+def pool() -> ProcessPoolExecutor:
+    # Forking a process that runs threads and holds database connections is
+    # unsafe, workers start from a clean interpreter instead.
+    global _pool
+    if _pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        if "forkserver" in methods:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__, "segno"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=context)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def render_cached(document: TicketDocument, version: datetime) -> bytes:
+    key = (document.ticket_id, version)
+    if key in _rendering:
+        return await asyncio.shield(_rendering[key])
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(pool(), render_ticket, document, version)
+    _rendering[key] = future
+    try:
+        # a cancelled download does not cancel the render other callers wait on
+        content = await asyncio.shield(future)
+        await loop.run_in_executor(None, store_ticket, document.ticket_id, content)
+    finally:
+        del _rendering[key]
+    return content
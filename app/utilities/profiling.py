@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Generator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    statements: list[str] = field(default_factory=list)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.statements.append(statement)
+
+
+# stats of the request being served, set by QueryStatsMiddleware
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "request_query_stats", default=None
+)
+# process wide counters used by tests (TestClient serves requests on another thread)
+_global_stats: list[QueryStats] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_query_started_at", None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    for stats in _global_stats:
+        stats.record(statement, elapsed)
+
+
+@contextmanager
+def track_queries() -> Generator[QueryStats, None, None]:
+    stats = QueryStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+@contextmanager
+def count_queries() -> Generator[QueryStats, None, None]:
+    stats = QueryStats()
+    _global_stats.append(stats)
+    try:
+        yield stats
+    finally:
+        _global_stats.remove(stats)
+
+
+def server_timing(stats: QueryStats, total_ms: float) -> str:
+    return (
+        f'db;dur={stats.duration_ms:.2f};desc="{stats.count} queries", '
+        f"app;dur={total_ms:.2f}"
+    )
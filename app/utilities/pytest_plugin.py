@@ -0,0 +1,29 @@
+# Enable with `pytest_plugins = ["app.utilities.pytest_plugin"]` in conftest.py
+from contextlib import contextmanager
+import pytest
+from app.utilities.profiling import count_queries
+
+
+@pytest.fixture
+def query_budget():
+    """Fail the test when the wrapped block runs more than `max_queries` queries.
+
+    with query_budget(3):
+        client.get("/events/event", params={"event_id": event_id})
+    """
+
+    @contextmanager
+    def budget(max_queries: int):
+        with count_queries() as stats:
+            yield stats
+        if stats.count > max_queries:
+            statements = "\n".join(
+                f"  {i}. {statement}" for i, statement in enumerate(stats.statements, 1)
+            )
+            pytest.fail(
+                f"Query budget exceeded: {stats.count} queries "
+                f"(budget {max_queries})\n{statements}",
+                pytrace=False,
+            )
+
+    return budget
@@ -0,0 +1,12 @@
+from uuid import UUID
+
+
+def save_ticket_qr(ticket_id: UUID, token: str) -> str:
+    # the QR code holds the signed ticket token, see app/utilities/tokens.py;
+    # segno is imported on first use to keep it out of cold starts
+    import segno
+
+    path = f"qrcodes/{ticket_id}.png"
+    qr: segno.QRCode = segno.make(token)
+    qr.save(path, scale=7.5)
+    return path
@@ -0,0 +1,199 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import getenv
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    limit: int
+    period: float
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+
+def parse_rate_limit(value: Optional[str]) -> Optional[RateLimit]:
+    # "120/minute"; empty or a limit of 0 disables the limit
+    if not value:
+        return None
+    count, _, period = value.partition("/")
+    if int(count) <= 0:
+        return None
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rate limit period in {value!r}")
+    return RateLimit(int(count), PERIODS[period])
+
+
+# per client IP on every public route
+RATE_LIMIT_PUBLIC = parse_rate_limit(getenv("RATE_LIMIT_PUBLIC", "120/minute"))
+# per client IP on booking and waitlist requests
+RATE_LIMIT_BOOKING = parse_rate_limit(getenv("RATE_LIMIT_BOOKING", "10/minute"))
+# per event on booking and waitlist requests, whatever the client
+RATE_LIMIT_EVENT_BOOKING = parse_rate_limit(
+    getenv("RATE_LIMIT_EVENT_BOOKING", "600/minute")
+)
+RATE_LIMIT_STORE = getenv("RATE_LIMIT_STORE", "")
+RATE_LIMIT_MAX_KEYS = int(getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    # seconds until the bucket is full again
+    reset: float
+    retry_after: float = 0
+
+
+# The bucket is kept as a single number, the time at which it would be full
+# again (GCRA). Every request moves it one interval forward; a request that
+# would move it more than one period ahead of now is rejected.
+def _decide(limit: RateLimit, tat: float, now: float) -> tuple[Decision, float]:
+    tat = max(tat, now)
+    new_tat = tat + limit.interval
+    allow_at = new_tat - limit.period
+    if allow_at > now:
+        return Decision(False, limit.limit, 0, tat - now, allow_at - now), tat
+    remaining = int((now - allow_at) / limit.interval + 1e-9)
+    return Decision(True, limit.limit, remaining, new_tat - now), new_tat
+
+
+class RateLimitStore(ABC):
+    # Every bucket of a request is checked at once and updated only when all
+    # of them allow it, so a rejected request takes nothing from the others.
+    @abstractmethod
+    async def hit(self, limits: list[tuple[str, RateLimit]]) -> list[Decision]: ...
+
+
+class MemoryStore(RateLimitStore):
+    # Per worker. Only the event loop touches it, so no lock is needed. Once
+    # full, the key hit least recently is dropped, which at worst gives that
+    # client a fresh bucket.
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, float] = OrderedDict()
+
+    async def hit(self, limits: list[tuple[str, RateLimit]]) -> list[Decision]:
+        now = time.monotonic()
+        results = [
+            _decide(limit, self.buckets.get(key, now), now) for key, limit in limits
+        ]
+        if all(decision.allowed for decision, _ in results):
+            for (key, _), (_, tat) in zip(limits, results):
+                self.buckets[key] = tat
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return [decision for decision, _ in results]
+
+
+# Same algorithm as _decide for every key, atomic in Redis and on the Redis
+# clock so every worker shares the buckets. ARGV holds interval and period of
+# each key in turn. Numbers are returned as strings, Redis would truncate them
+# to integers.
+REDIS_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local decisions = {}
+local new_tats = {}
+local allowed = true
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local period = tonumber(ARGV[2 * i])
+    local tat = math.max(tonumber(redis.call('GET', key) or now), now)
+    local new_tat = tat + interval
+    local allow_at = new_tat - period
+    if allow_at > now then
+        allowed = false
+        decisions[i] = {0, tostring(tat - now), tostring(allow_at - now)}
+    else
+        new_tats[i] = new_tat
+        decisions[i] = {1, tostring(new_tat - now), tostring(now - allow_at)}
+    end
+end
+if allowed then
+    for i, key in ipairs(KEYS) do
+        local ttl = math.ceil((new_tats[i] - now) * 1000)
+        redis.call('SET', key, tostring(new_tats[i]), 'PX', ttl)
+    end
+end
+return decisions
+"""
+
+
+class RedisStore(RateLimitStore):
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        # optional dependency, only needed with a redis:// RATE_LIMIT_STORE
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(url)
+        self.script = self.redis.register_script(REDIS_SCRIPT)
+        self.prefix = prefix
+
+    async def hit(self, limits: list[tuple[str, RateLimit]]) -> list[Decision]:
+        results = await self.script(
+            keys=[self.prefix + key for key, _ in limits],
+            args=[
+                value for _, limit in limits for value in (limit.interval, limit.period)
+            ],
+        )
+        decisions = []
+        for (_, limit), (allowed, reset, slack) in zip(limits, results):
+            reset, slack = float(reset), float(slack)
+            if not allowed:
+                decisions.append(Decision(False, limit.limit, 0, reset, slack))
+            else:
+                remaining = int(slack / limit.interval + 1e-9)
+                decisions.append(Decision(True, limit.limit, remaining, reset))
+        return decisions
+
+
+def create_store(url: str = RATE_LIMIT_STORE) -> RateLimitStore:
+    if not url:
+        return MemoryStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE {url!r}")
+
+
+async def check(
+    store: RateLimitStore, limits: list[tuple[str, RateLimit]]
+) -> Optional[Decision]:
+    # Returns the most restrictive decision, None when nothing is limited.
+    # A shared store that is down lets requests through rather than taking the
+    # public pages down with it.
+    if not limits:
+        return None
+    try:
+        decisions = await store.hit(limits)
+    except Exception:
+        logger.exception("Rate limit store failed")
+        return None
+    rejected = [decision for decision in decisions if not decision.allowed]
+    if rejected:
+        return max(rejected, key=lambda decision: decision.retry_after)
+    return min(decisions, key=lambda decision: decision.remaining)
+
+
+def rate_limit_headers(decision: Decision) -> dict[str, str]:
+    headers = {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(max(int(decision.reset + 0.999), 0)),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(int(decision.retry_after + 0.999), 1))
+    return headers
@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from os import getenv
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import and_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from app.models import (
+    Event,
+    EventStatus,
+    ReminderCheckpoint,
+    Ticket,
+    TicketStatus,
+)
+from app.utilities.mail import CONNECTION_ERRORS, EmailSender
+from app.utilities.metrics import EMAIL_BACKLOG
+from app.utilities.tokens import cancel_url
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+UNITS = {"m": 1, "h": 60, "d": 1440}
+
+
+def parse_offsets(value: str) -> list[int]:
+    # "24h,1h" -> [1440, 60] minutes, largest first
+    offsets = set()
+    for part in value.split(","):
+        part = part.strip()
+        if part:
+            offsets.add(int(part[:-1]) * UNITS[part[-1]])
+    return sorted(offsets, reverse=True)
+
+
+REMINDER_OFFSETS = parse_offsets(getenv("REMINDER_OFFSETS", "24h,1h"))
+REMINDER_BATCH_SIZE = int(getenv("REMINDER_BATCH_SIZE", "500"))
+REMINDER_INTERVAL_SECONDS = int(getenv("REMINDER_INTERVAL_SECONDS", "60"))
+
+
+def describe_offset(minutes: int) -> str:
+    for unit, size in (("day", 1440), ("hour", 60), ("minute", 1)):
+        if minutes % size == 0:
+            count = minutes // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+
+
+def due_events(db: Session, offset: int, smaller_offset: int, now: datetime) -> list:
+    # Events starting within the offset but not yet within the next smaller
+    # one, so an event created an hour before it starts only gets the last
+    # reminder. A range scan of the start_date index; finished checkpoints
+    # are skipped with an anti join.
+    return db.exec(
+        select(Event.id, Event.name, Event.location, Event.start_date)
+        .outerjoin(
+            ReminderCheckpoint,
+            and_(
+                ReminderCheckpoint.event_id == Event.id,
+                ReminderCheckpoint.offset_minutes == offset,
+            ),
+        )
+        .where(Event.start_date > now + timedelta(minutes=smaller_offset))
+        .where(Event.start_date <= now + timedelta(minutes=offset))
+        .where(Event.status == EventStatus.SCHEDULED)
+        .where(Event.archived_at.is_(None))
+        .where(ReminderCheckpoint.completed_at.is_(None))
+        .order_by(Event.start_date)
+    ).all()
+
+
+def lock_checkpoint(
+    db: Session, event_id: UUID, offset: int
+) -> ReminderCheckpoint | None:
+    # None when another scheduler holds it
+    statement = (
+        select(ReminderCheckpoint)
+        .where(ReminderCheckpoint.event_id == event_id)
+        .where(ReminderCheckpoint.offset_minutes == offset)
+        .with_for_update(skip_locked=True)
+        .execution_options(populate_existing=True)
+    )
+    checkpoint = db.exec(statement).first()
+    if checkpoint is not None:
+        return checkpoint
+    try:
+        db.add(ReminderCheckpoint(event_id=event_id, offset_minutes=offset))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    return db.exec(statement).first()
+
+
+def next_batch(
+    db: Session, event_id: UUID, offset: int, batch_size: int
+) -> tuple[ReminderCheckpoint | None, list[tuple[UUID, str, str]]]:
+    # Locks the checkpoint and reads the next batch of tickets. The lock is
+    # held while the batch is sent, finish_batch moves the cursor and commits.
+    checkpoint = lock_checkpoint(db, event_id, offset)
+    if checkpoint is None or checkpoint.completed_at is not None:
+        db.rollback()
+        return checkpoint, []
+    statement = (
+        select(Ticket.id, Ticket.owner_email, Ticket.owner_name)
+        .where(Ticket.event_id == event_id)
+        .where(Ticket.status == TicketStatus.accepted)
+        .order_by(Ticket.id)
+        .limit(batch_size)
+    )
+    if checkpoint.last_ticket_id is not None:
+        statement = statement.where(Ticket.id > checkpoint.last_ticket_id)
+    tickets = db.exec(statement).all()
+    if not tickets:
+        checkpoint.completed_at = datetime.now()
+        checkpoint.updated_at = datetime.now()
+        db.commit()
+    return checkpoint, tickets
+
+
+def finish_batch(
+    db: Session,
+    checkpoint: ReminderCheckpoint,
+    tickets: list[tuple[UUID, str, str]],
+    handled: int,
+    sent: int,
+):
+    # the cursor moves past the first handled tickets only, the rest of the
+    # batch is sent again by the next pass
+    if handled:
+        checkpoint.last_ticket_id = tickets[handled - 1][0]
+    checkpoint.sent += sent
+    checkpoint.updated_at = datetime.now()
+    db.commit()
+
+
+async def send_event_reminders(
+    db: Session,
+    sender: EmailSender,
+    connection,
+    event,
+    offset: int,
+    batch_size: int = REMINDER_BATCH_SIZE,
+) -> int:
+    # event is a row of due_events
+    event_id, event_name, location, start_date = event
+    shared = {
+        "event_name": event_name,
+        "location": location or "Online",
+        "date": start_date.strftime("%Y-%m-%d %H:%M"),
+        "starts_in": describe_offset(offset),
+    }
+    sent = 0
+    while True:
+        checkpoint, tickets = next_batch(db, event_id, offset, batch_size)
+        if not tickets:
+            return sent
+        messages = sender.render_batch(
+            [
+                (email, {"name": name, "cancel_url": cancel_url(ticket_id)})
+                for ticket_id, email, name in tickets
+            ],
+            f"Reminder: {event_name} starts in {shared['starts_in']}",
+            "reminder.html",
+            **shared,
+        )
+        EMAIL_BACKLOG.inc(len(messages))
+        handled = batch_sent = 0
+        try:
+            for message in messages:
+                batch_sent += await sender.deliver_one(
+                    connection, message, "reminder.html"
+                )
+                handled += 1
+        except CONNECTION_ERRORS:
+            sender.abandon("reminder.html", len(messages) - handled - 1)
+            raise
+        finally:
+            finish_batch(db, checkpoint, tickets, handled, batch_sent)
+        sent += batch_sent
+
+
+async def send_due_reminders(
+    engine: Engine,
+    offsets: list[int] = REMINDER_OFFSETS,
+    batch_size: int = REMINDER_BATCH_SIZE,
+    now: datetime | None = None,
+) -> int:
+    # One pass over every offset; all batches share one SMTP connection,
+    # which is only opened when something is due.
+    now = now or datetime.now()
+    sent = 0
+    sender = None
+    connection = None
+    async with AsyncExitStack() as stack:
+        db = stack.enter_context(Session(engine))
+        for index, offset in enumerate(offsets):
+            smaller = offsets[index + 1] if index + 1 < len(offsets) else 0
+            events = due_events(db, offset, smaller, now)
+            # checkpoints are locked in transactions of their own
+            db.rollback()
+            for event in events:
+                if connection is None:
+                    sender = EmailSender()
+                    connection = await stack.enter_async_context(sender.connect())
+                sent += await send_event_reminders(
+                    db, sender, connection, event, offset, batch_size
+                )
+    return sent
+
+
+async def run_scheduler(engine: Engine, interval: int = REMINDER_INTERVAL_SECONDS):
+    while True:
+        try:
+            sent = await send_due_reminders(engine)
+            if sent:
+                logger.info("Sent %s reminders", sent)
+        except Exception:
+            logger.exception("Reminder pass failed")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Email attendees before their events start"
+    )
+    parser.add_argument("--once", action="store_true", help="send what is due and exit")
+    parser.add_argument("--interval", type=int, default=REMINDER_INTERVAL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.database import engine
+
+    if args.once:
+        print(f"Sent {asyncio.run(send_due_reminders(engine))} reminders")
+        return
+    asyncio.run(run_scheduler(engine, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import typing
+from functools import lru_cache
+from typing import Any
+import orjson
+from fastapi import Response
+from pydantic import AliasChoices, AliasPath, BaseModel
+
+_MISSING = object()
+
+
+@lru_cache(maxsize=None)
+def _plan(model: type[BaseModel]) -> tuple:
+    # for every field: its name, the attribute paths it can be read from and
+    # the response model of nested objects
+    plan = []
+    for name, field in model.model_fields.items():
+        alias = field.validation_alias
+        choices = alias.choices if isinstance(alias, AliasChoices) else [alias]
+        paths = tuple(
+            tuple(choice.path) if isinstance(choice, AliasPath) else (name,)
+            for choice in choices
+        )
+        nested = field.annotation
+        if typing.get_origin(nested) is list:
+            nested = typing.get_args(nested)[0]
+        if not (isinstance(nested, type) and issubclass(nested, BaseModel)):
+            nested = None
+        plan.append((name, paths, nested))
+    return tuple(plan)
+
+
+def _lookup(obj: Any, path: tuple[str, ...]) -> Any:
+    for attribute in path:
+        obj = getattr(obj, attribute, _MISSING)
+        if obj is _MISSING or obj is None:
+            break
+    return obj
+
+
+def _row_dict(plan: tuple, obj: Any) -> dict:
+    # loaded columns of an ORM row live in its __dict__; reading them there
+    # skips the attribute descriptors, expired or unloaded ones still go
+    # through getattr
+    loaded = obj.__dict__
+    content = {}
+    for name, paths, nested in plan:
+        value = None
+        for path in paths:
+            found = loaded.get(path[0], _MISSING) if len(path) == 1 else _MISSING
+            if found is _MISSING:
+                found = _lookup(obj, path)
+            if found is not _MISSING:
+                value = found
+                break
+        content[name] = (
+            orm_dict(nested, value) if nested and value is not None else value
+        )
+    return content
+
+
+def orm_dict(model: type[BaseModel], obj: Any) -> Any:
+    # Reads the fields of `model` straight from ORM rows. The values come typed
+    # from the database, so they are not validated again.
+    if obj is None:
+        return None
+    if isinstance(obj, list):
+        if (
+            obj
+            and isinstance(obj[0], BaseModel)
+            and not hasattr(obj[0], "_sa_instance_state")
+        ):
+            return [item.model_dump() for item in obj]
+        plan = _plan(model)
+        return [_row_dict(plan, item) for item in obj]
+    if isinstance(obj, BaseModel) and not hasattr(obj, "_sa_instance_state"):
+        return obj.model_dump()
+    return _row_dict(_plan(model), obj)
+
+
+def model_response(
+    model: type[BaseModel],
+    content: Any,
+    status_code: int = 200,
+    headers: dict | None = None,
+) -> Response:
+    # Returning a Response skips the validation and encoding FastAPI does for
+    # `response_model`, which stays declared on the route for the OpenAPI schema.
+    return json_response(orm_dict(model, content), status_code, headers)
+
+
+def json_response(
+    content: Any, status_code: int = 200, headers: dict | None = None
+) -> Response:
+    # content made of plain values, e.g. assembled from orm_dict results
+    return Response(
+        content=orjson.dumps(content),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,147 @@
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import column, func, inspect, literal_column, or_, and_, table, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from app.models import Event
+from app.utilities.lifecycle import PUBLIC_STATUSES, UPCOMING_STATUSES
+
+# Must stay identical to the expression of the ix_event_search index, otherwise
+# Postgres cannot use the index.
+DOCUMENT = (
+    "to_tsvector('english', coalesce(event.name, '') || ' ' || "
+    "coalesce(event.description, '') || ' ' || coalesce(event.location, ''))"
+)
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_event_search ON event USING gin (({DOCUMENT}))",
+    "CREATE INDEX IF NOT EXISTS ix_event_name_trgm ON event "
+    "USING gin (name gin_trgm_ops)",
+]
+
+# TEST mode fallback: an FTS5 table kept in sync with event by triggers
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE event_fts USING fts5("
+    "event_id UNINDEXED, name, description, location)",
+    "CREATE TRIGGER event_fts_insert AFTER INSERT ON event BEGIN "
+    "INSERT INTO event_fts (event_id, name, description, location) "
+    "VALUES (new.id, new.name, new.description, new.location); END",
+    "CREATE TRIGGER event_fts_delete AFTER DELETE ON event BEGIN "
+    "DELETE FROM event_fts WHERE event_id = old.id; END",
+    "CREATE TRIGGER event_fts_update AFTER UPDATE OF name, description, location "
+    "ON event BEGIN "
+    "DELETE FROM event_fts WHERE event_id = old.id; "
+    "INSERT INTO event_fts (event_id, name, description, location) "
+    "VALUES (new.id, new.name, new.description, new.location); END",
+    "INSERT INTO event_fts (event_id, name, description, location) "
+    "SELECT id, name, description, location FROM event",
+]
+
+event_fts = table("event_fts", column("event_id"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def create_search_index(engine: Engine):
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        statements = POSTGRES_DDL
+    elif dialect == "sqlite":
+        if inspect(engine).has_table("event_fts"):
+            return
+        statements = SQLITE_DDL
+    else:
+        return
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def encode_cursor(rank: float, event_id: UUID) -> str:
+    raw = json.dumps([rank, str(event_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, event_id = json.loads(raw)
+        return float(rank), UUID(event_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def _fts5_query(q: str) -> str:
+    # quote every word so user input cannot use FTS5 syntax; prefix match the rest
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _ranked_ids(db: Session, q: str):
+    if db.get_bind().dialect.name == "postgresql":
+        query = func.websearch_to_tsquery(literal_column("'english'"), q)
+        rank = func.ts_rank_cd(literal_column(DOCUMENT), query) + func.similarity(
+            Event.name, q
+        )
+        return select(Event.id.label("id"), rank.label("rank")).where(
+            or_(literal_column(DOCUMENT).op("@@")(query), Event.name.op("%")(q))
+        )
+    # bm25 is lower for better matches; weight name over location over description
+    rank = -func.bm25(literal_column("event_fts"), 0.0, 10.0, 2.0, 5.0)
+    return (
+        select(Event.id.label("id"), rank.label("rank"))
+        .join(event_fts, event_fts.c.event_id == Event.id)
+        .where(text("event_fts MATCH :match").bindparams(match=_fts5_query(q)))
+    )
+
+
+def search_events(
+    db: Session,
+    q: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    upcoming: bool = True,
+) -> tuple[list[tuple[Event, float]], Optional[str]]:
+    if db.get_bind().dialect.name == "sqlite" and not _fts5_query(q):
+        return [], None
+
+    ranked = _ranked_ids(db, q)
+    if upcoming:
+        # both served by ix_event_status_start; the status alone lags behind
+        # when the lifecycle job is late or not running
+        ranked = ranked.where(Event.status.in_(UPCOMING_STATUSES)).where(
+            Event.start_date > datetime.now()
+        )
+    else:
+        ranked = ranked.where(Event.status.in_(PUBLIC_STATUSES))
+    ranked = ranked.subquery()
+
+    statement = (
+        select(Event, ranked.c.rank)
+        .join(ranked, ranked.c.id == Event.id)
+        .order_by(ranked.c.rank.desc(), ranked.c.id)
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor)
+        statement = statement.where(
+            or_(
+                ranked.c.rank < last_rank,
+                and_(ranked.c.rank == last_rank, ranked.c.id > last_id),
+            )
+        )
+
+    rows = db.exec(statement).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        event, rank = rows[-1]
+        next_cursor = encode_cursor(rank, event.id)
+    return rows, next_cursor
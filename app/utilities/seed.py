@@ -0,0 +1,411 @@
+import argparse
+import csv
+import io
+import random
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection, Engine
+from app.models import (
+    AttendeesLog,
+    Event,
+    Organization,
+    Ticket,
+    User,
+    UserOrganizationRole,
+)
+
+# Synthetic data for performance work. Postgres is loaded with COPY, other
+# databases with executemany; rows are generated and written in chunks so
+# memory stays flat however large the dataset is.
+CHUNK_SIZE = 50_000
+# every 20th ticket of an event is declined
+DECLINED_EVERY = 20
+
+
+@dataclass
+class Scale:
+    users: int
+    organizations: int
+    events_per_organization: int
+    tickets: int
+    attendee_logs: int
+    members_per_organization: int = 3
+    # a few events take a large share of all tickets, the rest follow a
+    # long tail
+    huge_events: int = 3
+    huge_share: float = 0.3
+
+
+SCALES = {
+    "small": Scale(1_000, 100, 10, 10_000, 100_000),
+    "medium": Scale(10_000, 1_000, 10, 100_000, 1_000_000),
+    "large": Scale(100_000, 10_000, 10, 1_000_000, 10_000_000),
+}
+
+
+@dataclass
+class GeneratedOrganization:
+    id: uuid.UUID
+    owner_email: str
+    event_ids: list[uuid.UUID] = field(default_factory=list)
+    upcoming_event_ids: list[uuid.UUID] = field(default_factory=list)
+
+
+@dataclass
+class Dataset:
+    tag: str
+    organizations: list[GeneratedOrganization]
+    huge_event_ids: list[uuid.UUID]
+    rows: dict[str, int]
+
+
+def user_email(tag: str, index: int) -> str:
+    return f"user{index}.{tag}@example.com"
+
+
+class _Writer:
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.rows: dict[str, int] = {}
+
+    def write(self, table: Table, columns: tuple[str, ...], rows: list[tuple]):
+        if not rows:
+            return
+        self.connection.execute(
+            table.insert(), [dict(zip(columns, row)) for row in rows]
+        )
+        self.rows[table.name] = self.rows.get(table.name, 0) + len(rows)
+
+
+class _CopyWriter(_Writer):
+    # Values are written with str(): enums are passed as their names, None
+    # becomes an empty unquoted field, which COPY reads as NULL.
+    def write(self, table: Table, columns: tuple[str, ...], rows: list[tuple]):
+        if not rows:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        preparer = self.connection.dialect.identifier_preparer
+        statement = (
+            f"COPY {preparer.format_table(table)}"
+            f" ({', '.join(preparer.quote(column) for column in columns)})"
+            " FROM STDIN WITH (FORMAT csv)"
+        )
+        cursor = self.connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        finally:
+            cursor.close()
+        self.rows[table.name] = self.rows.get(table.name, 0) + len(rows)
+
+
+def _writer(connection: Connection) -> _Writer:
+    if connection.dialect.name == "postgresql":
+        return _CopyWriter(connection)
+    return _Writer(connection)
+
+
+def _ticket_counts(rng: random.Random, scale: Scale, events: int) -> list[int]:
+    huge = min(scale.huge_events, events)
+    huge_total = int(scale.tickets * scale.huge_share) if huge else 0
+    counts = [0] * events
+    for index in range(huge):
+        counts[index] = huge_total // huge + (index < huge_total % huge)
+    rest = scale.tickets - sum(counts)
+    weights = [rng.paretovariate(1.5) for _ in range(events - huge)]
+    total_weight = sum(weights) or 1
+    for index, weight in enumerate(weights, start=huge):
+        counts[index] = int(rest * weight / total_weight)
+    # rounding leftovers go to the tail, one each
+    leftover = scale.tickets - sum(counts)
+    for index in range(leftover):
+        counts[huge + index % max(events - huge, 1)] += 1
+    return counts
+
+
+def generate(engine: Engine, scale: Scale, seed: int = 0) -> Dataset:
+    rng = random.Random(seed)
+    tag = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+    now = datetime.now()
+    event_count = scale.organizations * scale.events_per_organization
+    ticket_counts = _ticket_counts(rng, scale, event_count)
+    # huge events are spread over random organizations
+    rng.shuffle(ticket_counts)
+    huge_indexes = set(
+        sorted(range(event_count), key=ticket_counts.__getitem__, reverse=True)[
+            : scale.huge_events
+        ]
+    )
+
+    with engine.begin() as connection:
+        writer = _writer(connection)
+        started = time.perf_counter()
+
+        user_ids = [
+            uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(scale.users)
+        ]
+        columns = ("id", "created_at", "updated_at", "name", "email", "image_url")
+        for start in range(0, scale.users, CHUNK_SIZE):
+            writer.write(
+                User.__table__,
+                columns,
+                [
+                    (user_ids[i], now, now, f"User {i}", user_email(tag, i), None)
+                    for i in range(start, min(start + CHUNK_SIZE, scale.users))
+                ],
+            )
+
+        organizations = []
+        organization_rows = []
+        role_rows = []
+        for i in range(scale.organizations):
+            owner = i % scale.users
+            organization = GeneratedOrganization(
+                id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                owner_email=user_email(tag, owner),
+            )
+            organizations.append(organization)
+            tenant = str(organization.id)
+            organization_rows.append(
+                (
+                    organization.id,
+                    now,
+                    now,
+                    f"Organization {i}",
+                    user_ids[owner],
+                    organization.owner_email,
+                )
+            )
+            role_rows.append(
+                (
+                    uuid.uuid4(),
+                    now,
+                    now,
+                    tenant,
+                    user_ids[owner],
+                    organization.id,
+                    "creator",
+                )
+            )
+            members = rng.sample(
+                range(scale.users), min(scale.members_per_organization + 1, scale.users)
+            )
+            for member in [m for m in members if m != owner][
+                : scale.members_per_organization
+            ]:
+                role_rows.append(
+                    (
+                        uuid.uuid4(),
+                        now,
+                        now,
+                        tenant,
+                        user_ids[member],
+                        organization.id,
+                        rng.choice(("admin", "staff")),
+                    )
+                )
+        writer.write(
+            Organization.__table__,
+            ("id", "created_at", "updated_at", "name", "owner", "contact_email"),
+            organization_rows,
+        )
+        writer.write(
+            UserOrganizationRole.__table__,
+            (
+                "id",
+                "created_at",
+                "updated_at",
+                "tenant_id",
+                "user_id",
+                "organization_id",
+                "user_role",
+            ),
+            role_rows,
+        )
+
+        # events, a year in the past to a year ahead
+        events = []
+        event_rows = []
+        event_columns = (
+            "id",
+            "created_at",
+            "updated_at",
+            "tenant_id",
+            "name",
+            "description",
+            "status",
+            "start_date",
+            "end_date",
+            "location",
+            "max_tickets",
+            "tickets_booked",
+            "organization_id",
+        )
+        for index in range(event_count):
+            organization = organizations[index // scale.events_per_organization]
+            event_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            start_date = now + timedelta(minutes=rng.randint(-525_600, 525_600))
+            end_date = start_date + timedelta(hours=rng.choice((2, 4, 8, 48)))
+            count = ticket_counts[index]
+            booked = count - count // DECLINED_EVERY
+            # as app.utilities.lifecycle would have left them
+            if rng.random() < 0.1:
+                status = "PENDING"
+            elif end_date <= now:
+                status = "FINISHED"
+            elif start_date <= now:
+                status = "ONGOING"
+            else:
+                status = "SCHEDULED"
+            organization.event_ids.append(event_id)
+            if status == "SCHEDULED":
+                organization.upcoming_event_ids.append(event_id)
+            events.append((event_id, str(organization.id), start_date, count))
+            event_rows.append(
+                (
+                    event_id,
+                    now,
+                    now,
+                    str(organization.id),
+                    f"Event {index}",
+                    f"Synthetic event {index} of organization {organization.id}",
+                    status,
+                    start_date,
+                    end_date,
+                    rng.choice(("Cairo", "Giza", "Alexandria", None)),
+                    0 if index in huge_indexes else booked + rng.randint(0, 50),
+                    booked,
+                    organization.id,
+                )
+            )
+            if len(event_rows) == CHUNK_SIZE:
+                writer.write(Event.__table__, event_columns, event_rows)
+                event_rows = []
+        writer.write(Event.__table__, event_columns, event_rows)
+
+        # attendee logs are spread evenly over the accepted tickets
+        accepted = sum(count - count // DECLINED_EVERY for *_, count in events)
+        logs_per_ticket, extra_logs = divmod(scale.attendee_logs, max(accepted, 1))
+        ticket_columns = (
+            "id",
+            "created_at",
+            "updated_at",
+            "tenant_id",
+            "event_id",
+            "status",
+            "owner_email",
+            "owner_name",
+        )
+        log_columns = (
+            "id",
+            "created_at",
+            "updated_at",
+            "tenant_id",
+            "event_id",
+            "ticket_id",
+            "status",
+        )
+        ticket_rows = []
+        log_rows = []
+        ticket_number = 0
+        accepted_number = 0
+
+        def flush():
+            # tickets first, logs reference them
+            writer.write(Ticket.__table__, ticket_columns, ticket_rows)
+            writer.write(AttendeesLog.__table__, log_columns, log_rows)
+            ticket_rows.clear()
+            log_rows.clear()
+
+        for event_id, tenant, start_date, count in events:
+            booked_at = start_date - timedelta(days=30)
+            for position in range(count):
+                ticket_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+                declined = position % DECLINED_EVERY == DECLINED_EVERY - 1
+                ticket_rows.append(
+                    (
+                        ticket_id,
+                        booked_at,
+                        booked_at,
+                        tenant,
+                        event_id,
+                        "declined" if declined else "accepted",
+                        f"attendee{ticket_number}.{tag}@example.com",
+                        f"Attendee {ticket_number}",
+                    )
+                )
+                ticket_number += 1
+                if declined:
+                    continue
+                logs = logs_per_ticket + (accepted_number < extra_logs)
+                accepted_number += 1
+                logged_at = start_date
+                for entry in range(logs):
+                    logged_at += timedelta(minutes=rng.randint(1, 90))
+                    log_rows.append(
+                        (
+                            uuid.UUID(int=rng.getrandbits(128), version=4),
+                            logged_at,
+                            logged_at,
+                            tenant,
+                            event_id,
+                            ticket_id,
+                            "joined" if entry % 2 == 0 else "left",
+                        )
+                    )
+                if len(ticket_rows) >= CHUNK_SIZE or len(log_rows) >= CHUNK_SIZE:
+                    flush()
+        flush()
+
+    return Dataset(
+        tag=tag,
+        organizations=organizations,
+        huge_event_ids=[events[index][0] for index in sorted(huge_indexes)],
+        rows={**writer.rows, "seconds": round(time.perf_counter() - started, 1)},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk load synthetic users, organizations, events, tickets "
+        "and attendee logs"
+    )
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--organizations", type=int)
+    parser.add_argument("--events-per-organization", type=int)
+    parser.add_argument("--tickets", type=int)
+    parser.add_argument("--attendee-logs", type=int)
+    parser.add_argument("--members-per-organization", type=int)
+    parser.add_argument("--huge-events", type=int)
+    parser.add_argument(
+        "--huge-share", type=float, help="share of all tickets held by huge events"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    overrides = {
+        name: value
+        for name, value in vars(args).items()
+        if name not in ("scale", "seed") and value is not None
+    }
+    scale = replace(SCALES[args.scale], **overrides)
+
+    from app.database import engine, init_db
+
+    init_db()
+    dataset = generate(engine, scale, args.seed)
+    for table, rows in dataset.rows.items():
+        print(f"{table:<22} {rows}")
+    print(f"user emails: user<n>.{dataset.tag}@example.com")
+    print(
+        "huge events:", ", ".join(str(event_id) for event_id in dataset.huge_event_ids)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import event, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session, with_loader_criteria
+from app.models import (
+    AttendeesLog,
+    Event,
+    Invitation,
+    Ticket,
+    TenantModel,
+    UserOrganizationRole,
+    WaitlistEntry,
+    Webhook,
+    WebhookDelivery,
+)
+
+# The tenant is the organization. Users are shared by every organization they
+# belong to, so User rows are never scoped.
+ORGANIZATION_SCOPED = (
+    Event,
+    Invitation,
+    UserOrganizationRole,
+    Webhook,
+    WebhookDelivery,
+)
+EVENT_SCOPED = (Ticket, AttendeesLog, WaitlistEntry)
+TENANT_SCOPED = ORGANIZATION_SCOPED + EVENT_SCOPED
+
+
+def set_tenant(db: Session, organization_id: UUID | str):
+    db.info["tenant_id"] = str(organization_id)
+
+
+def get_tenant(db: Session) -> Optional[str]:
+    return db.info.get("tenant_id")
+
+
+def tenant_of(db: Session, obj: TenantModel) -> Optional[str]:
+    if isinstance(obj, ORGANIZATION_SCOPED):
+        return str(obj.organization_id) if obj.organization_id else None
+    if isinstance(obj, EVENT_SCOPED) and obj.event_id:
+        with db.no_autoflush:
+            parent = db.get(Event, obj.event_id)
+        if parent is not None:
+            return parent.tenant_id or str(parent.organization_id)
+    return None
+
+
+@event.listens_for(Session, "before_flush")
+def _fill_tenant_id(session, flush_context, instances):
+    for obj in session.new:
+        if isinstance(obj, TENANT_SCOPED) and obj.tenant_id is None:
+            obj.tenant_id = tenant_of(session, obj) or get_tenant(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _scope_to_tenant(state: ORMExecuteState):
+    tenant_id = get_tenant(state.session)
+    if (
+        tenant_id is None
+        or state.is_column_load
+        or state.is_relationship_load
+        or state.execution_options.get("all_tenants", False)
+        or not (state.is_select or state.is_update or state.is_delete)
+    ):
+        return
+    state.statement = state.statement.options(
+        *(
+            with_loader_criteria(
+                model, lambda cls: cls.tenant_id == tenant_id, include_aliases=True
+            )
+            for model in TENANT_SCOPED
+        )
+    )
+
+
+def backfill_tenants(engine: Engine):
+    # Rows written before tenants were tracked. Organization-owned rows are
+    # updated per organization so the value matches str(organization_id) on
+    # every dialect; event-owned rows copy the tenant of their event.
+    with Session(engine) as db:
+        for model in ORGANIZATION_SCOPED:
+            organization_ids = db.scalars(
+                select(model.organization_id)
+                .where(model.tenant_id.is_(None))
+                .distinct()
+            ).all()
+            for organization_id in organization_ids:
+                db.execute(
+                    update(model)
+                    .where(model.organization_id == organization_id)
+                    .where(model.tenant_id.is_(None))
+                    .values(tenant_id=str(organization_id)),
+                    execution_options={"synchronize_session": False},
+                )
+        for model in EVENT_SCOPED:
+            db.execute(
+                update(model)
+                .where(model.tenant_id.is_(None))
+                .values(
+                    tenant_id=select(Event.tenant_id)
+                    .where(Event.id == model.event_id)
+                    .scalar_subquery()
+                ),
+                execution_options={"synchronize_session": False},
+            )
+        db.commit()
+
+
+def partition_statements(
+    table: str, large_tenants: list[str], hash_partitions: int
+) -> list[str]:
+    # Postgres only. Every large tenant gets its own LIST partition, everybody
+    # else shares a DEFAULT partition sub-partitioned by hash, so scans of a
+    # small tenant never touch a large tenant's rows or indexes. The primary key
+    # has to include the partition key, so foreign keys pointing at the table
+    # cannot be kept.
+    tenants = [str(UUID(tenant)) for tenant in large_tenants]
+    old = f"{table}_unpartitioned"
+    statements = [
+        f"ALTER TABLE {table} RENAME TO {old}",
+        f"ALTER TABLE {old} ALTER COLUMN tenant_id SET NOT NULL",
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        " PARTITION BY LIST (tenant_id)",
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_new_pkey"
+        " PRIMARY KEY (id, tenant_id)",
+    ]
+    for tenant in tenants:
+        statements.append(
+            f"CREATE TABLE {table}_t_{tenant.replace('-', '')} PARTITION OF {table}"
+            f" FOR VALUES IN ('{tenant}')"
+        )
+    statements.append(
+        f"CREATE TABLE {table}_shared PARTITION OF {table} DEFAULT"
+        " PARTITION BY HASH (tenant_id)"
+    )
+    for remainder in range(hash_partitions):
+        statements.append(
+            f"CREATE TABLE {table}_shared_{remainder} PARTITION OF {table}_shared"
+            f" FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})"
+        )
+    statements += [
+        f"ALTER TABLE {table} ADD FOREIGN KEY (event_id) REFERENCES event (id)",
+        f"CREATE INDEX ix_{table}_tenant_event_new ON {table} (tenant_id, event_id)",
+        f"INSERT INTO {table} SELECT * FROM {old}",
+        f"DROP TABLE {old} CASCADE",
+        f"ALTER TABLE {table} RENAME CONSTRAINT {table}_new_pkey TO {table}_pkey",
+        f"ALTER INDEX ix_{table}_tenant_event_new RENAME TO ix_{table}_tenant_event",
+    ]
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tenant maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill", help="fill tenant_id of existing rows")
+    partition = commands.add_parser(
+        "partition", help="partition ticket and attendeeslog by tenant (Postgres)"
+    )
+    partition.add_argument("--large-tenant", action="append", default=[])
+    partition.add_argument("--hash-partitions", type=int, default=8)
+    partition.add_argument(
+        "--apply", action="store_true", help="run the statements instead of printing"
+    )
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    if args.command == "backfill":
+        backfill_tenants(engine)
+        return
+
+    # attendeeslog first: its foreign key references ticket
+    statements = [
+        "ALTER TABLE attendeeslog DROP CONSTRAINT IF EXISTS attendeeslog_ticket_id_fkey"
+    ]
+    for table in ("attendeeslog", "ticket"):
+        statements += partition_statements(
+            table, args.large_tenant, args.hash_partitions
+        )
+    if not args.apply:
+        print(";\n".join(statements) + ";")
+        return
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+
+
+if __name__ == "__main__":
+    main()
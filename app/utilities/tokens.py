@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import hmac
+import struct
+from dataclasses import dataclass
+from datetime import datetime
+from os import getenv
+from uuid import UUID
+
+SECRET_KEY = getenv("SECRET_KEY")
+
+# Ticket tokens: kid, ticket id and event id, then a truncated HMAC-SHA256 of
+# all of it. 49 bytes, 66 base64 characters. A ticket is valid until its event
+# ends, checked against the event's current end date, so editing the event
+# never invalidates tokens already sent.
+TICKET_TOKEN = struct.Struct(">B16s16s")
+SIGNATURE_SIZE = 16
+
+
+class InvalidTicketToken(ValueError):
+    pass
+
+
+@dataclass
+class TicketClaims:
+    ticket_id: UUID
+    event_id: UUID
+
+
+def _signing_keys() -> dict[int, bytes]:
+    # "2:new-secret,1:old-secret"; the first key signs, all of them verify, so
+    # a key is rotated by prepending a new one and dropping the old one once
+    # its tokens expired
+    value = getenv("TICKET_SIGNING_KEYS")
+    if not value:
+        return {0: SECRET_KEY.encode()}
+    keys = {}
+    for item in value.split(","):
+        kid, secret = item.strip().split(":", 1)
+        keys[int(kid)] = secret.encode()
+    return keys
+
+
+SIGNING_KEYS = _signing_keys()
+ACTIVE_KID = next(iter(SIGNING_KEYS))
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _sign(purpose: str, value: str, key: bytes | None = None) -> str:
+    digest = hmac.new(
+        key or SIGNING_KEYS[ACTIVE_KID], f"{purpose}:{value}".encode(), hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+
+def _verify(purpose: str, value: str, token: str) -> bool:
+    # links carry no kid, every key of the ring is tried
+    return any(
+        hmac.compare_digest(_sign(purpose, value, key), token)
+        for key in SIGNING_KEYS.values()
+    )
+
+
+def cancel_token(ticket_id: UUID) -> str:
+    return _sign("cancel", str(ticket_id))
+
+
+def verify_cancel_token(ticket_id: UUID, token: str) -> bool:
+    return _verify("cancel", str(ticket_id), token)
+
+
+def cancel_url(ticket_id: UUID) -> str:
+    return (
+        f"{getenv('CLIENT_URL')}/tickets/{ticket_id}/cancel"
+        f"?token={cancel_token(ticket_id)}"
+    )
+
+
+def pdf_token(ticket_id: UUID) -> str:
+    return _sign("pdf", str(ticket_id))
+
+
+def verify_pdf_token(ticket_id: UUID, token: str) -> bool:
+    return _verify("pdf", str(ticket_id), token)
+
+
+def pdf_url(ticket_id: UUID) -> str:
+    return (
+        f"{getenv('CLIENT_URL')}/tickets/{ticket_id}/pdf"
+        f"?token={pdf_token(ticket_id)}"
+    )
+
+
+def ticket_token(ticket_id: UUID, event_id: UUID) -> str:
+    # the same for every copy of a ticket, emailed or in the PDF
+    payload = TICKET_TOKEN.pack(ACTIVE_KID, ticket_id.bytes, event_id.bytes)
+    signature = hmac.new(SIGNING_KEYS[ACTIVE_KID], payload, hashlib.sha256).digest()
+    return _b64encode(payload + signature[:SIGNATURE_SIZE])
+
+
+def verify_ticket_token(token: str) -> TicketClaims:
+    # signature only; see check_ticket_window
+    try:
+        raw = _b64decode(token)
+    except ValueError:
+        raise InvalidTicketToken("Invalid ticket token")
+    if len(raw) != TICKET_TOKEN.size + SIGNATURE_SIZE:
+        raise InvalidTicketToken("Invalid ticket token")
+    payload, signature = raw[: TICKET_TOKEN.size], raw[TICKET_TOKEN.size :]
+    kid, ticket_id, event_id = TICKET_TOKEN.unpack(payload)
+    key = SIGNING_KEYS.get(kid)
+    if key is None:
+        raise InvalidTicketToken("Invalid ticket token")
+    expected = hmac.new(key, payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+    if not hmac.compare_digest(expected, signature):
+        raise InvalidTicketToken("Invalid ticket token")
+    return TicketClaims(ticket_id=UUID(bytes=ticket_id), event_id=UUID(bytes=event_id))
+
+
+def check_ticket_window(end_date: datetime, now: datetime | None = None):
+    # end_date of the event as it is now, not when the ticket was issued
+    if (now or datetime.now()) > end_date:
+        raise InvalidTicketToken("Ticket has expired")
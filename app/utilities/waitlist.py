@@ -0,0 +1,150 @@
+from os import getenv
+from uuid import UUID
+from fastapi import BackgroundTasks
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+from app.models import (
+    Event,
+    Ticket,
+    TicketStatus,
+    WaitlistEntry,
+    WaitlistStatus,
+    WebhookEvent,
+)
+from app.utilities.capacity import reserve_seats, seats_available
+from app.utilities.mail import EmailSender
+from app.utilities.qr import save_ticket_qr
+from app.utilities.tokens import cancel_url, pdf_url, ticket_token
+from app.utilities.webhooks import enqueue, ticket_payload
+
+PROMOTION_BATCH_SIZE = int(getenv("WAITLIST_PROMOTION_BATCH_SIZE", "500"))
+
+
+def lock_event(db: Session, event_id: UUID) -> Event | None:
+    # Bookings and promotions of an event are serialized on its row, so the
+    # capacity check and the insert of the new tickets cannot interleave.
+    return db.exec(
+        select(Event)
+        .where(Event.id == event_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).first()
+
+
+def waitlist_position(db: Session, entry: WaitlistEntry) -> int:
+    return db.exec(
+        select(func.count())
+        .select_from(WaitlistEntry)
+        .where(WaitlistEntry.event_id == entry.event_id)
+        .where(WaitlistEntry.status == WaitlistStatus.waiting)
+        .where(WaitlistEntry.created_at <= entry.created_at)
+    ).one()
+
+
+def promote_waitlist(
+    db: Session, event_id: UUID, batch_size: int = PROMOTION_BATCH_SIZE
+) -> tuple[int, list[Ticket]]:
+    # Turns the head of the waitlist into tickets while seats are free and
+    # returns the number of entries taken off the list with the new tickets.
+    # The caller commits, which releases the event lock.
+    event = lock_event(db, event_id)
+    if event is None:
+        return 0, []
+    free = batch_size
+    if event.max_tickets != 0:
+        free = min(batch_size, seats_available(event))
+    if free <= 0:
+        return 0, []
+
+    entries: list[WaitlistEntry] = db.exec(
+        select(WaitlistEntry)
+        .where(WaitlistEntry.event_id == event_id)
+        .where(WaitlistEntry.status == WaitlistStatus.waiting)
+        .order_by(WaitlistEntry.created_at, WaitlistEntry.id)
+        .limit(free)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not entries:
+        return 0, []
+
+    # people who booked on their own while waiting keep their ticket
+    booked = set(
+        db.exec(
+            select(Ticket.owner_email)
+            .where(Ticket.event_id == event_id)
+            .where(Ticket.owner_email.in_([entry.email for entry in entries]))
+        ).all()
+    )
+    tickets = [
+        Ticket(
+            event_id=event_id,
+            owner_email=entry.email,
+            owner_name=entry.name,
+            status=TicketStatus.accepted,
+        )
+        for entry in entries
+        if entry.email not in booked
+    ]
+    if tickets and not reserve_seats(db, event_id, len(tickets)):
+        return 0, []
+    db.add_all(tickets)
+    db.execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.id.in_([entry.id for entry in entries]))
+        .values(status=WaitlistStatus.promoted),
+        execution_options={"synchronize_session": False},
+    )
+    return len(entries), tickets
+
+
+def promote_and_notify(
+    db: Session, event: Event, background_tasks: BackgroundTasks
+) -> int:
+    # one transaction and one email batch per promotion batch
+    event_name = event.name
+    location = event.location or "Online"
+    date = event.start_date.strftime("%Y-%m-%d")
+    event_id = event.id
+    organization_id = event.organization_id
+    promoted = 0
+    email_sender = EmailSender()
+    while True:
+        try:
+            processed, tickets = promote_waitlist(db, event_id)
+            recipients = [
+                (
+                    ticket.owner_email,
+                    {
+                        "name": ticket.owner_name,
+                        "cancel_url": cancel_url(ticket.id),
+                        "pdf_url": pdf_url(ticket.id),
+                    },
+                    [save_ticket_qr(ticket.id, ticket_token(ticket.id, event_id))],
+                )
+                for ticket in tickets
+            ]
+            if tickets:
+                enqueue(
+                    db,
+                    organization_id,
+                    WebhookEvent.ticket_booked,
+                    [ticket_payload(ticket) for ticket in tickets],
+                )
+            db.commit()
+        except:
+            db.rollback()
+            raise
+        if not processed:
+            return promoted
+        if not tickets:
+            continue
+        promoted += len(tickets)
+        email_sender.send_batch_background(
+            background_tasks,
+            recipients,
+            "Ticket Confirmation",
+            "ticket.html",
+            event_name=event_name,
+            location=location,
+            date=date,
+        )
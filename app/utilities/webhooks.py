@@ -0,0 +1,463 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import random
+import secrets
+import socket
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv
+from urllib.parse import urlsplit
+from uuid import UUID
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import literal, update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from app.models import (
+    DeliveryStatus,
+    Event,
+    Invitation,
+    Ticket,
+    Webhook,
+    WebhookDelivery,
+    WebhookEvent,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# deliveries claimed per pass, and sent per request to one endpoint
+WEBHOOK_CLAIM_SIZE = int(getenv("WEBHOOK_CLAIM_SIZE", "500"))
+WEBHOOK_BATCH_SIZE = int(getenv("WEBHOOK_BATCH_SIZE", "50"))
+# requests in flight per endpoint
+WEBHOOK_ENDPOINT_CONCURRENCY = int(getenv("WEBHOOK_ENDPOINT_CONCURRENCY", "2"))
+WEBHOOK_TIMEOUT_SECONDS = float(getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(getenv("WEBHOOK_MAX_ATTEMPTS", "10"))
+WEBHOOK_BACKOFF_SECONDS = float(getenv("WEBHOOK_BACKOFF_SECONDS", "30"))
+WEBHOOK_MAX_BACKOFF_SECONDS = float(getenv("WEBHOOK_MAX_BACKOFF_SECONDS", "21600"))
+WEBHOOK_POLL_SECONDS = float(getenv("WEBHOOK_POLL_SECONDS", "2"))
+# endpoints on private networks, localhost included, are refused unless set,
+# e.g. to try the local receiver out
+WEBHOOK_ALLOW_PRIVATE_URLS = getenv("WEBHOOK_ALLOW_PRIVATE_URLS", "0") == "1"
+# how old a signature a receiver accepts
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+TIMESTAMP_HEADER = "X-Webhook-Timestamp"
+
+
+def new_secret() -> str:
+    return secrets.token_urlsafe(32)
+
+
+class UnsafeWebhookURL(ValueError):
+    pass
+
+
+def public_address(address: str) -> bool:
+    # false for private, loopback, link-local (cloud metadata services at
+    # 169.254.169.254), shared, reserved and multicast addresses
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve(url: str) -> list[str]:
+    # The addresses of the url's host, checked when a webhook is registered
+    # and again before every request, since DNS can change in between.
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, port, type=socket.SOCK_STREAM
+        )
+    except (socket.gaierror, UnicodeError) as error:
+        raise UnsafeWebhookURL("Webhook host could not be resolved") from error
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not WEBHOOK_ALLOW_PRIVATE_URLS and not all(
+        public_address(address) for address in addresses
+    ):
+        raise UnsafeWebhookURL("Webhook host is not a public address")
+    return addresses
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    message = str(timestamp).encode() + b"." + body
+    return "v1=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(
+    secret: str,
+    timestamp: str,
+    signature: str,
+    body: bytes,
+    tolerance: int = SIGNATURE_TOLERANCE_SECONDS,
+) -> bool:
+    # for receivers; the timestamp is signed too, so old requests cannot be
+    # replayed
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(sign(secret, int(timestamp), body), signature or "")
+
+
+def ticket_payload(ticket: Ticket) -> dict:
+    return {
+        "id": ticket.id,
+        "event_id": ticket.event_id,
+        "status": ticket.status,
+        "owner_email": ticket.owner_email,
+        "owner_name": ticket.owner_name,
+        "created_at": ticket.created_at,
+    }
+
+
+def invitation_payload(invitation: Invitation, email: str) -> dict:
+    return {
+        "id": invitation.id,
+        "organization_id": invitation.organization_id,
+        "user_id": invitation.user_id,
+        "email": email,
+        "role": invitation.role,
+    }
+
+
+def event_payload(event: Event) -> dict:
+    return {
+        "id": event.id,
+        "organization_id": event.organization_id,
+        "name": event.name,
+        "description": event.description,
+        "status": event.status,
+        "start_date": event.start_date,
+        "end_date": event.end_date,
+        "location": event.location,
+        "max_tickets": event.max_tickets,
+        "updated_at": event.updated_at,
+    }
+
+
+def enqueue(
+    db: Session,
+    organization_id: UUID,
+    event_type: WebhookEvent,
+    payloads: list[dict],
+) -> int:
+    # Adds one delivery per subscribed webhook and payload to the caller's
+    # transaction, so they are only sent if the change itself is committed.
+    webhook_ids = db.exec(
+        select(Webhook.id)
+        .where(Webhook.organization_id == organization_id)
+        .where(Webhook.active)
+        # whole values only, events is comma separated
+        .where(
+            literal(",")
+            .concat(Webhook.events)
+            .concat(",")
+            .contains(f",{event_type.value},", autoescape=True)
+        )
+    ).all()
+    for webhook_id in webhook_ids:
+        db.add_all(
+            WebhookDelivery(
+                webhook_id=webhook_id,
+                organization_id=organization_id,
+                tenant_id=str(organization_id),
+                event_type=event_type.value,
+                payload=orjson.dumps(payload).decode(),
+            )
+            for payload in payloads
+        )
+    return len(webhook_ids) * len(payloads)
+
+
+def backoff(attempts: int) -> timedelta:
+    # exponential with jitter, so failed endpoints are not hit in lockstep
+    delay = min(
+        WEBHOOK_BACKOFF_SECONDS * 2 ** (attempts - 1), WEBHOOK_MAX_BACKOFF_SECONDS
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def request_body(deliveries: list[WebhookDelivery]) -> bytes:
+    return orjson.dumps(
+        {
+            "deliveries": [
+                {
+                    "id": delivery.id,
+                    "type": delivery.event_type,
+                    "created_at": delivery.created_at,
+                    "data": orjson.loads(delivery.payload),
+                }
+                for delivery in deliveries
+            ]
+        }
+    )
+
+
+class WebhookDispatcher:
+    def __init__(self, engine: Engine, client=None):
+        import httpx
+
+        self.engine = engine
+        self.client = client or httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT_SECONDS)
+        self.semaphores: dict[UUID, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(WEBHOOK_ENDPOINT_CONCURRENCY)
+        )
+
+    def claim(self, db: Session) -> list[WebhookDelivery]:
+        # Claimed rows are leased: pushed into the future past the request
+        # timeout, so a crashed dispatcher's deliveries are retried and
+        # concurrent dispatchers skip them.
+        now = datetime.now()
+        deliveries = db.exec(
+            select(WebhookDelivery)
+            .where(WebhookDelivery.status == DeliveryStatus.pending)
+            .where(WebhookDelivery.next_attempt_at <= now)
+            .order_by(WebhookDelivery.next_attempt_at)
+            .limit(WEBHOOK_CLAIM_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        lease = now + timedelta(seconds=WEBHOOK_TIMEOUT_SECONDS * 3)
+        for delivery in deliveries:
+            delivery.next_attempt_at = lease
+        db.commit()
+        return deliveries
+
+    async def post(self, webhook: Webhook, deliveries: list[WebhookDelivery]):
+        # Returns None on success, the error otherwise. Errors are kept on the
+        # deliveries and shown to the organization, so they only name the
+        # kind of failure; the details are logged.
+        import httpx
+
+        try:
+            addresses = await resolve(webhook.url)
+        except UnsafeWebhookURL as error:
+            logger.warning("Webhook %s refused: %s", webhook.url, error)
+            return str(error)
+        body = request_body(deliveries)
+        timestamp = int(time.time())
+        url = httpx.URL(webhook.url)
+        headers = {
+            "Content-Type": "application/json",
+            # the request goes to the address that was checked, not to
+            # whatever the name resolves to next
+            "Host": url.netloc.decode("ascii"),
+            TIMESTAMP_HEADER: str(timestamp),
+            SIGNATURE_HEADER: sign(webhook.secret, timestamp, body),
+        }
+        extensions = {"sni_hostname": url.host} if url.scheme == "https" else {}
+        async with self.semaphores[webhook.id]:
+            try:
+                response = await self.client.post(
+                    url.copy_with(host=addresses[0]),
+                    content=body,
+                    headers=headers,
+                    extensions=extensions,
+                )
+            except httpx.TimeoutException:
+                logger.warning("Webhook %s timed out", webhook.url, exc_info=True)
+                return "Timeout"
+            except httpx.TransportError:
+                logger.warning("Webhook %s unreachable", webhook.url, exc_info=True)
+                return "Connection failed"
+            except Exception:
+                logger.exception("Webhook %s request failed", webhook.url)
+                return "Request failed"
+        if 200 <= response.status_code < 300:
+            return None
+        logger.warning("Webhook %s answered %s", webhook.url, response.status_code)
+        return f"HTTP {response.status_code}"
+
+    def record(
+        self, db: Session, webhook: Webhook, deliveries: list[WebhookDelivery], error
+    ):
+        now = datetime.now()
+        ids = [delivery.id for delivery in deliveries]
+        if error is None:
+            db.execute(
+                update(Webhook)
+                .where(Webhook.id == webhook.id)
+                .where(Webhook.failures > 0)
+                .values(failures=0),
+                execution_options={"synchronize_session": False},
+            )
+            db.execute(
+                update(WebhookDelivery)
+                .where(WebhookDelivery.id.in_(ids))
+                .values(
+                    status=DeliveryStatus.delivered,
+                    attempts=WebhookDelivery.attempts + 1,
+                    delivered_at=now,
+                    updated_at=now,
+                    last_error=None,
+                ),
+                execution_options={"synchronize_session": False},
+            )
+            return
+        # an endpoint that keeps failing is turned off, its queued deliveries
+        # are dropped by the next pass
+        db.execute(
+            update(Webhook)
+            .where(Webhook.id == webhook.id)
+            .values(failures=Webhook.failures + 1),
+            execution_options={"synchronize_session": False},
+        )
+        db.execute(
+            update(Webhook)
+            .where(Webhook.id == webhook.id)
+            .where(Webhook.failures >= WEBHOOK_MAX_ATTEMPTS)
+            .values(active=False, updated_at=now),
+            execution_options={"synchronize_session": False},
+        )
+        # a batch holds deliveries of different ages, each keeps its own count
+        for delivery in deliveries:
+            attempts = delivery.attempts + 1
+            values = {"attempts": attempts, "last_error": error, "updated_at": now}
+            if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                values["status"] = DeliveryStatus.failed
+            else:
+                values["next_attempt_at"] = now + backoff(attempts)
+            db.execute(
+                update(WebhookDelivery)
+                .where(WebhookDelivery.id == delivery.id)
+                .values(**values),
+                execution_options={"synchronize_session": False},
+            )
+
+    async def dispatch(self) -> int:
+        # one pass: claim, send every endpoint's batches concurrently, record
+        with Session(self.engine, expire_on_commit=False) as db:
+            deliveries = self.claim(db)
+            if not deliveries:
+                return 0
+            webhooks = {
+                webhook.id: webhook
+                for webhook in db.exec(
+                    select(Webhook).where(
+                        Webhook.id.in_({d.webhook_id for d in deliveries})
+                    )
+                ).all()
+            }
+            # no transaction is held open while the requests are in flight
+            db.commit()
+
+            by_webhook = defaultdict(list)
+            for delivery in deliveries:
+                by_webhook[delivery.webhook_id].append(delivery)
+            batches = []
+            for webhook_id, pending in by_webhook.items():
+                webhook = webhooks.get(webhook_id)
+                if webhook is None or not webhook.active:
+                    db.execute(
+                        update(WebhookDelivery)
+                        .where(WebhookDelivery.id.in_([d.id for d in pending]))
+                        .values(
+                            status=DeliveryStatus.failed,
+                            last_error="Webhook disabled",
+                            updated_at=datetime.now(),
+                        ),
+                        execution_options={"synchronize_session": False},
+                    )
+                    continue
+                for start in range(0, len(pending), WEBHOOK_BATCH_SIZE):
+                    batches.append(
+                        (webhook, pending[start : start + WEBHOOK_BATCH_SIZE])
+                    )
+
+            errors = await asyncio.gather(
+                *(self.post(webhook, batch) for webhook, batch in batches)
+            )
+            for (webhook, batch), error in zip(batches, errors):
+                self.record(db, webhook, batch, error)
+            db.commit()
+            return len(deliveries)
+
+    async def run(self, poll: float = WEBHOOK_POLL_SECONDS):
+        while True:
+            try:
+                sent = await self.dispatch()
+            except Exception:
+                logger.exception("Webhook dispatch failed")
+                sent = 0
+            # a full claim means there is a backlog
+            if sent < WEBHOOK_CLAIM_SIZE:
+                await asyncio.sleep(poll)
+
+
+def receiver(secret: str, fail_rate: float = 0.0):
+    # Local endpoint for trying webhooks out: checks signatures, prints the
+    # deliveries and fails a share of the requests to exercise retries.
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(
+                secret,
+                self.headers.get(TIMESTAMP_HEADER),
+                self.headers.get(SIGNATURE_HEADER),
+                body,
+            ):
+                self.send_response(401)
+            elif random.random() < fail_rate:
+                self.send_response(503)
+            else:
+                for delivery in orjson.loads(body)["deliveries"]:
+                    print(
+                        delivery["type"],
+                        delivery["id"],
+                        orjson.dumps(delivery["data"]).decode(),
+                    )
+                self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook delivery")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dispatch = commands.add_parser("dispatch", help="send queued deliveries")
+    dispatch.add_argument("--once", action="store_true", help="one pass and exit")
+    receive = commands.add_parser("receive", help="run a local test receiver")
+    receive.add_argument("--secret", required=True)
+    receive.add_argument("--port", type=int, default=8001)
+    receive.add_argument(
+        "--fail-rate", type=float, default=0.0, help="share of requests answered 503"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "receive":
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", args.port), receiver(args.secret, args.fail_rate)
+        )
+        print(f"Listening on http://127.0.0.1:{args.port}/")
+        if not WEBHOOK_ALLOW_PRIVATE_URLS:
+            print("Set WEBHOOK_ALLOW_PRIVATE_URLS=1 to register and send to it")
+        server.serve_forever()
+        return
+
+    from app.database import engine
+
+    dispatcher = WebhookDispatcher(engine)
+    if args.once:
+        print(f"Dispatched {asyncio.run(dispatcher.dispatch())} deliveries")
+        return
+    asyncio.run(dispatcher.run())
+
+
+if __name__ == "__main__":
+    main()
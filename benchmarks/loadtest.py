@@ -0,0 +1,430 @@
+# End-to-end load test. Concurrent clients drive a mix of public event views,
+# bookings, organizer listings and invitation flows. Throughput and p50/p95/p99
+# latency are reported per endpoint and saved to benchmarks/results/<commit>.json.
+#
+#   python -m benchmarks.loadtest                          # in process, SQLite
+#   python -m benchmarks.loadtest --mode DEVELOPMENT       # in process, DB_* Postgres
+#   python -m benchmarks.loadtest --url http://localhost:8000 --secret $SECRET_KEY
+#   python -m benchmarks.loadtest --compare <commit>
+#   python -m benchmarks.loadtest --dataset medium        # on top of bulk loaded data
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import httpx
+from benchmarks.nextauth import COOKIE_NAME, session_token
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+WORDS = ["python", "music", "startup", "design", "security", "data", "games", "cloud"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    # nearest rank on sorted values
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, secret: str, seed: int):
+        self.client = client
+        self.secret = secret
+        self.random = random.Random(seed)
+        # unique per run, so runs against a long lived server do not collide
+        self.run_id = uuid.uuid4().hex[:8]
+        self.tokens: dict[str, str] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        # (organizer email, organization id, event ids)
+        self.organizations: list[tuple[str, str, list[str]]] = []
+        self.events: list[tuple[str, str]] = []
+
+    def email(self, kind: str) -> str:
+        return f"{kind}-{self.run_id}-{uuid.uuid4().hex[:12]}@example.com"
+
+    def auth(self, email: str) -> dict[str, str]:
+        if email not in self.tokens:
+            self.tokens[email] = session_token(email, email.split("@")[0], self.secret)
+        return {"Cookie": f"{COOKIE_NAME}={self.tokens[email]}"}
+
+    async def call(
+        self, label: str, method: str, url: str, expected=(200,), **kwargs
+    ) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.latencies[label].append(time.perf_counter() - started)
+        if response is None or response.status_code not in expected:
+            self.errors[label] += 1
+            return None
+        return response
+
+    async def setup(self, organizers: int, events_per_organizer: int):
+        start = datetime.now() + timedelta(days=30)
+        for _ in range(organizers):
+            email = self.email("organizer")
+            headers = self.auth(email)
+            response = await self.call(
+                "POST /organizations/",
+                "POST",
+                "/organizations/",
+                json={"name": f"Benchmark {self.run_id}", "contact_email": email},
+                headers=headers,
+            )
+            if response is None:
+                raise RuntimeError("Could not create an organization, check --secret")
+            organization_id = response.json()["id"]
+            event_ids = []
+            for i in range(events_per_organizer):
+                response = await self.call(
+                    "POST /events/",
+                    "POST",
+                    "/events/",
+                    json={
+                        "name": f"{self.random.choice(WORDS)} meetup {i}",
+                        "description": " ".join(self.random.choices(WORDS, k=12)),
+                        "location": "Cairo",
+                        "start_date": (start + timedelta(days=i)).isoformat(),
+                        "end_date": (start + timedelta(days=i, hours=4)).isoformat(),
+                        "max_tickets": 0,
+                        "orgId": organization_id,
+                    },
+                    headers=headers,
+                )
+                event_ids.append(response.json()["id"])
+                self.events.append((email, event_ids[-1]))
+            self.organizations.append((email, organization_id, event_ids))
+
+    def use_dataset(self, dataset):
+        # organizations of app.utilities.seed, only upcoming events can be booked
+        for organization in dataset.organizations:
+            event_ids = [str(event_id) for event_id in organization.upcoming_event_ids]
+            if not event_ids:
+                continue
+            self.organizations.append(
+                (organization.owner_email, str(organization.id), event_ids)
+            )
+            self.events += [
+                (organization.owner_email, event_id) for event_id in event_ids
+            ]
+
+    async def view_event(self):
+        _, event_id = self.random.choice(self.events)
+        await self.call(
+            "GET /events/event", "GET", "/events/event", params={"event_id": event_id}
+        )
+
+    async def view_reservation(self):
+        _, event_id = self.random.choice(self.events)
+        await self.call(
+            "GET /reservation/{event_id}", "GET", f"/reservation/{event_id}"
+        )
+
+    async def search(self):
+        await self.call(
+            "GET /events/search",
+            "GET",
+            "/events/search",
+            params={"q": self.random.choice(WORDS)},
+        )
+
+    async def book(self):
+        _, event_id = self.random.choice(self.events)
+        await self.call(
+            "POST /reservation/{event_id}",
+            "POST",
+            f"/reservation/{event_id}",
+            json={"name": "Attendee", "email": self.email("attendee")},
+        )
+
+    async def organizer_events(self):
+        email, organization_id, _ = self.random.choice(self.organizations)
+        await self.call(
+            "GET /events/",
+            "GET",
+            "/events/",
+            params={"org_id": organization_id},
+            headers=self.auth(email),
+        )
+
+    async def organizer_tickets(self):
+        email, event_id = self.random.choice(self.events)
+        await self.call(
+            "GET /tickets/",
+            "GET",
+            "/tickets/",
+            params={"event_id": event_id},
+            headers=self.auth(email),
+        )
+
+    async def organizer_organizations(self):
+        email, _, _ = self.random.choice(self.organizations)
+        await self.call(
+            "GET /organizations/", "GET", "/organizations/", headers=self.auth(email)
+        )
+
+    async def invitation_flow(self):
+        organizer, organization_id, _ = self.random.choice(self.organizations)
+        member = self.email("member")
+        # the first authenticated request signs the member up
+        await self.call(
+            "GET /invitations/", "GET", "/invitations/", headers=self.auth(member)
+        )
+        invited = await self.call(
+            "POST /invitations/organizations/{organization_id}",
+            "POST",
+            f"/invitations/organizations/{organization_id}",
+            expected=(201,),
+            json={"email": member},
+            headers=self.auth(organizer),
+        )
+        if invited is None:
+            return
+        response = await self.call(
+            "GET /invitations/", "GET", "/invitations/", headers=self.auth(member)
+        )
+        if response is None or not response.json():
+            return
+        await self.call(
+            "PUT /invitations/{invitation_id}",
+            "PUT",
+            f"/invitations/{response.json()[0]['id']}",
+            expected=(204,),
+            json={"status": "accepted"},
+            headers=self.auth(member),
+        )
+
+    MIX = [
+        (view_event, 25),
+        (view_reservation, 15),
+        (search, 10),
+        (book, 15),
+        (organizer_events, 10),
+        (organizer_tickets, 10),
+        (organizer_organizations, 5),
+        (invitation_flow, 10),
+    ]
+
+    async def run(self, operations: int, concurrency: int) -> float:
+        self.latencies.clear()
+        self.errors.clear()
+        scenarios = [scenario for scenario, _ in self.MIX]
+        weights = [weight for _, weight in self.MIX]
+        remaining = operations
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await self.random.choices(scenarios, weights)[0](self)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            milliseconds = sorted(value * 1000 for value in values)
+            endpoints[label] = {
+                "requests": len(milliseconds),
+                "errors": self.errors[label],
+                "throughput": len(milliseconds) / elapsed,
+                "p50": percentile(milliseconds, 50),
+                "p95": percentile(milliseconds, 95),
+                "p99": percentile(milliseconds, 99),
+            }
+        requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+        return {
+            "elapsed": elapsed,
+            "requests": requests,
+            "throughput": requests / elapsed,
+            "endpoints": endpoints,
+        }
+
+
+@asynccontextmanager
+async def in_process_client(mode: str):
+    # The app is imported here, after its environment is set up, and runs in
+    # a scratch directory so the SQLite file and QR codes stay out of the tree.
+    directory = tempfile.TemporaryDirectory()
+    os.environ["MODE"] = mode
+    defaults = {
+        "SECRET_KEY": "benchmark",
+        "NEXTAUTH_URL": "http://localhost:3000",
+        "CLIENT_URL": "http://localhost:3000",
+        "MAIL_USERNAME": "benchmark",
+        "MAIL_PASSWORD": "benchmark",
+        "MAIL_FROM": "benchmark@example.com",
+        "MAIL_PORT": "25",
+        "MAIL_SERVER": "localhost",
+        "MAIL_SUPPRESS_SEND": "1",
+        # every simulated client shares one address
+        "RATE_LIMIT_PUBLIC": "0",
+        "RATE_LIMIT_BOOKING": "0",
+        "RATE_LIMIT_EVENT_BOOKING": "0",
+        "TEMPLATE_FOLDER": str(ROOT / "app" / "utilities" / "templates"),
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    cwd = os.getcwd()
+    os.chdir(directory.name)
+    os.mkdir("qrcodes")
+    sys.path.insert(0, str(ROOT))
+    try:
+        from app.main import api
+
+        async with api.router.lifespan_context(api):
+            transport = httpx.ASGITransport(app=api)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://loadtest"
+            ) as client:
+                yield client, os.environ["SECRET_KEY"]
+    finally:
+        os.chdir(cwd)
+        directory.cleanup()
+
+
+@asynccontextmanager
+async def remote_client(url: str, secret: str):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        yield client, secret
+
+
+def git_commit() -> str:
+    def git(*args) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--untracked-files=no"):
+        commit += "-dirty"
+    return commit
+
+
+def print_summary(result: dict, baseline: dict | None = None):
+    print(
+        f"{result['requests']} requests in {result['elapsed']:.1f} s,"
+        f" {result['throughput']:.1f} req/s"
+        f" ({result['target']}, concurrency {result['concurrency']})"
+    )
+    header = f"{'endpoint':<50} {'n':>6} {'err':>4} {'req/s':>7}"
+    header += f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f"  vs {baseline['commit']}: {'p50':>7} {'p95':>7}"
+    print(header)
+    for label, stats in result["endpoints"].items():
+        line = (
+            f"{label:<50} {stats['requests']:>6} {stats['errors']:>4}"
+            f" {stats['throughput']:>7.1f} {stats['p50']:>8.1f}"
+            f" {stats['p95']:>8.1f} {stats['p99']:>8.1f}"
+        )
+        before = baseline["endpoints"].get(label) if baseline else None
+        if before:
+            line += " " * (len(baseline["commit"]) + 7)
+            for key in ("p50", "p95"):
+                line += f" {(stats[key] / before[key] - 1) * 100:>+6.0f}%"
+        print(line)
+
+
+def load_result(commit: str) -> dict:
+    matches = sorted(RESULTS_DIR.glob(f"{commit}*.json"))
+    if not matches:
+        raise SystemExit(f"No saved results for {commit} in {RESULTS_DIR}")
+    return json.loads(matches[-1].read_text())
+
+
+async def main_async(args):
+    if args.url:
+        client_context = remote_client(args.url, args.secret)
+        target = args.url
+    else:
+        client_context = in_process_client(args.mode)
+        target = f"in-process {args.mode}"
+
+    async with client_context as (client, secret):
+        load_test = LoadTest(client, secret, args.seed)
+        if args.dataset:
+            from app.database import engine
+            from app.utilities.seed import SCALES, generate
+
+            dataset = generate(engine, SCALES[args.dataset], args.seed)
+            print("dataset", ", ".join(f"{k} {v}" for k, v in dataset.rows.items()))
+            load_test.use_dataset(dataset)
+        await load_test.setup(args.organizers, args.events)
+        # warm up connections and caches, then measure
+        await load_test.run(args.warmup, args.concurrency)
+        elapsed = await load_test.run(args.requests, args.concurrency)
+        result = load_test.summary(elapsed)
+
+    result.update(
+        commit=git_commit(),
+        created_at=datetime.now().isoformat(timespec="seconds"),
+        target=target,
+        concurrency=args.concurrency,
+        seed=args.seed,
+        python=sys.version.split()[0],
+    )
+    baseline = load_result(args.compare) if args.compare else None
+    print_summary(result, baseline)
+    if not args.no_save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{result['commit']}.json"
+        path.write_text(json.dumps(result, indent=2))
+        print(f"saved {path.relative_to(ROOT)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test")
+    parser.add_argument("--url", help="server to test instead of the in-process app")
+    parser.add_argument(
+        "--secret",
+        default=os.getenv("SECRET_KEY"),
+        help="SECRET_KEY of the server, used to mint NextAuth session tokens",
+    )
+    parser.add_argument("--mode", choices=["TEST", "DEVELOPMENT"], default="TEST")
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=2000,
+        help="scenarios to run, the invitation flow makes four requests",
+    )
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--organizers", type=int, default=5)
+    parser.add_argument("--events", type=int, default=20, help="events per organizer")
+    parser.add_argument(
+        "--dataset",
+        choices=["small", "medium", "large"],
+        help="bulk load a synthetic dataset first (in process only)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="COMMIT", help="saved run to compare to")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    if args.url and not args.secret:
+        parser.error("--secret (or SECRET_KEY) is required with --url")
+    if args.url and args.dataset:
+        parser.error(
+            "--dataset loads the in-process database, seed a server with"
+            " python -m app.utilities.seed"
+        )
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
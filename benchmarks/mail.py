@@ -0,0 +1,81 @@
+# Building a mass mailing per recipient, as send_email_background does,
+# against EmailSender.render_batch, with a shared logo attachment:
+#   python -m benchmarks.mail [--recipients 5000] [--template reminder.html]
+# Needs the MAIL_* and TEMPLATE_FOLDER settings, nothing is sent.
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from app.utilities.mail import EmailSender
+
+SHARED = {
+    "event_name": "Benchmark Conference",
+    "location": "Online",
+    "date": "2030-01-01 10:00",
+    "starts_in": "1 day",
+}
+
+
+async def per_recipient(sender: EmailSender, recipients, template_name, logo):
+    from fastapi_mail import MessageSchema
+    from fastapi_mail.msg import MailMsg
+
+    template = sender.conf.template_engine().get_template(template_name)
+    messages = []
+    for email, context in recipients:
+        message = MessageSchema(
+            subject="Reminder",
+            recipients=[email],
+            subtype="html",
+            template_body=template.render(**SHARED, **context),
+            attachments=[logo],
+        )
+        messages.append(await MailMsg(message)._message(sender.sender()))
+    return messages
+
+
+def body(message) -> str:
+    return message.get_payload()[0].get_payload(decode=True).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=5000)
+    parser.add_argument("--template", default="reminder.html")
+    args = parser.parse_args()
+
+    recipients = [
+        (
+            f"attendee{i}@example.com",
+            # every tenth attendee has no cancel link
+            {"name": f"Attendee {i}", "cancel_url": i % 10 and f"https://x/{i}"},
+        )
+        for i in range(args.recipients)
+    ]
+    sender = EmailSender()
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as logo:
+        logo.write(os.urandom(20_000))
+    try:
+        started = time.perf_counter()
+        old = asyncio.run(per_recipient(sender, recipients, args.template, logo.name))
+        old_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        new = sender.render_batch(
+            recipients, "Reminder", args.template, [logo.name], **SHARED
+        )
+        new_elapsed = time.perf_counter() - started
+    finally:
+        os.unlink(logo.name)
+
+    assert all(body(a) == body(b) for a, b in zip(old, new)), "bodies differ"
+    for label, elapsed in (("per recipient", old_elapsed), ("batch", new_elapsed)):
+        print(
+            f"{label:>13}: {elapsed:.2f}s,"
+            f" {elapsed / args.recipients * 1e6:.0f} us per message"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# Mints NextAuth session cookies the way the frontend does, so benchmarks and
+# tests can authenticate without a browser. `secret` must be the SECRET_KEY of
+# the server under test.
+import json
+import time
+from cryptography.hazmat.primitives import hashes
+from fastapi_nextauth_jwt.operations import derive_key
+from jose import jwe
+
+COOKIE_NAME = "next-auth.session-token"
+
+
+def session_token(email: str, name: str, secret: str, lifetime: int = 24 * 3600) -> str:
+    key = derive_key(
+        secret, 32, b"", hashes.SHA256(), b"NextAuth.js Generated Encryption Key"
+    )
+    claims = {
+        "sub": email,
+        "email": email,
+        "name": name,
+        "picture": "",
+        "exp": int(time.time()) + lifetime,
+    }
+    return jwe.encrypt(
+        json.dumps(claims), key, algorithm="dir", encryption="A256GCM"
+    ).decode()
+
+
+def session_cookies(email: str, name: str, secret: str) -> dict[str, str]:
+    return {COOKIE_NAME: session_token(email, name, secret)}
@@ -0,0 +1,87 @@
+# Throughput of PDF ticket rendering: in process, on the process pool the
+# API uses, and when served from the disk cache:
+#   python -m benchmarks.pdf [--tickets 10000] [--workers 4]
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+from app.utilities import pdf
+from app.utilities.tokens import ticket_token
+
+
+def documents(count: int) -> list[pdf.TicketDocument]:
+    start = datetime(2030, 6, 1, 18, 0)
+    event_id = uuid4()
+    result = []
+    for i in range(count):
+        ticket_id = uuid4()
+        result.append(
+            pdf.TicketDocument(
+                ticket_id=ticket_id,
+                owner_name=f"Attendee {i}",
+                event_name="Benchmark Conference on Rendering Many Tickets",
+                organization_name="Benchmark Org",
+                location="Main Hall, 1 Example Street",
+                start_date=start,
+                end_date=start + timedelta(hours=4),
+                token=ticket_token(ticket_id, event_id),
+            )
+        )
+    return result
+
+
+def report(label: str, count: int, elapsed: float):
+    print(
+        f"{label:>10}: {count / elapsed:8.0f} tickets/s,"
+        f" {elapsed / count * 1e3:.3f} ms per ticket"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=pdf.PDF_WORKERS)
+    args = parser.parse_args()
+
+    docs = documents(args.tickets)
+    version = datetime.now()
+
+    started = time.perf_counter()
+    rendered = [pdf.render_ticket(doc, version) for doc in docs]
+    report("in process", args.tickets, time.perf_counter() - started)
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        # workers are started before timing
+        list(
+            executor.map(
+                pdf.render_ticket, docs[: args.workers], [version] * args.workers
+            )
+        )
+        started = time.perf_counter()
+        list(
+            executor.map(
+                pdf.render_ticket,
+                docs,
+                [version] * len(docs),
+                chunksize=max(1, len(docs) // (args.workers * 8)),
+            )
+        )
+        report(f"{args.workers} workers", args.tickets, time.perf_counter() - started)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf.PDF_CACHE_DIR = directory
+        for doc, content in zip(docs, rendered):
+            pdf.store_ticket(doc.ticket_id, content)
+        started = time.perf_counter()
+        for doc in docs:
+            assert pdf.cached_ticket(doc.ticket_id, version) is not None
+        report("cached", args.tickets, time.perf_counter() - started)
+
+    size = sum(map(len, rendered)) / len(rendered)
+    print(f"average size: {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Cost of the rate limit check on a booking request, which hits three buckets:
+#   python -m benchmarks.ratelimit [--checks 200000] [--clients 10000]
+import argparse
+import asyncio
+import time
+from app.utilities.ratelimit import MemoryStore, RateLimit, check
+
+
+async def run(checks: int, clients: int) -> float:
+    store = MemoryStore()
+    # high enough that every check is allowed and updates its buckets
+    limit = RateLimit(10**9, 60)
+    keys = [
+        [(f"booking:{i}", limit), (f"ip:{i}", limit), (f"event:{i % 100}", limit)]
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for i in range(checks):
+        await check(store, keys[i % clients])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=10_000)
+    args = parser.parse_args()
+
+    elapsed = asyncio.run(run(args.checks, args.clients))
+    print(
+        f"{args.checks} checks of 3 buckets, {args.clients} clients:"
+        f" {elapsed / args.checks * 1e6:.2f} us per request"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Per-request serialization cost of a 10k item list endpoint:
+#   python -m benchmarks.serialization [--items 10000] [--requests 20]
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+from app.models import Event, EventStatus
+from app.schemas import EventResponse
+from app.utilities.responses import model_response
+
+
+def make_events(count: int) -> list[Event]:
+    now = datetime.now()
+    organization_id = uuid.uuid4()
+    return [
+        Event(
+            name=f"Event {i}",
+            description="A description long enough to look like a real one " * 3,
+            status=EventStatus.SCHEDULED,
+            start_date=now + timedelta(days=i),
+            end_date=now + timedelta(days=i, hours=3),
+            location="Cairo",
+            max_tickets=100,
+            organization_id=organization_id,
+        )
+        for i in range(count)
+    ]
+
+
+def make_app(events: list[Event]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get(
+        "/response-model",
+        response_model=list[EventResponse],
+        response_class=JSONResponse,
+    )
+    def response_model_json():
+        return events
+
+    @app.get(
+        "/response-model-orjson",
+        response_model=list[EventResponse],
+        response_class=ORJSONResponse,
+    )
+    def response_model_orjson():
+        return events
+
+    @app.get("/model-response", response_model=list[EventResponse])
+    def fast_path():
+        return model_response(EventResponse, events)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    client = TestClient(make_app(make_events(args.items)))
+    print(f"{args.items} items, median of {args.requests} requests")
+    for path in ("/response-model", "/response-model-orjson", "/model-response"):
+        client.get(path)
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - started)
+        assert len(response.json()) == args.items
+        print(
+            f"{path:<24} {statistics.median(timings) * 1000:8.1f} ms"
+            f"  {len(response.content) / 1024:8.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
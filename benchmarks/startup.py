@@ -0,0 +1,84 @@
+# Cold start cost: time to import app.main and time until the first response,
+# each measured in a fresh interpreter, with and without FAST_START. Timings
+# are noisy on shared machines, so the SQL statements run before the first
+# response and the modules loaded are reported as well.
+#   python -m benchmarks.startup [--runs 5]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import json, sys, time, uuid
+started = time.perf_counter()
+from app.main import api
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.utilities.profiling import count_queries
+with count_queries() as stats:
+    with TestClient(api) as client:
+        status = client.get(f"/reservation/{uuid.uuid4()}").status_code
+responded = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first_response": responded - started,
+    "status": status,
+    "queries": stats.count,
+    "modules": len(sys.modules),
+    "heavy": sorted(m for m in ("fastapi_mail", "segno") if m in sys.modules),
+}))
+"""
+
+
+def run(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # PRODUCTION mode reads any SQLAlchemy URL from POSTGRES_URL, a file
+        # database keeps the numbers about the app rather than the network
+        env = {
+            **os.environ,
+            "MODE": "PRODUCTION",
+            "POSTGRES_URL": f"sqlite:///{directory}/startup.db",
+            "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark"),
+        }
+        subprocess.run(
+            [sys.executable, "-W", "ignore", "-m", "app.database"],
+            env=env,
+            check=True,
+        )
+        print(f"median of {args.runs} cold starts")
+        for fast_start in ("0", "1"):
+            results = [run({**env, "FAST_START": fast_start}) for _ in range(args.runs)]
+            imported = statistics.median(result["import"] for result in results)
+            responded = statistics.median(
+                result["first_response"] for result in results
+            )
+            last = results[-1]
+            print(
+                f"FAST_START={fast_start}  import {imported * 1000:7.1f} ms"
+                f"  first response {responded * 1000:7.1f} ms"
+                f"  statements {last['queries']:3}  modules {last['modules']}"
+                f"  heavy modules loaded: {', '.join(last['heavy']) or 'none'}"
+                f"  (status {last['status']})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+from datetime import datetime, timedelta
+
+# configuration is read when the app is imported; MODE=TEST uses a fresh
+# SQLite database.db in the working directory
+os.environ["MODE"] = "TEST"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("NEXTAUTH_URL", "http://localhost:3000")
+os.environ.setdefault("TEMPLATE_FOLDER", "app/utilities/templates")
+os.environ.setdefault("MAIL_USERNAME", "test")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+os.environ.setdefault("MAIL_FROM", "test@example.com")
+os.environ.setdefault("MAIL_PORT", "25")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+os.environ.setdefault("MAIL_SUPPRESS_SEND", "1")
+for limit in ("RATE_LIMIT_PUBLIC", "RATE_LIMIT_BOOKING", "RATE_LIMIT_EVENT_BOOKING"):
+    os.environ.setdefault(limit, "0")
+
+import pytest
+from fastapi.testclient import TestClient
+from app.database import get_db
+from app.main import api
+from app.models import (
+    Event,
+    EventStatus,
+    Invitation,
+    InvitationStatus,
+    Organization,
+    User,
+    UserOrganizationRole,
+    UserRole,
+)
+from app.utilities.cache import clear_all
+from benchmarks.nextauth import COOKIE_NAME, session_token
+
+pytest_plugins = ["app.utilities.pytest_plugin"]
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(api) as client:
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    # every test starts from cold worker caches
+    clear_all()
+
+
+def session_cookies(email: str, name: str = "Test User") -> dict:
+    return {COOKIE_NAME: session_token(email, name, os.environ["SECRET_KEY"])}
+
+
+def create_organization(
+    owner_email: str, events: int = 0, members: int = 0, invitations: int = 0
+) -> Organization:
+    with get_db() as db:
+        owner = User(name="Owner", email=owner_email, image_url="")
+        db.add(owner)
+        db.flush()
+        organization = Organization(
+            name="Organization", owner=owner.id, contact_email=owner_email
+        )
+        db.add(organization)
+        db.flush()
+        db.add(
+            UserOrganizationRole(
+                user_id=owner.id,
+                organization_id=organization.id,
+                user_role=UserRole.creator,
+            )
+        )
+        for index in range(members):
+            member = User(
+                name=f"Member {index}",
+                email=f"member{index}.{owner_email}",
+                image_url="",
+            )
+            db.add(member)
+            db.flush()
+            db.add(
+                UserOrganizationRole(
+                    user_id=member.id,
+                    organization_id=organization.id,
+                    user_role=UserRole.staff,
+                )
+            )
+        for index in range(invitations):
+            invited = User(
+                name=f"Invited {index}",
+                email=f"invited{index}.{owner_email}",
+                image_url="",
+            )
+            db.add(invited)
+            db.flush()
+            db.add(
+                Invitation(
+                    user_id=invited.id,
+                    organization_id=organization.id,
+                    inviter_id=owner.id,
+                    role=UserRole.staff,
+                    status=InvitationStatus.pending,
+                )
+            )
+        start = datetime.now() + timedelta(days=7)
+        for index in range(events):
+            db.add(
+                Event(
+                    name=f"Event {index}",
+                    organization_id=organization.id,
+                    start_date=start,
+                    end_date=start + timedelta(hours=2),
+                    status=EventStatus.SCHEDULED,
+                )
+            )
+        db.commit()
+        db.refresh(organization)
+        return organization
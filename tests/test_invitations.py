@@ -0,0 +1,31 @@
+from app.database import get_db
+from app.models import User
+from tests.conftest import create_organization, session_cookies
+
+
+def test_bulk_invitations_match_emails_whatever_the_case(client):
+    email = "bulk@example.com"
+    organization = create_organization(email, members=1, invitations=1)
+    with get_db() as db:
+        db.add(User(name="Fresh", email="Fresh.Person@example.com", image_url=""))
+        db.commit()
+
+    response = client.post(
+        f"/invitations/organizations/{organization.id}/bulk",
+        json={
+            "emails": [
+                "fresh.person@example.com",
+                "MEMBER0.bulk@example.com",
+                "invited0.bulk@example.com",
+                "Nobody@example.com",
+            ]
+        },
+        cookies=session_cookies(email),
+    )
+    assert response.status_code == 201
+    assert response.json() == {
+        "invited": ["Fresh.Person@example.com"],
+        "already_members": ["member0.bulk@example.com"],
+        "already_invited": ["invited0.bulk@example.com"],
+        "not_found": ["Nobody@example.com"],
+    }
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+from sqlmodel import select
+from app.database import get_db
+from app.models import Event, EventStatus
+from tests.conftest import create_organization
+
+
+def test_started_events_are_not_open_before_the_lifecycle_job(client):
+    organization = create_organization("lifecycle@example.com", events=2)
+    with get_db() as db:
+        started, upcoming = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).all()
+        # still SCHEDULED, the lifecycle job has not run
+        started.name = upcoming.name = "Lagging lifecycle"
+        started.start_date = datetime.now() - timedelta(hours=1)
+        db.add_all([started, upcoming])
+        db.commit()
+        assert started.status == EventStatus.SCHEDULED
+        started_id, upcoming_id = started.id, upcoming.id
+
+    assert client.get(f"/reservation/{started_id}").status_code == 404
+    assert client.get(f"/reservation/{upcoming_id}").status_code == 200
+
+    found = client.get("/events/search", params={"q": "Lagging lifecycle"}).json()
+    assert [item["id"] for item in found["items"]] == [str(upcoming_id)]
+    found = client.get(
+        "/events/search", params={"q": "Lagging lifecycle", "upcoming": "false"}
+    ).json()
+    assert len(found["items"]) == 2
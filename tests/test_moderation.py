@@ -0,0 +1,93 @@
+from sqlmodel import select
+from app.database import get_db
+from app.models import Event, Ticket, TicketStatus
+from tests.conftest import create_organization, session_cookies
+
+
+def test_reinstating_declined_tickets_claims_seats(client):
+    email = "moderation@example.com"
+    organization = create_organization(email, events=1)
+    cookies = session_cookies(email)
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).one()
+        event.max_tickets = 1
+        event.tickets_booked = 1
+        accepted = Ticket(
+            event_id=event.id,
+            owner_email="accepted@example.com",
+            owner_name="Accepted",
+            status=TicketStatus.accepted,
+        )
+        declined = Ticket(
+            event_id=event.id,
+            owner_email="declined@example.com",
+            owner_name="Declined",
+            status=TicketStatus.declined,
+        )
+        db.add_all([event, accepted, declined])
+        db.commit()
+        event_id, declined_id = event.id, declined.id
+
+    reinstate = {"status": "accepted", "ticket_ids": [str(declined_id)]}
+    response = client.patch(
+        f"/events/{event_id}/tickets", json=reinstate, cookies=cookies
+    )
+    assert response.status_code == 409
+    with get_db() as db:
+        assert db.get(Event, event_id).tickets_booked == 1
+        assert db.get(Ticket, declined_id).status == TicketStatus.declined
+
+        event = db.get(Event, event_id)
+        event.max_tickets = 2
+        db.commit()
+    response = client.patch(
+        f"/events/{event_id}/tickets", json=reinstate, cookies=cookies
+    )
+    assert response.status_code == 200
+    assert response.json() == {"updated": 1}
+    with get_db() as db:
+        assert db.get(Event, event_id).tickets_booked == 2
+
+
+def test_moderation_adjusts_seats_by_the_tickets_it_changed(client):
+    email = "declining@example.com"
+    organization = create_organization(email, events=1)
+    cookies = session_cookies(email)
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).one()
+        # a third seat reserved by a booking that has not committed its ticket
+        event.tickets_booked = 3
+        tickets = [
+            Ticket(
+                event_id=event.id,
+                owner_email=f"attendee{index}@example.com",
+                owner_name=f"Attendee {index}",
+                status=status,
+            )
+            for index, status in enumerate(
+                [TicketStatus.accepted, TicketStatus.pending]
+            )
+        ]
+        db.add_all([event, *tickets])
+        db.commit()
+        event_id = event.id
+        accepted_id, pending_id = (ticket.id for ticket in tickets)
+
+    response = client.patch(
+        f"/events/{event_id}/tickets",
+        json={"status": "accepted", "ticket_ids": [str(pending_id)]},
+        cookies=cookies,
+    )
+    assert response.json() == {"updated": 1}
+    response = client.patch(
+        f"/events/{event_id}/tickets",
+        json={"status": "declined", "ticket_ids": [str(accepted_id)]},
+        cookies=cookies,
+    )
+    assert response.json() == {"updated": 1}
+    with get_db() as db:
+        assert db.get(Event, event_id).tickets_booked == 2
@@ -0,0 +1,74 @@
+import pytest
+from sqlmodel import select
+from app.database import get_db
+from app.models import Event
+from tests.conftest import create_organization, session_cookies
+
+
+def first_event(organization_id):
+    with get_db() as db:
+        return db.exec(
+            select(Event).where(Event.organization_id == organization_id)
+        ).first()
+
+
+def test_event_by_id(client, query_budget):
+    organization = create_organization("event-by-id@example.com", events=1)
+    event = first_event(organization.id)
+
+    # the event and its organization's name
+    with query_budget(2):
+        response = client.get("/events/event", params={"event_id": str(event.id)})
+    assert response.status_code == 200
+    assert response.json()["organization_name"] == organization.name
+
+    with query_budget(0):
+        client.get("/events/event", params={"event_id": str(event.id)})
+
+
+def test_organization(client, query_budget):
+    organization = create_organization("organization@example.com")
+    cookies = session_cookies("organization@example.com")
+
+    # the user, their role and the organization
+    with query_budget(3):
+        response = client.get(f"/organizations/{organization.id}", cookies=cookies)
+    assert response.status_code == 200
+    assert response.json()["id"] == str(organization.id)
+
+
+@pytest.mark.parametrize("rows", [2, 20])
+def test_organization_includes(client, query_budget, rows):
+    email = f"includes{rows}@example.com"
+    organization = create_organization(
+        email, events=rows, members=rows, invitations=rows
+    )
+    cookies = session_cookies(email)
+
+    # the same however many events and members come back
+    with query_budget(9):
+        response = client.get(
+            f"/organizations/{organization.id}",
+            params={"include": "events,members,invitations"},
+            cookies=cookies,
+        )
+    assert response.status_code == 200
+    assert len(response.json()["events"]) == rows
+    assert len(response.json()["members"]) == rows + 1
+    assert len(response.json()["invitations"]) == rows
+
+
+@pytest.mark.parametrize("rows", [2, 20])
+def test_organization_events(client, query_budget, rows):
+    email = f"events{rows}@example.com"
+    organization = create_organization(email, events=rows)
+    cookies = session_cookies(email)
+
+    with query_budget(4):
+        response = client.get(
+            "/events/",
+            params={"org_id": str(organization.id), "include": "organization"},
+            cookies=cookies,
+        )
+    assert response.status_code == 200
+    assert len(response.json()) == rows
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from app.utilities.ratelimit import (
+    MemoryStore,
+    RateLimitStore,
+    check,
+    parse_rate_limit,
+)
+
+
+def test_store_without_hit_cannot_be_built():
+    class IncompleteStore(RateLimitStore):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteStore()
+
+
+def test_memory_store_rejects_over_the_limit():
+    store = MemoryStore()
+    limit = parse_rate_limit("2/minute")
+
+    async def hits():
+        return [(await store.hit([("client", limit)]))[0] for _ in range(3)]
+
+    decisions = asyncio.run(hits())
+    assert [decision.allowed for decision in decisions] == [True, True, False]
+    assert decisions[-1].retry_after > 0
+
+
+def test_rejected_requests_take_nothing_from_other_buckets():
+    store = MemoryStore()
+    public = ("ip:client", parse_rate_limit("2/minute"))
+    booking = ("booking:client", parse_rate_limit("1/minute"))
+
+    async def requests():
+        return [
+            await check(store, [public, booking]),
+            await check(store, [public, booking]),
+            await check(store, [public]),
+        ]
+
+    first, rejected, public_only = asyncio.run(requests())
+    assert first.allowed and first.remaining == 0
+    assert not rejected.allowed and rejected.limit == 1
+    # the rejected booking did not use up the second public request
+    assert public_only.allowed
@@ -0,0 +1,85 @@
+import asyncio
+from aiosmtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from sqlmodel import Session, select
+from app.database import engine, get_db
+from app.models import Event, ReminderCheckpoint, Ticket, TicketStatus
+from app.utilities.mail import EmailSender
+from app.utilities.reminders import send_event_reminders
+from tests.conftest import create_organization
+
+
+class FakeSession:
+    # answers send_message with the given outcomes in order, then succeeds
+    def __init__(self, outcomes=()):
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    async def send_message(self, message):
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if outcome is not None:
+            raise outcome
+        self.sent.append(message["To"])
+
+
+class FakeConnection:
+    def __init__(self, outcomes=()):
+        self.session = FakeSession(outcomes)
+
+
+def send(connection: FakeConnection, event) -> int:
+    sender = EmailSender()
+    sender.conf.SUPPRESS_SEND = 0
+    with Session(engine) as db:
+        return asyncio.run(send_event_reminders(db, sender, connection, event, 1440))
+
+
+def test_lost_connection_keeps_unsent_tickets(client):
+    organization = create_organization("reminders@example.com", events=1)
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).one()
+        tickets = [
+            Ticket(
+                event_id=event.id,
+                owner_email=f"attendee{index}@example.com",
+                owner_name=f"Attendee {index}",
+                status=TicketStatus.accepted,
+            )
+            for index in range(4)
+        ]
+        db.add_all(tickets)
+        db.commit()
+        row = (event.id, event.name, event.location, event.start_date)
+        ordered = sorted(tickets, key=lambda ticket: ticket.id)
+        emails = [ticket.owner_email for ticket in ordered]
+        ids = [ticket.id for ticket in ordered]
+
+    # the second recipient is refused, the connection drops on the third
+    connection = FakeConnection(
+        [None, SMTPRecipientsRefused([]), SMTPServerDisconnected("gone")]
+    )
+    try:
+        send(connection, row)
+    except SMTPServerDisconnected:
+        pass
+    else:
+        raise AssertionError("the lost connection was swallowed")
+    assert connection.session.sent == emails[:1]
+    with get_db() as db:
+        checkpoint = db.exec(
+            select(ReminderCheckpoint).where(ReminderCheckpoint.event_id == row[0])
+        ).one()
+        assert checkpoint.last_ticket_id == ids[1]
+        assert checkpoint.sent == 1
+        assert checkpoint.completed_at is None
+
+    connection = FakeConnection()
+    assert send(connection, row) == 2
+    assert connection.session.sent == emails[2:]
+    with get_db() as db:
+        checkpoint = db.exec(
+            select(ReminderCheckpoint).where(ReminderCheckpoint.event_id == row[0])
+        ).one()
+        assert checkpoint.sent == 3
+        assert checkpoint.completed_at is not None
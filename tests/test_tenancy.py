@@ -0,0 +1,69 @@
+from sqlalchemy import update
+from sqlmodel import Session, select
+from app.database import engine, get_db
+from app.models import Event, Ticket, TicketStatus, UserOrganizationRole
+from app.utilities.tenancy import backfill_tenants, set_tenant
+from tests.conftest import create_organization
+
+
+def create_tenant(email: str):
+    organization = create_organization(email, events=1)
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).one()
+        ticket = Ticket(
+            event_id=event.id,
+            owner_email=f"attendee.{email}",
+            owner_name="Attendee",
+            status=TicketStatus.accepted,
+        )
+        db.add(ticket)
+        db.commit()
+        return organization.id, event.id, ticket.id
+
+
+def test_sessions_only_see_their_tenant(client):
+    organization_a, event_a, ticket_a = create_tenant("tenant-a@example.com")
+    organization_b, event_b, ticket_b = create_tenant("tenant-b@example.com")
+
+    with Session(engine) as db:
+        set_tenant(db, organization_a)
+        events = db.exec(select(Event.id)).all()
+        tickets = db.exec(select(Ticket.id)).all()
+        roles = db.exec(select(UserOrganizationRole.organization_id)).all()
+        assert event_a in events and event_b not in events
+        assert ticket_a in tickets and ticket_b not in tickets
+        assert set(roles) == {organization_a}
+        assert db.get(Event, event_b) is None
+        assert db.get(Ticket, ticket_b) is None
+        # explicitly unscoped queries still see every tenant
+        every_event = db.exec(
+            select(Event.id).execution_options(all_tenants=True)
+        ).all()
+        assert event_b in every_event
+
+
+def test_new_rows_get_their_tenant(client):
+    organization_id, event_id, ticket_id = create_tenant("filled@example.com")
+    with get_db() as db:
+        assert db.get(Event, event_id).tenant_id == str(organization_id)
+        # event scoped rows take the tenant of their event
+        assert db.get(Ticket, ticket_id).tenant_id == str(organization_id)
+
+
+def test_backfill_fills_existing_rows(client):
+    organization_id, event_id, ticket_id = create_tenant("backfill@example.com")
+    with get_db() as db:
+        for model, row_id in ((Event, event_id), (Ticket, ticket_id)):
+            db.execute(
+                update(model).where(model.id == row_id).values(tenant_id=None),
+                execution_options={"synchronize_session": False},
+            )
+        db.commit()
+        assert db.get(Ticket, ticket_id).tenant_id is None
+
+    backfill_tenants(engine)
+    with get_db() as db:
+        assert db.get(Event, event_id).tenant_id == str(organization_id)
+        assert db.get(Ticket, ticket_id).tenant_id == str(organization_id)
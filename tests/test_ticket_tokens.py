@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlmodel import select
+from app.database import get_db
+from app.models import Event, Ticket, TicketStatus
+from app.utilities import tokens
+from app.utilities.tokens import (
+    SIGNING_KEYS,
+    cancel_token,
+    ticket_token,
+    verify_cancel_token,
+    verify_pdf_token,
+)
+from tests.conftest import create_organization, session_cookies
+
+
+def create_ticket(organization_id, end_date: datetime) -> Ticket:
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization_id)
+        ).one()
+        event.start_date = end_date - timedelta(hours=2)
+        event.end_date = end_date
+        ticket = Ticket(
+            event_id=event.id,
+            owner_email="holder@example.com",
+            owner_name="Holder",
+            status=TicketStatus.accepted,
+        )
+        db.add_all([event, ticket])
+        db.commit()
+        db.refresh(ticket)
+        return ticket
+
+
+def test_check_in_uses_the_current_end_date(client):
+    email = "tokens@example.com"
+    organization = create_organization(email, events=1)
+    cookies = session_cookies(email)
+    ticket = create_ticket(organization.id, datetime.now() - timedelta(minutes=5))
+    token = ticket_token(ticket.id, ticket.event_id)
+    url = f"/events/{ticket.event_id}/checkin"
+
+    response = client.post(url, json={"token": token}, cookies=cookies)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ticket has expired"
+
+    # the event runs longer than planned, the ticket sent earlier still works
+    response = client.put(
+        f"/events/{ticket.event_id}",
+        json={
+            "orgId": str(organization.id),
+            "name": "Extended",
+            "start_date": (datetime.now() - timedelta(hours=1)).isoformat(),
+            "end_date": (datetime.now() + timedelta(hours=1)).isoformat(),
+            "max_tickets": 0,
+            "status": "ONGOING",
+        },
+        cookies=cookies,
+    )
+    assert response.status_code == 200
+    assert client.get("/tickets/verify", params={"token": token}).status_code == 200
+    response = client.post(url, json={"token": token}, cookies=cookies)
+    assert response.status_code == 200
+
+
+def test_links_verify_with_every_key_of_the_ring(monkeypatch):
+    ticket_id = uuid4()
+    old_link = cancel_token(ticket_id)
+
+    monkeypatch.setattr(tokens, "SIGNING_KEYS", {7: b"rotated", **SIGNING_KEYS})
+    monkeypatch.setattr(tokens, "ACTIVE_KID", 7)
+    new_link = cancel_token(ticket_id)
+    assert new_link != old_link
+    assert verify_cancel_token(ticket_id, old_link)
+    assert verify_cancel_token(ticket_id, new_link)
+    assert not verify_pdf_token(ticket_id, new_link)
+
+    monkeypatch.setattr(tokens, "SIGNING_KEYS", {7: b"rotated"})
+    assert not verify_cancel_token(ticket_id, old_link)
+    assert verify_cancel_token(ticket_id, new_link)
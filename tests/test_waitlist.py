@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from sqlmodel import select
+from app.database import get_db
+from app.models import Event, Ticket, TicketStatus, WaitlistEntry, WaitlistStatus
+from app.utilities import waitlist
+from app.utilities.tokens import cancel_token
+from tests.conftest import create_organization, session_cookies
+
+
+def waiting(event_id) -> list[str]:
+    with get_db() as db:
+        return db.exec(
+            select(WaitlistEntry.email)
+            .where(WaitlistEntry.event_id == event_id)
+            .where(WaitlistEntry.status == WaitlistStatus.waiting)
+            .order_by(WaitlistEntry.created_at)
+        ).all()
+
+
+def accepted(event_id) -> set[str]:
+    with get_db() as db:
+        return set(
+            db.exec(
+                select(Ticket.owner_email)
+                .where(Ticket.event_id == event_id)
+                .where(Ticket.status == TicketStatus.accepted)
+            ).all()
+        )
+
+
+def test_freed_seats_promote_the_head_of_the_waitlist(client, monkeypatch):
+    email = "waitlist@example.com"
+    organization = create_organization(email, events=1)
+    with get_db() as db:
+        event = db.exec(
+            select(Event).where(Event.organization_id == organization.id)
+        ).one()
+        event.max_tickets = 2
+        db.add(event)
+        db.commit()
+        event_id = event.id
+    url = f"/reservation/{event_id}"
+
+    tickets = [
+        client.post(url, json={"name": name, "email": f"{name}@example.com"}).json()
+        for name in ("first", "second")
+    ]
+    response = client.post(url, json={"name": "late", "email": "late@example.com"})
+    assert response.status_code == 400
+    for name in ("w1", "w2", "w3"):
+        response = client.post(
+            f"{url}/waitlist", json={"name": name, "email": f"{name}@example.com"}
+        )
+        assert response.status_code == 201
+    with get_db() as db:
+        # queued before anyone else, but already holds a ticket
+        db.add(
+            WaitlistEntry(
+                event_id=event_id,
+                email="second@example.com",
+                name="second",
+                status=WaitlistStatus.waiting,
+                created_at=datetime.now() - timedelta(hours=1),
+            )
+        )
+        db.commit()
+
+    # a cancellation frees one seat: the booked entry is skipped, w1 promoted
+    first_id = tickets[0]["id"]
+    response = client.post(
+        f"/reservation/tickets/{first_id}/cancel",
+        params={"token": cancel_token(first_id)},
+    )
+    assert response.status_code == 204
+    assert waiting(event_id) == ["w2@example.com", "w3@example.com"]
+    assert accepted(event_id) == {"second@example.com", "w1@example.com"}
+
+    # a decline frees one seat for w2
+    response = client.patch(
+        f"/events/{event_id}/tickets",
+        json={"status": "declined", "ticket_ids": [tickets[1]["id"]]},
+        cookies=session_cookies(email),
+    )
+    assert response.status_code == 200
+    assert waiting(event_id) == ["w3@example.com"]
+    assert accepted(event_id) == {"w1@example.com", "w2@example.com"}
+    with get_db() as db:
+        assert db.get(Event, event_id).tickets_booked == 2
+
+    # seats claimed by someone else in the meantime stop the promotion
+    monkeypatch.setattr(waitlist, "reserve_seats", lambda *args: False)
+    with get_db() as db:
+        event = db.get(Event, event_id)
+        event.max_tickets = 3
+        db.add(event)
+        db.commit()
+        assert waitlist.promote_and_notify(db, event, None) == 0
+    assert waiting(event_id) == ["w3@example.com"]
+    assert accepted(event_id) == {"w1@example.com", "w2@example.com"}
@@ -0,0 +1,158 @@
+import asyncio
+from uuid import UUID, uuid4
+import httpx
+import pytest
+from sqlmodel import select
+from app.database import engine, get_db
+from app.models import Webhook, WebhookDelivery, WebhookEvent
+from app.utilities import webhooks
+from app.utilities.webhooks import WebhookDispatcher, enqueue
+from tests.conftest import create_organization, session_cookies
+
+PRIVATE_URLS = [
+    "http://127.0.0.1:8001/",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:192.168.1.1]/hook",
+]
+
+
+def register(client, email: str, url: str):
+    organization = create_organization(email)
+    response = client.post(
+        f"/webhooks/organizations/{organization.id}",
+        json={"url": url, "events": ["ticket.booked"]},
+        cookies=session_cookies(email),
+    )
+    return organization, response
+
+
+def dispatch(organization_id, handler) -> tuple[list, WebhookDelivery]:
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    with get_db() as db:
+        enqueue(db, organization_id, WebhookEvent.ticket_booked, [{"id": 1}])
+        db.commit()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    asyncio.run(WebhookDispatcher(engine, client).dispatch())
+    with get_db() as db:
+        delivery = db.exec(
+            select(WebhookDelivery).where(
+                WebhookDelivery.organization_id == organization_id
+            )
+        ).one()
+    return requests, delivery
+
+
+@pytest.mark.parametrize("url", PRIVATE_URLS)
+def test_private_urls_are_refused(client, url):
+    email = f"private{PRIVATE_URLS.index(url)}@example.com"
+    _, response = register(client, email, url)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Webhook host is not a public address"
+
+
+def test_addresses_are_checked_again_before_sending(client, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOW_PRIVATE_URLS", True)
+    organization, response = register(
+        client, "rebound@example.com", "http://10.0.0.5/hook"
+    )
+    assert response.status_code == 201
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOW_PRIVATE_URLS", False)
+
+    requests, delivery = dispatch(organization.id, lambda _: httpx.Response(204))
+    assert requests == []
+    assert delivery.last_error == "Webhook host is not a public address"
+
+
+def test_requests_go_to_the_checked_address(client):
+    organization, response = register(
+        client, "public@example.com", "http://93.184.216.34:8080/hook"
+    )
+    assert response.status_code == 201
+
+    requests, delivery = dispatch(organization.id, lambda _: httpx.Response(204))
+    assert len(requests) == 1
+    assert requests[0].url.host == "93.184.216.34"
+    assert requests[0].headers["Host"] == "93.184.216.34:8080"
+    assert delivery.delivered_at is not None
+
+
+def test_errors_are_stored_as_categories(client):
+    organization, _ = register(
+        client, "unreachable@example.com", "http://93.184.216.34/hook"
+    )
+
+    def refuse(request):
+        raise httpx.ConnectError("connect to 10.1.2.3 refused", request=request)
+
+    _, delivery = dispatch(organization.id, refuse)
+    assert delivery.last_error == "Connection failed"
+    assert delivery.delivered_at is None
+
+
+def test_events_match_whole_values(client):
+    organization, _ = register(
+        client, "matching@example.com", "http://93.184.216.34/hook"
+    )
+    with get_db() as db:
+        webhook = db.exec(
+            select(Webhook).where(Webhook.organization_id == organization.id)
+        ).one()
+        # a value that only contains the event type
+        webhook.events = "event.updated,ticket.booked.v2"
+        db.add(webhook)
+        db.commit()
+        assert enqueue(db, organization.id, WebhookEvent.ticket_booked, [{}]) == 0
+        assert enqueue(db, organization.id, WebhookEvent.event_updated, [{}]) == 1
+        db.rollback()
+
+
+def test_failing_webhooks_are_turned_off(client, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_MAX_ATTEMPTS", 2)
+    email = "failing@example.com"
+    organization, response = register(client, email, "http://93.184.216.34/hook")
+    webhook_id = response.json()["id"]
+    failing = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda _: httpx.Response(503))
+    )
+
+    for _ in range(2):
+        with get_db() as db:
+            enqueue(db, organization.id, WebhookEvent.ticket_booked, [{}])
+            db.commit()
+        asyncio.run(WebhookDispatcher(engine, failing).dispatch())
+    cookies = session_cookies(email)
+    listed = client.get(f"/webhooks/organizations/{organization.id}", cookies=cookies)
+    assert listed.json()[0]["active"] is False
+    with get_db() as db:
+        assert enqueue(db, organization.id, WebhookEvent.ticket_booked, [{}]) == 0
+
+    response = client.patch(
+        f"/webhooks/{webhook_id}",
+        json={"active": True, "events": ["event.updated", "ticket.booked"]},
+        cookies=cookies,
+    )
+    assert response.status_code == 200
+    assert response.json()["active"] is True
+    assert response.json()["events"] == ["event.updated", "ticket.booked"]
+    with get_db() as db:
+        assert db.get(Webhook, UUID(webhook_id)).failures == 0
+
+
+def test_other_organizations_cannot_tell_which_webhooks_exist(client):
+    _, response = register(client, "owner.hooks@example.com", "http://93.184.216.34/")
+    webhook_id = response.json()["id"]
+    create_organization("outsider@example.com")
+    cookies = session_cookies("outsider@example.com")
+
+    for existing in (webhook_id, str(uuid4())):
+        response = client.get(f"/webhooks/{existing}/deliveries", cookies=cookies)
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Webhook not found"